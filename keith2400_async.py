@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+keith2400_async drives Keithley 2400s from an asyncio event loop.
+
+AsyncKeithley2400 wraps a keith2400_logic.Keithley2400 and offers the same
+setters as coroutines.  Each bus transaction runs in the default executor,
+and waits between them (the sweep itself, buffer polls) are spent in
+asyncio.sleep, so a thread is only held while the bus is actually in use
+rather than for the whole run.  Calls on one instrument are serialized by a
+lock, so several coroutines may share it; separate instruments run
+concurrently:
+
+    insts = [AsyncKeithley2400(x) for x in (21, 22, 23)]
+    await asyncio.gather(*(x.start() for x in insts))
+
+classes_
+    AsyncKeithley2400(opt int/Keithley2400)
+
+methods_
+    make_async(str)
+
+@author: Sarh Friedensen
+"""
+
+import asyncio
+import functools
+import time
+from typing import Callable, Optional, Union
+import keith2400_logic as k
+
+
+class AsyncKeithley2400:
+    """Coroutine interface to one Keithley 2400."""
+
+    def __init__(self, address: Optional[Union[int, k.Keithley2400]] = 25):
+        if isinstance(address, k.Keithley2400):
+            self.instrument = address
+        else:
+            self.instrument = k.Keithley2400(address)
+        self.lock = asyncio.Lock()
+
+    def __getattr__(self, name: str):
+        return getattr(self.instrument, name)
+
+    def __setattr__(self, name: str, value):
+        if name != 'instrument' and (
+                name in vars(self.instrument) or isinstance(
+                    getattr(k.Keithley2400, name, None), property)):
+            setattr(self.instrument, name, value)
+        else:
+            super().__setattr__(name, value)
+
+    async def call(self, name: str, *args, **kwargs):
+        """Run a Keithley2400 method in the executor, one call at a time."""
+        method = getattr(self.instrument, name)
+        async with self.lock:
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def transaction(self, func: Callable):
+        """Run func(instrument) inside one transaction in the executor."""
+        def run():
+            with self.instrument.transaction():
+                return func(self.instrument)
+        async with self.lock:
+            return await asyncio.to_thread(run)
+
+    async def query(self, message: str):
+        """Send a query straight to the instrument and return the reply."""
+        def run():
+            with self.instrument.bus:
+                return self.instrument.get_instrument().query(message)
+        async with self.lock:
+            return await asyncio.to_thread(run)
+
+    async def points(self):
+        """Return the number of readings stored in the buffer so far."""
+        return int(float(await self.query(':TRAC:POIN:ACT?')))
+
+    async def stream(self, interval: float = 0.1, cdl: bool = False,
+                     timeout: Optional[float] = None):
+        """Start the measurement and yield new readings as they are stored.
+
+        Works like Keithley2400.stream(), polling with the same
+        poll_stream(), but the wait between polls is handed back to the event
+        loop.  Ends early if stop() is called; data then holds the readings
+        taken before the abort.
+        """
+        self.instrument.waiting = True
+        cols = None
+        fetched = False
+        try:
+            cols = await self.call('arm', False)
+            if cols is None:
+                return
+            state = k.StreamState(cols, ', ' if cdl else '\t',
+                                  heard=time.monotonic())
+            while not self.instrument.stopping.is_set():
+                await asyncio.sleep(interval)
+                (state, chunk, ended) = await self.call('poll_stream', state,
+                                                        timeout)
+                if chunk is not None:
+                    yield chunk
+                if ended:
+                    break
+            await self.call('fetch_data', cols, cdl)
+            fetched = True
+        finally:
+            self.instrument.waiting = False
+            if cols is not None and not fetched:
+                await self.call('output_off')
+
+    async def start(self, prnt: bool = False, cdl: bool = False,
+                    callback: Optional[Callable] = None,
+                    interval: float = 0.1):
+        """Take a measurement without blocking the event loop and save it.
+
+        callback may be a function or a coroutine function; it is called
+        with each new chunk of Readings.  Returns the data.
+        """
+        self.instrument.data = None
+        async for chunk in self.stream(interval, cdl):
+            if callback is not None:
+                reply = callback(chunk)
+                if asyncio.iscoroutine(reply):
+                    await reply
+        if self.instrument.data is None:
+            return None
+        await self.call('save_as', self.instrument.filename)
+        await self.call('save_data', self.instrument.data, False)
+        if prnt:
+            print(self.instrument.data.to_text())
+        return self.instrument.data
+
+    async def stop(self):
+        """Abort the measurement; a running start() then keeps what it has.
+        """
+        await self.call('stop')
+
+
+def make_async(name: str):
+    """Make a coroutine method that runs a Keithley2400 method."""
+    method = getattr(k.Keithley2400, name)
+
+    @functools.wraps(method)
+    async def call(self, *args, **kwargs):
+        return await self.call(name, *args, **kwargs)
+    return call
+
+
+for _name in ('set_gpib', 'check_connected', 'set_output_type',
+              'set_output_range', 'set_output_autorange', 'set_output_val',
+              'set_measure_type', 'set_compliance', 'set_measure_range',
+              'set_measure_autorange', 'set_delay', 'set_ohm_meas_type',
+              'set_measure_speed', 'set_num_points', 'set_sweep_output',
+              'set_sweep_type', 'set_sweep_range', 'set_sweep_start',
+              'set_sweep_stop', 'set_sweep_points', 'set_sweep_list',
+              'set_sweep', 'set_format', 'set_all_to_globals', 'clear_data',
+              'read_buffer', 'fetch_data'):
+    setattr(AsyncKeithley2400, _name, make_async(_name))
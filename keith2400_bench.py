@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+keith2400_bench times the hot paths of keith2400_logic and saves the results.
+
+Configuration, acquisition and post-processing are run against the simulated
+2400 from keith2400_sim, or against hardware with --backend visa.  Each
+benchmark reports wall time, the time the modeled instrument and bus would
+have taken (left blank for benchmarks that do not use the instrument), bus
+traffic, and memory allocated while it ran.  Files are saved in a temporary
+directory removed afterwards.  Results are written as JSON so runs on
+different commits can be compared:
+
+    python keith2400_bench.py --output new.json --compare old.json
+
+methods_
+    seed(opt int)
+    configure(opt int, opt str, opt str)
+    measure(callable, opt callable, opt int, opt bool)
+    run_benchmarks(opt int, opt tuple)
+    benchmarks(int, tuple, str)
+    compare(dict, dict, opt float)
+    main(opt list)
+
+@author: Sarh Friedensen
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from typing import Callable, Optional
+import keith2400_logic as k
+
+sizes = (100, 1000, 2500)
+
+
+def seed(points: int = 100):
+    """Set the settings to a fixed IV setup without sending it."""
+    inst = k.instrument
+    inst.out_type = 'VOLT'
+    inst.meas_type = 'CURR'
+    inst.out_val['VOLT'] = 0.5
+    inst.out_rng['VOLT'] = 2
+    inst.compl['VOLT'] = 30e-3
+    inst.meas_rng['CURR'] = 0.1
+    inst.meas_speed['CURR'] = 0.01
+    inst.delay = 0.0
+    inst.num_points = points
+    inst.sweep_params.update({'Enabled': False, 'Type': None,
+                              'Output': None, 'Ranging': None,
+                              'Start': None, 'Stop': None, 'Points': None,
+                              'List': None})
+
+
+def configure(points: int = 100, data_fmt: str = 'ascii',
+              filename: Optional[str] = None):
+    """Send the fixed IV setup to the instrument, saving to filename.
+
+    The settings are seeded again afterwards, since the setters leave the
+    instrument's replies in them.
+    """
+    seed(points)
+    k.set_all_to_globals()
+    k.set_format(data_fmt)
+    seed(points)
+    k.instrument.filename = filename
+
+
+def instrument_time():
+    """Return the simulated instrument clock, or 0 on real hardware."""
+    now = getattr(k.keith, 'now', None)
+    return now() if now is not None else 0.0
+
+
+def bus_stats():
+    """Return the simulated bus counters, or an empty dict."""
+    return dict(getattr(k.keith, 'stats', {}))
+
+
+def measure(func: Callable, setup: Optional[Callable] = None,
+            repeat: int = 5, instrument: bool = True):
+    """Time func over repeat runs, then trace its allocations once.
+
+    setup is called before every run and is not timed.  If instrument is
+    False, func does not use the instrument and no modeled time is given.
+    """
+    walls = []
+    modeled = []
+    traffic = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            before = bus_stats()
+            start_model = instrument_time()
+            start_wall = time.perf_counter()
+            func()
+            walls.append(time.perf_counter() - start_wall)
+            modeled.append(instrument_time() - start_model)
+            traffic = {x: y - before.get(x, 0)
+                       for x, y in bus_stats().items()}
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        func()
+        (current, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {'wall_min': min(walls),
+            'wall_median': statistics.median(walls),
+            'modeled_median': (statistics.median(modeled) if instrument
+                               else None),
+            'alloc_peak_bytes': peak,
+            'alloc_net_bytes': current,
+            'bus': traffic,
+            'repeat': repeat}
+
+
+def run_benchmarks(repeat: int = 5, points: tuple = sizes):
+    """Run every benchmark and return a dict of results by name."""
+    with tempfile.TemporaryDirectory(prefix='keith2400_bench_') as workdir:
+        return benchmarks(repeat, points, os.path.join(workdir, 'bench.txt'))
+
+
+def benchmarks(repeat: int, points: tuple, filename: str):
+    """Run every benchmark, saving data to filename."""
+    results = {}
+
+    def cold():
+        seed()
+        k.invalidate_shadow()
+
+    results['set_all_to_globals_cold'] = measure(
+        k.set_all_to_globals, cold, repeat)
+    results['set_all_to_globals_warm'] = measure(
+        k.set_all_to_globals, lambda: configure(filename=filename), repeat)
+
+    def sweep_setup():
+        configure(filename=filename)
+        k.sweep_params.update({'Enabled': True, 'Output': 'VOLT',
+                               'Type': 'LIN', 'Ranging': 'BEST',
+                               'Start': 0.0, 'Stop': 1.0, 'Points': 100})
+
+    results['set_sweep_useparams'] = measure(
+        lambda: k.set_sweep(useparams=True), sweep_setup, repeat)
+
+    for fmt in ('ascii', 'sreal', 'real'):
+        for num in points:
+            def start_setup(num=num, fmt=fmt):
+                k.clear_data()
+                configure(num, fmt, filename)
+            results[f'start_{fmt}_{num}'] = measure(
+                k.start, start_setup, repeat)
+
+    rows = max(points)
+    cols = 3
+    flat = np.random.default_rng(0).normal(size=rows * cols)
+    text = ','.join(f'{x:+.6E}' for x in flat)
+    big = np.random.default_rng(1).normal(size=100 * rows * cols)
+    results[f'process_data_ascii_{rows}'] = measure(
+        lambda: k.process_data(text, cols), repeat=repeat, instrument=False)
+    results[f'process_data_binary_{rows}'] = measure(
+        lambda: k.process_data(flat, cols), repeat=repeat, instrument=False)
+    results[f'process_data_binary_{100 * rows}'] = measure(
+        lambda: k.process_data(big, cols), repeat=repeat, instrument=False)
+    for num in (rows, 100 * rows):
+        readings = k.process_data(big[:num * cols], cols)
+
+        def save(readings=readings):
+            k.instrument.filename = filename
+            k.save_data(readings, False)
+        results[f'save_data_{num}'] = measure(save, repeat=repeat,
+                                              instrument=False)
+
+    choices = ['two*', '2*', 'four*', '4*', 'six*', '6*']
+    words = ['Six-wire', 'four', '2', 'volt', 'resistance'] * 200
+    results['match_1000'] = measure(
+        lambda: [k.match(x, y) for x in choices[:1] for y in words],
+        repeat=repeat, instrument=False)
+    results['test_inclusion_1000'] = measure(
+        lambda: [k.test_inclusion(x, choices) for x in words], repeat=repeat,
+        instrument=False)
+    return results
+
+
+def compare(old: dict, new: dict, threshold: float = 0.2):
+    """Return the benchmarks whose median wall time grew by over threshold."""
+    slower = {}
+    for name, result in new['results'].items():
+        base = old['results'].get(name)
+        if base is None or base['wall_median'] <= 0:
+            continue
+        ratio = result['wall_median'] / base['wall_median']
+        if ratio > 1 + threshold:
+            slower[name] = ratio
+    return slower
+
+
+def describe():
+    """Return the commit and platform the benchmarks ran on."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'backend': k.backend}
+
+
+def main(argv: Optional[list] = None):
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--backend', default='sim', choices=('sim', 'visa'),
+                        help='simulated 2400 or real hardware over VISA')
+    parser.add_argument('--output', default='bench_results.json',
+                        help='JSON file to write results to')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timed runs per benchmark')
+    parser.add_argument('--points', type=int, nargs='+', default=sizes,
+                        help='buffer sizes for start() benchmarks')
+    parser.add_argument('--compare', default=None,
+                        help='earlier JSON results to check for slowdowns')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fractional slowdown reported by --compare')
+    args = parser.parse_args(argv)
+    k.set_backend(args.backend)
+    report = {'meta': describe(),
+              'results': run_benchmarks(args.repeat, tuple(args.points))}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    for name, result in report['results'].items():
+        modeled = result['modeled_median']
+        modeled = ('' if modeled is None
+                   else f'{1e3 * modeled:10.1f} ms modeled')
+        print(f'{name:32s} {1e3 * result["wall_median"]:10.3f} ms'
+              f' {modeled:20s}'
+              f' {result["alloc_peak_bytes"] / 1024:10.1f} KiB peak')
+    if args.compare is not None:
+        with open(args.compare) as file:
+            slower = compare(json.load(file), report, args.threshold)
+        for name, ratio in slower.items():
+            print(f'{name} is {ratio:.2f}x slower than {args.compare}')
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
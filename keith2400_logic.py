@@ -8,7 +8,19 @@ methods_
     match(str, str)
     test_inclusion(obj, list)
     get_out_type(str)
+    set_backend(str, opt object)
+    get_resource_manager()
+    get_instrument()
     write_visa(str, str)
+    parse_scpi(str)
+    command_name(str)
+    shared_headers(str, str)
+    metered(VISA resource)
+    begin_batch()
+    store_reply(str, str)
+    commit_batch()
+    transaction()
+    invalidate_shadow(opt str)
     set_gpib(opt int)
     check_connected(int)
     set_output_type(opt str)
@@ -33,27 +45,83 @@ methods_
     set_sweep(opt bool, opt str, opt str, opt str/float, opt float, opt float,
               opt int, opt list, opt bool)
     list_params(opt bool)
+    saved_settings()
     check_parameters()
-    set_format()
+    set_format(opt str)
+    read_buffer()
     make_header(list)
     set_all_to_globals()
     save_as()
-    save_data(list/str, opt bool)
-    process_data(list/str, int, opt str, opt str, opt bool)
+    save_data(list/str/Readings, opt bool)
+    write_file(str, list/str/Readings, str, list, opt dict, opt float,
+               opt tuple)
+    process_data(list/str/array, int, opt str, opt str, opt bool, opt list)
+    load_data(str, opt str)
     clear_data()
-    start(opt bool, opt bool)
-    stop()
+    clear_buffer()
+    apply_job(Job, opt Job)
+    arm(opt bool)
+    wait_complete(opt float)
+    fetch_data(int, opt bool)
+    output_off()
+    poll_stream(StreamState, opt float)
+    stream(opt float, opt bool, opt float)
+    start(opt bool, opt bool, opt callable, opt float, opt bool)
+    log_continuous(opt int, opt callable, opt bool, opt float)
+    stop(opt bool)
+    run_parallel(list, str/callable, ...)
+    run_jobs(list, opt Keithley2400)
+    scpi_number(float/int/str)
+    compile_sequence(list, opt int)
+    load_sequence(list, opt int)
+    list_messages(array/list, str)
+    run_waveform(array/list, opt float, opt bool)
+    refine_points(array/list, array/list, opt float, opt float)
+    cycle_levels(float, float, int, opt bool)
+    reading_rate(Readings, opt str)
+    continue_stamps(Readings, float, float, float, opt str)
+    fast_mode(opt float)
+    fast_start(opt float, opt bool, opt bool, opt bool)
+    start_stats(opt tuple, opt int, opt float)
+    split_cycles(Readings, int, opt bool)
+    load_cycles(float, float, int, opt int, opt bool)
+    cycle_sweep(float, float, int, opt int, opt bool, opt bool, opt bool,
+                opt bool)
+    adaptive_sweep(float, float, opt int, opt float, opt int, opt int,
+                   opt float, opt bool)
+    is_setting(str)
+    main()
+
+classes_
+    Readings(array, list, str)
+    StreamState(int, opt str, opt int, opt bool, opt float)
+    Keithley2400(opt int)
+    Job(str, ...)
+    Step(str, float, ...)
+    InstrumentModule(ModuleType)
 
 @author: Sarh Friedensen
 """
 # from IPython import get_ipython
 # get_ipython().magic('reset -sf')
 
-import visa
-import easygui as gui
+import os
+import importlib
+import io
+import contextlib
+import copy
+import functools
+import numpy as np
 import pprint
+import sys
+import types
+import keith2400_metrics as km
+import keith2400_storage as ks
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from distutils.util import strtobool
-from typing import Union, Optional
+from typing import Callable, NamedTuple, Union, Optional
 
 a = 'auto'
 c = 'current'
@@ -79,41 +147,14 @@ fc2 = ('G:/.shortcut-targets-by-id/128cjRwD6Qd8fhTyYFHrkDuYwwpdMwzjZ/'
        'Project Pinpoint/Testing/20200513'
        '/C_01_charge_vac.txt')
 
-rm = visa.ResourceManager()
-
-keith = None
-filename = None
-address = 25
-out_type = None
-meas_type = None
-delay = None
-out_val = {'VOLT': None,
-           'CURR': None}
-compl = {'VOLT': None,  # Compliance for voltage measurements
-         'CURR': None}  # Compliance for current measurements
-out_rng = {'VOLT': None,
-           'CURR': None}
-meas_rng = {'VOLT': None,
-            'CURR': None,
-            'RES': None}
-ohm_meas_type = 'Four'
-meas_speed = {'VOLT': None,
-              'CURR': None,
-              'RES': None}
+backend = os.environ.get('KEITH2400_BACKEND', 'visa')  # 'visa' or 'sim'
+rm = None  # VISA resource manager, created on first use
 max_out = {'VOLT': 200,
            'CURR': 1}
-num_points = None
-sweep_params = {'Enabled': False,
-                'Type': None,
-                'Output': None,
-                'Ranging': None,
-                'Start': None,
-                'Stop': None,
-                'Points': None,
-                'List': None}
-data = []
-header = ''
-format_ = ''
+batch_max_len = 1000  # Longest message written at once when batching
+list_max_len = 100  # Most values in one SOUR:LIST command
+volatile = ('TRAC:POIN:ACT', 'TRAC:DATA', 'SENS:DATA', 'CALC3:DATA', 'FETC',
+            'READ', 'MEAS', 'SYST:ERR', 'STAT')  # Never answered from shadow
 
 
 def general_input(prompt: str, type_: Optional[type] = None,
@@ -191,762 +232,2130 @@ def get_out_type(string: str):
             else ('RES' if 'R' in string else 'ERR')))
 
 
-def write_visa(cmd: str, query: str):
-    """Try to write a command to the instrument and return a query about it."""
-    global keith
+def set_backend(name: str, manager=None):
+    """Choose the VISA backend: 'visa' for hardware or 'sim' for simulation.
+
+    manager is an already created resource manager to use, e.g. a simulated
+    one with several instruments.  Drops the default instrument's connection;
+    the next instrument access reconnects.
+    """
+    global backend
+    global rm
+    backend = name
+    rm = manager
+    instrument.keith = None
+    instrument.invalidate_shadow()
+
+
+def get_resource_manager():
+    """Return the VISA resource manager, creating it on first use."""
+    global rm
+    global backend
+    if rm is None:
+        module = 'keith2400_sim' if match('sim*', backend) else 'visa'
+        rm = importlib.import_module(module).ResourceManager()
+    return rm
+
+
+def parse_scpi(cmd: str):
+    """Split a SCPI message into (header, value) pairs with full headers.
+
+    Headers are upper case without a leading colon, with relative headers
+    (e.g. 'POIN' after ':TRAC:CLE') expanded.  value is None for commands
+    that take no parameter, and list values have their spaces removed.
+    """
+    pairs = []
+    path = ''
+    for segment in cmd.split(';'):
+        segment = segment.strip()
+        if not segment:
+            continue
+        head, _, value = segment.partition(' ')
+        head = head.upper()
+        value = ','.join(x.strip() for x in value.split(',')) or None
+        if not head.startswith('*'):
+            head = head[1:] if head.startswith(':') else path + head
+            path = head[:head.rfind(':') + 1]
+        pairs.append((head, value))
+    return pairs
+
+
+def command_name(message: str):
+    """Return the headers of a SCPI message without their values."""
+    return '; '.join(x for x, _ in parse_scpi(message)) or '(empty)'
+
+
+def split_header(head: str):
+    """Split a full SCPI header into its subsystem and the rest."""
+    (sub, _, rest) = head.partition(':')
+    return sub, rest
+
+
+def shared_headers(sub: str, rest: str):
+    """Return the headers of sub holding the same setting as rest.
+
+    The 2400 has one integration time, so the NPLC of every measurement
+    function is the same setting.
+    """
+    if sub == 'SENS' and rest.endswith(':NPLC'):
+        return tuple(f'{x}:NPLC' for x in ('VOLT', 'CURR', 'RES'))
+    return (rest,)
+
+
+def join_messages(parts: list, sep: str = '; '):
+    """Join SCPI messages from the root into as few writes as possible."""
+    global batch_max_len
+    messages = []
+    for part in parts:
+        part = part.strip().rstrip(';')
+        if not part.startswith((':', '*')):
+            part = ':' + part
+        if messages and len(messages[-1]) + len(part) + 2 <= batch_max_len:
+            messages[-1] += sep + part
+        else:
+            messages.append(part)
+    return messages
+
+
+def same_setting(first: str, second: str):
+    """Test whether two setting values agree, numerically if possible."""
+    (first, second) = (str(first).split(','), str(second).split(','))
+    if len(first) > 1 or len(second) > 1:  # Lists, compared value by value
+        return len(first) == len(second) and all(map(same_setting, first,
+                                                     second))
+    (first, second) = (first[0], second[0])
     try:
-        keith.write(cmd)
-    except AttributeError:
-        print('Instrument is not connected--cannot set parameter')
-        return None
-    else:
-        return keith.query(query)
+        return abs(float(first) - float(second)) <= 1e-6 * abs(float(first))
+    except (TypeError, ValueError):
+        return str(first).strip('"').upper() == str(second).strip('"').upper()
 
 
-def set_gpib(gpib: Optional[int] = None):
-    """Set GPIB address of the instrument."""
-    if type(gpib) is not int or gpib not in list(range(1, 30)):
-        prompt = 'Specify the GPIB address of the instrument.'
-        gpib = general_input(prompt=prompt, type_=int, min_=1, max_=30, esc=0)
-    if gpib is not None:
-        check_connected(gpib)
+def scpi_number(val: Union[int, float, str]):
+    """Format a number compactly for a command (7 significant digits)."""
+    return f'{float(val):.7g}'
 
 
-def check_connected(gpib: int):
-    """See if instrument connected at GPIB address and open comunication."""
-    global keith
-    global address
-    inst_list = [x for x in rm.list_resources() if (str(gpib) in x
-                                                    and 'GPIB' in x)]
-    try:
-        keith = rm.open_resource(inst_list[0], read_termination='\n',
-                                 write_termination='\n')
-    except IndexError:
-        keith = None
-        address = None
-        print(f'Instrument is not connected at address {gpib}.')
-    else:
-        address = gpib
-#        keith.read_termination = '\n'
-#        keith.write_termination = '\n'
-        keith.write(':SOUR:CLE:AUTO ON; :OUTP:SMOD HIMP; :SYST:RSEN OFF;')
-        keith.timeout = None
-
-
-def set_output_type(type_str: Optional[str] = None):
-    """Set whether instrument acts as a voltage or current source."""
-    global out_type
-    choices = ['volt*', 'cur*']
-    if not test_inclusion(type_str, choices):
-        prompt = "Specify whether you wish to source voltage or current."
-        type_str = general_input(prompt=prompt, type_=str, choices=choices)
-    if test_inclusion(type_str, choices):
-        cmd = (f'SOUR:FUNC {get_out_type(type_str)};')
-        out_type = get_out_type(write_visa(cmd, 'SOUR:FUNC?'))
-
-
-def set_output_range(val=None):
-    """Set the instrument range for its output."""
-    global out_type
-    global out_rng
-    out = get_out_type(out_type)
-    if out == 'ERR':
-        print('Output type not specified.')
-        return
-    if val is not None and match('auto*', str(val)):
-        set_output_autorange(True)
-        return
-    (sort, unit) = (('voltage', 'volts') if out == 'VOLT'
-                    else ('current', 'amps'))
-    prompt = f'Enter your max {sort} output in {unit} (as float).'
-    max_ = 200 if out == 'VOLT' else 1
-    cond = type(val) in (float, int) and 0 < val <= max_
-    if val is None or not cond:
-        val = general_input(prompt=prompt, type_=float, max_=max_, min_=0)
-    cmd = f'SOUR:{out}:RANG {val};'
-    if val is not None:
-        out_rng[out] = write_visa(cmd, f':SOUR:{out}:RANG?')
-
-
-def set_output_autorange(enable: Optional[bool] = None):
-    """Enable or disable autorange for the instrument output."""
-    global out_type
-    global out_rng
-    out = get_out_type(out_type)
-    if out == 'ERR':
-        print('Output type not specified.')
-        return
-    if enable is None or type(enable) is not bool:
-        prompt = 'Would you like to enable autorange? Answer True or False.'
-        enable = general_input(prompt=prompt, type_=bool)
-    if enable is not None:
-        state = 'ON' if enable else 'OFF'
-        cmd = f'SOUR:{out}:RANG:AUTO {state};'
-        enable = write_visa(cmd, f'SOUR:{out}:RANG:AUTO?')
-        if enable is not None:
-            out_rng[out] = 'AUTO' if strtobool(enable) else out_rng[out]
+def list_messages(values, out: str):
+    """Return the SOUR:LIST commands that upload values for output out.
 
+    The 2400 takes at most 100 values per command, so longer lists are
+    extended with SOUR:LIST:<out>:APP.
+    """
+    text = [scpi_number(x) for x in np.asarray(values, dtype=float).ravel()]
+    return [f':SOUR:LIST:{out}{":APP" if i else ""} '
+            + ','.join(text[i:i + list_max_len])
+            for i in range(0, len(text), list_max_len)]
 
-def set_output_val(val: Optional[Union[int, float]] = None):
-    """Set fixed output level for voltage (V) or current (A) for instrument."""
-    global out_val
-    global out_type
-    global max_out
-    out = get_out_type(out_type)
-    if out == 'ERR':
-        print('Please specify an output type before setting an output value.')
-        return
-    max_ = max_out[out]
-    if val is None:
-        unit = f'{"V" if match(out, "volt") else "A"}'
-        prompt = f"Specify the output value ({unit})."
-        val = general_input(prompt=prompt, type_=float, min_=-max_, max_=max_)
-    if val is not None:
-        print(val)
-        cmd = (f"SOUR:{out}:MODE FIX; :SOUR:{out} "
-               + f"{0 if abs(val) > max_ else val};")
-        out_val[out] = write_visa(cmd, f'SOUR:{out}?')
-
-
-def set_measure_type(type_str: Optional[str] = None,
-                     four_wire: Optional[bool] = None):
-    """Set whether instrument will measure current, voltage, or resistance."""
-    global meas_type
-    global out_type
-    choices = ['volt*', 'curr*', 'res*']
-    if not test_inclusion(type_str, choices):
-        prompt = ('Specify which parameter you would like to measure (current,'
-                  + ' voltage, or resistance).')
-        type_str = general_input(prompt=prompt, type_=str, choices=choices)
-    if out_type is None:
-        set_output_type()
-    if test_inclusion(type_str, choices) and out_type is not None:
-        meas = get_out_type(type_str)
-        out = get_out_type(out_type)
-        meas_type = meas
-        cmd = ('SENS:FUNC:CONC ON; :SENS:FUNC:OFF:ALL; '
-               + f':SENS:FUNC "{meas}", "{out}"')
-        cmd += '; :SYST:RSEN ' + ('OFF;' if (four_wire is False or meas != out)
-                                  else 'ON;')
-        if meas == 'RES':
-            # Set resistance auto-sourcing and output compensation on.
-            # If doing manual resistance measurement, will need to set
-            # voltage and current compliance.
-            cmd += '; :SENS:RES:MODE AUTO; OCOM ON;'
-        out_val[out] = write_visa(cmd, f'SOUR:{out}?')
-
-
-def set_compliance(val=None):
-    """Set compliance value for either a voltage or current measurement."""
-    global out_type
-    global meas_type
-    global meas_rng
-    global compl
-    out = get_out_type(out_type)
-    meas = get_out_type(meas_type)
-    if out == 'ERR':
-        print('Output type not specified.')
-        return
-    if out == 'VOLT':
-        max_ = 1.05
-        min_ = 1e-9
-        if val is None or type(val) not in (float, int):
-            prompt = 'Enter your current compliance value in amps (as float).'
-            val = general_input(prompt=prompt, type_=float, min_=min_,
-                                max_=max_)
-        else:
-            val = (max_ if val > max_ else min_ if val < min_ else val)
-    elif out == 'CURR':
-        max_ = 210
-        min_ = 200e-6
-        if val is None or type(val) not in (float, int):
-            prompt = 'Enter your voltage compliance value in volts (as float).'
-            max_ = meas_rng['VOLT']
-            val = general_input(prompt=prompt, type_=float, min_=min_,
-                                max_=max_)
-        else:
-            val = (max_ if val > max_ else min_ if val < min_ else val)
-    cmd = f'SENS:{meas}:PROT {val};'
-    if val is not None:
-        compl[out] = write_visa(cmd, f'SENS:{meas}:PROT?')
-
-
-def set_measure_range(val=None):
-    """Set the measurement range for the instrument."""
-    global meas_type
-    global meas_rng
-    meas = get_out_type(meas_type)
-    if meas == 'ERR':
-        print('Measurement type not specified.')
-        return
-    if match('auto*', str(val)):
-        set_measure_autorange(True)
-        return
-    max_ = 200 if meas == 'VOLT' else 1 if meas == 'CURR' else 200e6
-    min_ = 0 if (meas == 'VOLT' or 'CURR') else 20
-    cond = type(val) in (float, int) and min_ <= val <= max_
-    if val is None or not cond:
-        (sort, unit) = (('voltage', 'volts') if meas == 'VOLT'
-                        else ('current', 'amps') if meas == 'CURR'
-                        else ('resistance', 'ohms'))
-        prompt = f'Enter your {sort} measurement range in {unit} (as float).'
-        val = general_input(prompt=prompt, type_=float, min_=min_, max_=max_)
-    if val is not None:
-        cmd = f':SENS:{meas}:RANG {val};'
-        meas_rng[meas] = write_visa(cmd, f'SENS:{meas}:RANG?')
-
-
-def set_measure_autorange(enable: Optional[bool] = None):
-    """Enable or disable autorange for measurement."""
-    global meas_type
-    global meas_rng
-    meas = get_out_type(meas_type)
-    if meas == 'ERR':
-        print('Measurement type not specified.')
-        return
-    if enable is None or type(enable) is not bool:
-        prompt = 'Would you like to enable autorange? Answer True or False.'
-        enable = general_input(prompt=prompt, type_=bool)
-    if enable is not None:
-        state = 'ON' if enable else 'OFF'
-        cmd = f'SENS:{meas}:RANG:AUTO {state};'
-        enable = write_visa(cmd, f'SENS:{meas}:RANG:AUTO?')
-        if enable is not None:
-            meas_rng[meas] = 'AUTO' if strtobool(enable) else meas_rng[meas]
-
-
-def set_delay(val=None):
-    """Set delay time between change in output value and next measurement."""
-    global delay
-    min_ = 0.0
-    max_ = 9999.999
-    cond = (match('auto*', str(val))
-            or ((type(val) in (float, int)) and (min_ <= val <= max_)))
-    if val is None or not cond:
-        prompt = 'Enable auto source delay? Answer True or False.'
-        val = bool(general_input(prompt=prompt, type_=bool))
-        if not val:
-            prompt = 'Enter desired source delay in seconds (as float).'
-            val = general_input(prompt=prompt, type_=float, min_=min_,
-                                max_=max_)
-    if val is not None:
-        auto = ('ON' if (str(val) == 'True' or match('auto*', str(val)))
-                else 'OFF')
-        cmd = (f'SOUR:DEL:AUTO {auto};'
-               + (f' :SOUR:DEL {val};' if auto == 'OFF' else ''))
-        delay = write_visa(cmd, f'SOUR:DEL?')
-        if write_visa('', 'SOUR:DEL:AUTO?') == '1':
-            #  keith.query('SOUR:DEL:AUTO?') == '1':
-            delay = 'AUTO'
-
-
-def set_ohm_meas_type(type_str: Optional[Union[str, int]] = None):
-    """Set the type of resistance measurement to perform."""
-    global ohm_meas_type
-    if type(type_str) is int:
-        type_str = str(type_str)
-    choices = ['two*', '2*', 'four*', '4*', 'six*', '6*']
-    if not test_inclusion(type_str, choices):
-        prompt = ('What type of resistance measurement (two-, four-, or '
-                  'six-wire) would you like to perform?')
-        type_str = general_input(prompt=prompt, type_=str, choices=choices)
-    if test_inclusion(type_str, choices):
-        meas_type = ('Two' if test_inclusion(type_str, ['two*', '2*'])
-                     else 'Four' if test_inclusion(type_str, ['fo*', '4*'])
-                     else 'Six')
-        mode = 'ON' if (meas_type == 'Four' or 'Six') else 'OFF'
-        cmd = f'SYST:RSEN {mode};'
-        if meas_type == 'Six':
-            cmd += '; :SYST:GUAR OHMS;'
-        result = write_visa(cmd, 'SYST:RSEN?')
-        if result is not None:
-            ohm_meas_type = meas_type
-
-
-def set_measure_speed(val=None):
-    """Set the measurement integration time for the instrument in PLC."""
-    global meas_type
-    global meas_speed
-    meas = get_out_type(meas_type)
-    max_ = 10
-    min_ = 0.01
-    if meas == 'ERR':
-        print('Measurement type not specified.')
-        return
-    cond = type(val) in (float, int) and min_ <= val <= max_
-    if val is None or not cond:
-        prompt = 'What is your desired integration time in power line cycles?'
-        val = general_input(prompt=prompt, type_=float, max_=max_, min_=min_)
-    if val is not None:
-        cmd = f'SENS:{meas}:NPLC {val};'
-        meas_speed[meas] = write_visa(cmd, f'SENS:{meas}:NPLC?')
-
-
-def set_num_points(val: Optional[int] = None):
-    """Set the number of points to measure and set up buffer."""
-    global num_points
-    max_ = 2500
-    min_ = 0
-    if type(val) is not int or val not in list(range(min_, max_+1)):
-        prompt = 'How many measurements would you like to take?'
-        val = general_input(prompt=prompt, type_=int, min_=min_, max_=max_)
-    if type(val) is int:
-        cmd = (f':TRAC:FEED:CONT NEV; :TRAC:CLE; POIN {val}; FEED SENS; '
-               + ':TRAC:TST:FORM ABS; :TRAC:FEED:CONT NEXT; '
-               + f':ARM:SEQ:COUN 1; :TRIG:COUN {val};')
-        num_points = write_visa(cmd, ':TRAC:POIN?')
-
-
-def set_sweep_output(on: Optional[bool] = None, outpt: Optional[str] = None,
-                     write: bool = False):
-    """Enable or disable sweeping, and if enabled, specify output type."""
-    global sweep_params
-    if on not in (True, False):
-        prompt = 'Would you like to enable a sweep?'
-        on = bool(general_input(prompt=prompt, type_=bool))
-    choices = ['volt*', 'curr*']
-    if not test_inclusion(outpt, choices) and on:
-        prompt = 'Would you like to configure the current or voltage source?'
-        outpt = get_out_type(general_input(
-                    prompt=prompt, type_=str, choices=choices))
-    if test_inclusion(outpt, choices) and on:
-        cmd = f':SOUR:{outpt}:MODE {"SWE" if on else "FIX"}'
-        query = f':SOUR:{outpt}:MODE?'
-        if write:
-            resp = write_visa(cmd, query)
-            sweep_params['Enabled'] = test_inclusion(resp, ['SWE', 'LIST'])
-            sweep_params['Output'] = outpt
-            return (outpt, cmd, query)
-        else:
-            return (outpt, cmd, query)
-    else:
-        print('No output mode given. Configuration terminated.')
-        return None
 
+class Readings(NamedTuple):
+    """Buffer readings held as an (n, cols) float array, one row per point.
 
-def set_sweep_type(sw_type: Optional[str] = None, write: bool = False):
-    """Set the type of sweep to perform."""
-    global sweep_params
-    choices = ['lin*', 'log*', 'list*']
-    out = sweep_params["Output"]
-    if out is None:
-        print("Please specify an output type (voltage or current) before "
-              + "setting a sweep type.")
-        return None
-    if not sweep_params["Enabled"]:
-        print("Sweep is not enabled, so cannot configure sweep type.")
-        return None
-    if not test_inclusion(sw_type, choices):
-        prompt = ('Would you like to configure a linear, logarithmic, or '
-                  + 'custom sweep?')
-        sw = general_input(prompt=prompt, type_=str, choices=choices)
-    if test_inclusion(sw, choices):
-        sw_type = ('LIST' if match(sw, 'list*') else 'LIN' if
-                   match(sw, 'lin*') else 'LOG')
-        cmd = (f'SOUR:{out}:MODE LIST' if sw_type == 'LIST' else
-               f'SOUR:SWE:SPAC {sw_type}')
-        query = (f'SOUR:{out}:MODE?' if sw_type == 'LIST'
-                 else 'SOUR:SWE:SPAC?')
-        if write:
-            sweep_params['Type'] = write_visa(cmd, query)
-            return (sw_type, cmd, query)
-        else:
-            return (sw_type, cmd, query)
-    else:
-        print('Valid sweep type not provided. Configuration terminated.')
-        return None
+    Columns are views into the array, so nothing is copied or converted to
+    text until to_text() is called when saving.
+    """
+
+    array: np.ndarray
+    names: Union[list, tuple] = ()
+    delim: str = '\t'
+
+    @property
+    def columns(self):
+        """Return each column of the readings as a view into the array."""
+        return tuple(self.array[:, j] for j in range(self.array.shape[1]))
+
+    def column(self, name: str):
+        """Return the column whose name matches name (wildcards allowed)."""
+        for j, x in enumerate(self.names):
+            if match(name, x):
+                return self.array[:, j]
+        raise KeyError(f'No column matching {name}.')
 
+    def to_text(self, delim: Optional[str] = None):
+        """Format the readings as delimited rows like the 2400's ASCII."""
+        delim = self.delim if delim is None else delim
+        text = io.StringIO()
+        np.savetxt(text, self.array, fmt='%+.6E', delimiter=delim)
+        return text.getvalue().rstrip('\n')
 
-def set_sweep_range(rang: Optional[str] = None, write: bool = False):
-    """Set the output range for the sweep.
 
-    'best' will select the lowest fixed range that will encompas the sweep;
-    'auto' will change the range at any changeover points; and 'fixed' will
-    choose the currently selected range.
+class StreamState(NamedTuple):
+    """Progress of a stream() between polls (see poll_stream())."""
+
+    cols: int
+    delim: str = '\t'
+    seen: int = 0  # Readings yielded so far
+    done: bool = False  # Run reported operation complete
+    heard: float = 0.0  # time.monotonic() when readings last arrived
+
+
+def refine_points(x, y, tol: float = 0.02, min_step: float = 0.0):
+    """Return the midpoints where a sampled curve needs more points.
+
+    An interval is split if y changes across it by more than tol of the
+    whole span of y (a steep slope), or if a point next to it is off the
+    line through its neighbours by more than tol of the span (a bend).
+    Intervals no wider than min_step are left alone.  The midpoints are
+    ranked by the larger of the two, most needed first.
     """
-    global sweep_params
-    choices = ['best*', 'auto*', 'fix*']
-    if not test_inclusion(rang, choices):
-        prompt = 'Would you like best, fixed, or auto ranging?'
-        rang = general_input(prompt=prompt, type_=str, choices=choices)
-    if test_inclusion(rang, choices):
-        rang = ('BEST' if match(rang, 'best*') else 'AUTO' if
-                match(rang, 'auto*') else 'FIX')
-        cmd = f'SOUR:SWE:RANG {rang}'
-        query = 'SOUR:SWE:RANG?'
-        if write:
-            sweep_params['Ranging'] = write_visa(cmd, query)
-            return (rang, cmd, query)
-        else:
-            return (rang, cmd, query)
-    else:
-        print('Valid range type not provided. Configuration terminated.')
+    order = np.argsort(x)
+    x = np.asarray(x, dtype=float)[order]
+    y = np.asarray(y, dtype=float)[order]
+    if len(x) < 2:
+        return np.empty(0)
+    span = np.ptp(y) or 1.0
+    score = np.abs(np.diff(y)) / span
+    if len(x) > 2:
+        width = x[2:] - x[:-2]
+        width[width == 0] = np.inf
+        line = y[:-2] + (y[2:] - y[:-2]) * (x[1:-1] - x[:-2]) / width
+        bend = np.abs(y[1:-1] - line) / span
+        score[:-1] = np.maximum(score[:-1], bend)
+        score[1:] = np.maximum(score[1:], bend)
+    split = (score > tol) & (np.diff(x) > min_step)
+    rank = np.argsort(-score[split], kind='stable')
+    return ((x[:-1][split] + x[1:][split]) / 2)[rank]
+
+
+def cycle_levels(start: float, stop: float, points: int,
+                 bidirectional: bool = True):
+    """Return the source levels of one sweep cycle, up and maybe back."""
+    up = np.linspace(start, stop, int(points))
+    return np.concatenate((up, up[::-1])) if bidirectional else up
+
+
+def split_cycles(readings, points: int, bidirectional: bool = True):
+    """Split the readings of a cycled sweep per cycle and branch.
+
+    Returns a list with one list of Readings (the up branch, then the down
+    branch if bidirectional) per cycle; the branches are views into the
+    readings.  A cycle cut short by an abort keeps what was measured.
+    """
+    points = int(points)
+    length = points * (2 if bidirectional else 1)
+    cycles = []
+    for first in range(0, len(readings.array), length):
+        cycle = readings.array[first:first + length]
+        cycles.append([readings._replace(array=cycle[x:x + points])
+                       for x in range(0, len(cycle), points)])
+    return cycles
+
+
+def reading_rate(readings, time: str = 'TIME'):
+    """Return the readings per second achieved, from the time stamps."""
+    stamps = readings.column(time)
+    if len(stamps) < 2 or stamps[-1] == stamps[0]:
         return None
+    return (len(stamps) - 1) / (stamps[-1] - stamps[0])
 
 
-def set_sweep_start(val: Optional[Union[float, int]] = None,
-                    write: bool = False):
-    """Set the sweep start point."""
-    global sweep_params
-    output = sweep_params['Output']
-    upbound = max_out.get(output, 'ERR')
-    if upbound == 'ERR':
-        print('Please specify a sweep output type before setting bounds.')
-        return
-    if type(val) not in (float, int) or not -upbound <= val <= upbound:
-        prompt = f'What is the start value for the sweep in {output.lower()}s?'
-        val = general_input(prompt=prompt, type_=float, min_=-upbound,
-                            max_=upbound)
-    if val is not None:
-        cmd = f':SOUR:{output}:STAR {val};'
-        query = f'SOUR:{output}:STAR?'
-        if write:
-            sweep_params['Start'] = write_visa(cmd, query)
-            return (val, cmd, query)
-        else:
-            return (val, cmd, query)
+def continue_stamps(readings, last: Optional[float], offset: float,
+                    elapsed: float, time: str = 'TIME'):
+    """Offset a chunk's time stamps so they carry on from the last one.
+
+    The 2400 restarts its stamps when the buffer is cleared and the trigger
+    model re-armed.  If the chunk starts (after offset) before last, offset
+    becomes elapsed, the host seconds between the first arm and the one that
+    took the chunk.  Returns the readings and the offset for the next chunk.
+    """
+    if time not in readings.names or not len(readings.array):
+        return readings, offset
+    j = list(readings.names).index(time)
+    if last is not None and readings.array[0, j] + offset < last:
+        offset = elapsed
+    if offset:
+        array = readings.array.copy()
+        array[:, j] += offset
+        readings = readings._replace(array=array)
+    return readings, offset
+
+
+def process_data(data: Union[list, str, np.ndarray], cols: int,
+                 indelim: str = ',', outdelim: str = '\t',
+                 prnt: bool = False, names: Optional[list] = None):
+    """Take raw data from 2400 and reshape it into a Readings array.
+
+    Accepts the ASCII string from the instrument, a list of values or a flat
+    array from a binary transfer.  A trailing partial row is dropped.  names
+    labels the columns (see set_format()).
+    """
+    if type(data) is str:
+        data = np.fromstring(data, sep=indelim)
     else:
-        print('Valid start value not provided. Configuration terminated.')
-        return None
+        data = np.asarray(data, dtype=float)
+    rows = data.size // cols
+    names = list(names) if names is not None and len(names) == cols else ()
+    readings = Readings(data[:rows * cols].reshape(rows, cols), names,
+                        outdelim)
+    if prnt:
+        print(readings.to_text())
+    return readings
+
 
+def load_data(name: str, indelim: Optional[str] = None):
+    """Load a file written by save_data() back into a Readings array.
 
-def set_sweep_stop(val: Optional[Union[int, float]] = None,
-                   min_: Optional[Union[int, float]] = None,
-                   write: bool = False):
-    """Set the sweep stop point."""
-    global sweep_params
-    output = sweep_params['Output']
-    upbound = max_out.get(output, 'ERR')
-    min_ = -upbound if min_ is None else min_
-    if upbound == 'ERR':
-        print('Please specify a sweep output type before setting bounds.')
+    Columnar (.col) files are memory-mapped rather than read.
+    """
+    if ks.is_columnar(name):
+        columns = ks.ColumnFile(name)
+        return Readings(columns.array.T, columns.names)
+    with ks.open_file(name) as file:
+        names = file.readline().rstrip('\n').split('\t')
+        if indelim is None:
+            pos = file.tell()
+            indelim = ',' if ',' in file.readline() else '\t'
+            file.seek(pos)
+        array = np.loadtxt(file, delimiter=indelim, ndmin=2)
+    outdelim = ', ' if indelim == ',' else '\t'
+    return Readings(array, names, outdelim)
+
+
+def write_file(name: str, data: Union[list, str, Readings], header: str,
+               names: list, settings: Optional[dict] = None,
+               interval: float = 1.0, levels: tuple = ()):
+    """Write data to a text or (for .col names) columnar data file."""
+    if type(data) is list:
+        data = ''.join(data)
+    if ks.is_columnar(name):
+        if type(data) is not Readings:
+            data = process_data(data or '', cols=len(names))
+        ks.write_columns(name, data, names, settings, levels)
         return
-    if type(val) not in (float, int) or not min_ <= val <= upbound:
-        prompt = f'What is the stop value for the swep in {output.lower()}s?'
-        val = general_input(prompt=prompt, type_=float, min_=min_,
-                            max_=upbound)
-    if val is not None:
-        cmd = f'SOUR:{output}:STOP {val};'
-        query = f'SOUR:{output}:STOP?'
-        if write:
-            sweep_params['Stop'] = write_visa(cmd, query)
-            return (val, cmd, query)
+    delim = data.delim if type(data) is Readings else '\t'
+    with ks.DataWriter(name, header, delim, interval,
+                       levels=levels) as writer:
+        if type(data) is Readings:
+            writer.write(data)
+        elif data is not None:
+            writer.file.write(data)
+
+
+def locked(method: Callable):
+    """Hold the instrument's bus lock for the whole of a method call."""
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        with self.bus:
+            return method(self, *args, **kwargs)
+    return call
+
+
+class Keithley2400:
+    """One Keithley 2400 and all of the settings and data that go with it.
+
+    Every instrument setting, the connection, the buffer format and the last
+    data taken are held per instance, so several 2400s can be driven from
+    one process (see run_parallel()).  The module-level functions act on the
+    default instance, instrument.
+    """
+
+    def __init__(self, address: Optional[int] = 25):
+        self.keith = None
+        self.filename = None
+        self.address = address
+        self.out_type = None
+        self.meas_type = None
+        self.delay = None
+        self.out_val = {'VOLT': None,
+                        'CURR': None}
+        self.compl = {'VOLT': None,  # Compliance for voltage measurements
+                      'CURR': None}  # Compliance for current measurements
+        self.out_rng = {'VOLT': None,
+                        'CURR': None}
+        self.meas_rng = {'VOLT': None,
+                         'CURR': None,
+                         'RES': None}
+        self.ohm_meas_type = 'Four'
+        self.meas_speed = {'VOLT': None,
+                           'CURR': None,
+                           'RES': None}
+        self.num_points = None
+        self.sweep_params = {'Enabled': False,
+                             'Type': None,
+                             'Output': None,
+                             'Ranging': None,
+                             'Start': None,
+                             'Stop': None,
+                             'Points': None,
+                             'List': None}
+        self.data = []
+        self.header = ''
+        self.format_ = ''
+        self.data_format = 'ASC'  # 'ASC', 'SREAL' or 'REAL,64'
+        self.flush_interval = 1.0  # Seconds between flushes of the save file
+        self.summary_levels = ks.levels  # Summary blocks saved with data
+        self.batch = None  # Queued (cmd, query, reply) in a transaction
+        self.shadow = {}  # Last known instrument settings by SCPI subsystem
+        self.shadow_enabled = True
+        self.bus = threading.RLock()  # Held while talking to the instrument
+        self.waiting = False  # start() is waiting to fetch the data
+        self.stopping = threading.Event()  # Set by stop() to end a wait
+        self.metrics = None
+
+    def get_instrument(self):
+        """Return the instrument, connecting at address on first use."""
+        if self.keith is None and self.address is not None:
+            self.check_connected(self.address)
+        return self.keith
+
+    @locked
+    def write_visa(self, cmd: str, query: str):
+        """Try to write a command to the instrument and return a query on it.
+
+        If the shadow already holds every setting in cmd and the queried value,
+        nothing is sent and the shadow value is returned.  Inside a transaction
+        the command is only queued, and the value it sets is returned in place
+        of the query reply (see begin_batch()).
+        """
+        cached = self.cached_reply(cmd, query)
+        if cached is not None:
+            return cached
+        self.get_instrument()
+        if self.batch is not None:
+            expected = self.expected_reply(cmd, query)
+            if expected is not None:
+                self.batch.append((cmd, query, expected))
+                self.update_shadow(cmd, query, expected)
+                return expected
+            # The reply cannot be predicted, so send everything queued so far.
+            self.flush_batch()
+        try:
+            self.keith.write(cmd)
+        except AttributeError:
+            print('Instrument is not connected--cannot set parameter')
+            return None
         else:
-            return (val, cmd, query)
-    else:
-        print('Valid stop value not provided. Configuration terminated.')
-        return None
+            reply = self.keith.query(query)
+            self.update_shadow(cmd, query, reply)
+            return reply
+
+    @property
+    def metrics(self):
+        """The keith2400_metrics.BusMetrics recording bus traffic, or None."""
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self._metrics = metrics
+        self.keith = self.metered(self.keith)
+
+    def metered(self, resource):
+        """Return resource wrapped to record its traffic if metrics is set."""
+        if isinstance(resource, km.MeteredResource):
+            resource = resource.resource
+        if resource is None or self.metrics is None:
+            return resource
+        return self.metrics.wrap(resource, command_name)
+
+    def cached_reply(self, cmd: str, query: str):
+        """Return the shadow value for query if cmd would change nothing."""
+        head = query.strip().rstrip('?').lstrip(':').upper()
+        if (not self.shadow_enabled or head.startswith('*')
+                or head.startswith(volatile)):
+            return None
+        for key, value in parse_scpi(cmd):
+            (sub, rest) = split_header(key)
+            known = self.shadow.get(sub, {}).get(rest)
+            if (value is None or known is None
+                    or not same_setting(value, known)):
+                return None
+        (sub, rest) = split_header(head)
+        return self.shadow.get(sub, {}).get(rest)
+
+    def update_shadow(self, cmd: str, query: Optional[str] = None, reply=None):
+        """Record the settings written by cmd and the reply to query.
+
+        *RST and *RCL clear the whole shadow.  Settings the instrument couples
+        (range, autorange and compliance of a function, a source level and its
+        autoranged range, and the auto source delay) are forgotten together,
+        and changing the source or measurement functions forgets every SENS
+        setting.  The NPLC shared by all functions is stored for all of them.
+        """
+        for key, value in parse_scpi(cmd):
+            if key.startswith(('*RST', '*RCL')):
+                self.invalidate_shadow()
+                continue
+            if value is None or key.startswith('*'):
+                continue
+            (sub, rest) = split_header(key)
+            if ((sub == 'SENS' and rest.startswith('FUNC'))
+                    or (sub == 'SOUR' and rest == 'FUNC')):
+                self.shadow.pop('SENS', None)
+            subsystem = self.shadow.setdefault(sub, {})
+            base = rest.split(':')[0]
+            linked = ((base + ':RANG', base + ':RANG:AUTO', base + ':PROT')
+                      if rest.endswith((':RANG', ':RANG:AUTO', ':PROT'))
+                      else (base + ':RANG',) if rest == base and sub == 'SOUR'
+                      else ('DEL',) if rest == 'DEL:AUTO' else ())
+            for link in linked:
+                subsystem.pop(link, None)
+            for same in shared_headers(sub, rest):
+                subsystem[same] = {'ON': '1', 'OFF': '0'}.get(value.upper(),
+                                                              value)
+        head = (query or '').strip().rstrip('?').lstrip(':').upper()
+        if (reply is not None and head and not head.startswith('*')
+                and not head.startswith(volatile)):
+            (sub, rest) = split_header(head)
+            for same in shared_headers(sub, rest):
+                self.shadow.setdefault(sub, {})[same] = str(reply).strip()
+
+    def invalidate_shadow(self, subsystem: Optional[str] = None):
+        """Forget the shadow for one SCPI subsystem, or for all of them."""
+        if subsystem is None:
+            self.shadow.clear()
+        else:
+            self.shadow.pop(subsystem.lstrip(':').upper(), None)
+
+    def expected_reply(self, cmd: str, query: str):
+        """Predict the reply to query from the setting made by cmd.
+
+        Looks through any queued batch and then cmd for the last value
+        written, extended by any :APP writes after it (as SOUR:LIST lists
+        are).  Returns None if the queried setting was not written.
+        """
+        head = query.strip().rstrip('?').lstrip(':').upper()
+        value = None
+        for text in [x[0] for x in self.batch or []] + [cmd]:
+            for key, val in parse_scpi(text):
+                if val is None:
+                    continue
+                if key == head:
+                    value = val
+                elif key == head + ':APP' and value is not None:
+                    value += ',' + val
+        if value is None:
+            return None
+        # The 2400 reports boolean settings as 1 or 0.
+        return {'ON': '1', 'OFF': '0'}.get(value.upper(), value)
+
+    def begin_batch(self):
+        """Queue setter commands instead of sending each one with a query.
+
+        Until commit_batch() is called, write_visa() only records commands and
+        returns the value each one sets.  A setter whose reply cannot be
+        predicted sends the queue first, so commands keep their order.
+        """
+        if self.batch is None:
+            self.batch = []
+
+    @locked
+    def flush_batch(self):
+        """Send queued commands and verify them with one combined query.
+
+        If the combined reply does not hold one answer per query (a query
+        failed and sent nothing), the answers cannot be matched up, so the
+        shadow is forgotten and each query is asked on its own instead.
+        """
+        queued, self.batch = self.batch, []
+        if not queued or self.get_instrument() is None:
+            return {}
+        for message in join_messages([x[0] for x in queued if x[0].strip()]):
+            self.keith.write(message)
+        queries = list(dict.fromkeys(x[1] for x in queued))
+        replies = {}
+        for message in join_messages(queries):
+            asked = [x.strip() for x in message.split(';')]
+            reply = self.keith.query(message).split(';')
+            if len(reply) != len(asked):
+                self.invalidate_shadow()
+                reply = [self.keith.query(x).strip() or None for x in asked]
+            replies.update(zip(asked, reply))
+        # A setting set twice in the batch only has to match the last value
+        last = {':' + x[1].strip().lstrip(':'): x[2] for x in queued}
+        for query, sent in last.items():
+            got = replies.get(query)
+            self.update_shadow('', query, got)
+            if got is None or not same_setting(sent, got):
+                print(f'{query} reads back {got} (sent {sent}).')
+            if got is not None:
+                self.store_reply(query, got.strip())
+        return replies
+
+    def store_reply(self, query: str, reply: str):
+        """Put a setter's query reply in the attribute the setter sets.
+
+        Setters in a transaction store the value they sent; flush_batch()
+        then stores what the instrument read back, so the attributes end up
+        as they would have without batching.
+        """
+        head = query.strip().rstrip('?').lstrip(':').upper()
+        (sub, kind, rest) = (head.split(':', 2) + ['', ''])[:3]
+        auto = reply == '1'
+        if head == 'SOUR:FUNC':
+            self.out_type = get_out_type(reply)
+        elif head == 'FORM:ELEM' and reply.split(',') != self.format_:
+            self.format_ = reply.split(',')
+            self.make_header(list(self.format_))
+        elif head == 'TRAC:POIN':
+            self.num_points = reply
+        elif head == 'SOUR:DEL':
+            self.delay = reply
+        elif head == 'SOUR:DEL:AUTO':
+            self.delay = 'AUTO' if auto else self.delay
+        elif sub == 'SOUR' and kind == 'SWE':
+            key = {'SPAC': 'Type', 'RANG': 'Ranging',
+                   'POIN': 'Points'}.get(rest)
+            if key is not None:
+                self.sweep_params[key] = reply
+        elif sub == 'SOUR' and kind == 'LIST':
+            self.sweep_params['List'] = reply
+        elif sub == 'SOUR' and kind in self.out_val:
+            if not rest:
+                self.out_val[kind] = reply
+            elif rest == 'RANG':
+                self.out_rng[kind] = reply
+            elif rest == 'RANG:AUTO':
+                self.out_rng[kind] = 'AUTO' if auto else self.out_rng[kind]
+            elif rest == 'MODE':
+                self.sweep_params['Enabled'] = reply in ('SWE', 'LIST')
+                if reply == 'LIST':
+                    self.sweep_params['Type'] = reply
+            elif rest in ('STAR', 'STOP'):
+                self.sweep_params['Start' if rest == 'STAR'
+                                  else 'Stop'] = reply
+        elif sub == 'SENS' and kind in self.meas_rng:
+            out = get_out_type(self.out_type)
+            if rest == 'RANG':
+                self.meas_rng[kind] = reply
+            elif rest == 'RANG:AUTO':
+                self.meas_rng[kind] = 'AUTO' if auto else self.meas_rng[kind]
+            elif rest == 'NPLC':
+                self.meas_speed[kind] = reply
+            elif rest == 'PROT' and out in self.compl:
+                self.compl[out] = reply
+
+    def commit_batch(self):
+        """Send the queued commands, verify them and end the batch.
+
+        Returns a dict of each verification query and the instrument's reply.
+        Replies that differ from what was sent (e.g. a range the instrument
+        rounded up) are printed.
+        """
+        if self.batch is None:
+            return {}
+        replies = self.flush_batch()
+        self.batch = None
+        return replies
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Batch all setter commands in a with block into a few writes."""
+        self.begin_batch()
+        try:
+            yield
+        finally:
+            self.commit_batch()
+
+    @contextlib.contextmanager
+    def fast_mode(self, nplc: float = 0.01):
+        """Trade accuracy for speed for the length of a with block.
+
+        Turns autozero, the front panel display and concurrent measurement
+        off, measures only the measure function at nplc power line cycles,
+        and puts all of it back as it was afterwards.  Without autozero the
+        readings drift with temperature, so use it for short, fast runs.
+        """
+        meas = get_out_type(self.meas_type)
+        if meas == 'ERR':
+            print('Please specify a measurement type before using fast mode.')
+            yield
+            return
+        keys = ('SYST:AZER', 'DISP:ENAB', 'SENS:FUNC:CONC', 'SENS:FUNC',
+                f'SENS:{meas}:NPLC')
+        with self.bus:
+            self.get_instrument()
+            saved = dict(zip(keys, (self.keith.query(f':{x}?').strip()
+                                    for x in keys)))
+            self.keith.write(':SYST:AZER OFF; :DISP:ENAB OFF; '
+                             + ':SENS:FUNC:CONC OFF; '
+                             + f':SENS:FUNC "{meas}"; '
+                             + f':SENS:{meas}:NPLC {scpi_number(nplc)};')
+            self.invalidate_shadow()
+        try:
+            yield
+        finally:
+            with self.bus:
+                self.keith.write(
+                    f':SENS:FUNC:CONC {saved["SENS:FUNC:CONC"]}; '
+                    + f':SENS:FUNC:OFF:ALL; :SENS:FUNC {saved["SENS:FUNC"]}; '
+                    + f':SENS:{meas}:NPLC {saved[keys[-1]]}; '
+                    + f':DISP:ENAB {saved["DISP:ENAB"]}; '
+                    + f':SYST:AZER {saved["SYST:AZER"]};')
+                self.invalidate_shadow()
+
+    def fast_start(self, nplc: float = 0.01, prnt: bool = False,
+                   cdl: bool = False, save: bool = True):
+        """Run start() in fast_mode() and report the readings per second.
+
+        Returns the rate measured from the TIME element, or None if it is
+        not in the output format.
+        """
+        self.data = None
+        with self.fast_mode(nplc):
+            self.start(prnt, cdl, save=save)
+        if self.data is None or 'TIME' not in self.data.names:
+            return None
+        rate = reading_rate(self.data)
+        if rate is not None:
+            print(f'{rate:.1f} readings/s')
+        return rate
+
+    def set_gpib(self, gpib: Optional[int] = None):
+        """Set GPIB address of the instrument."""
+        if type(gpib) is not int or gpib not in list(range(1, 30)):
+            prompt = 'Specify the GPIB address of the instrument.'
+            gpib = general_input(prompt=prompt, type_=int, min_=1, max_=30,
+                                 esc=0)
+        if gpib is not None:
+            self.check_connected(gpib)
+
+    def check_connected(self, gpib: int):
+        """See if instrument connected at GPIB address and open comunication.
+        """
+        rm = get_resource_manager()
+        inst_list = [x for x in rm.list_resources()
+                     if 'GPIB' in x and x.split('::')[1] == str(gpib)]
+        try:
+            self.keith = self.metered(rm.open_resource(
+                inst_list[0], read_termination='\n', write_termination='\n'))
+        except IndexError:
+            self.keith = None
+            self.address = None
+            print(f'Instrument is not connected at address {gpib}.')
+        else:
+            self.address = gpib
+            self.invalidate_shadow()
+    #        keith.read_termination = '\n'
+    #        keith.write_termination = '\n'
+            self.keith.write(':SOUR:CLE:AUTO ON; :OUTP:SMOD HIMP; '
+                             + ':SYST:RSEN OFF;')
+            self.keith.timeout = None
+
+    def set_output_type(self, type_str: Optional[str] = None):
+        """Set whether instrument acts as a voltage or current source."""
+        choices = ['volt*', 'cur*']
+        if not test_inclusion(type_str, choices):
+            prompt = "Specify whether you wish to source voltage or current."
+            type_str = general_input(prompt=prompt, type_=str, choices=choices)
+        if test_inclusion(type_str, choices):
+            cmd = (f'SOUR:FUNC {get_out_type(type_str)};')
+            self.out_type = get_out_type(self.write_visa(cmd, 'SOUR:FUNC?'))
+
+    def set_output_range(self, val=None):
+        """Set the instrument range for its output."""
+        out = get_out_type(self.out_type)
+        if out == 'ERR':
+            print('Output type not specified.')
+            return
+        if val is not None and match('auto*', str(val)):
+            self.set_output_autorange(True)
+            return
+        (sort, unit) = (('voltage', 'volts') if out == 'VOLT'
+                        else ('current', 'amps'))
+        prompt = f'Enter your max {sort} output in {unit} (as float).'
+        max_ = 200 if out == 'VOLT' else 1
+        cond = type(val) in (float, int) and 0 < val <= max_
+        if val is None or not cond:
+            val = general_input(prompt=prompt, type_=float, max_=max_, min_=0)
+        cmd = f'SOUR:{out}:RANG {val};'
+        if val is not None:
+            self.out_rng[out] = self.write_visa(cmd, f':SOUR:{out}:RANG?')
+
+    def set_output_autorange(self, enable: Optional[bool] = None):
+        """Enable or disable autorange for the instrument output."""
+        out = get_out_type(self.out_type)
+        if out == 'ERR':
+            print('Output type not specified.')
+            return
+        if enable is None or type(enable) is not bool:
+            prompt = ('Would you like to enable autorange? '
+                      + 'Answer True or False.')
+            enable = general_input(prompt=prompt, type_=bool)
+        if enable is not None:
+            state = 'ON' if enable else 'OFF'
+            cmd = f'SOUR:{out}:RANG:AUTO {state};'
+            enable = self.write_visa(cmd, f'SOUR:{out}:RANG:AUTO?')
+            if enable is not None:
+                self.out_rng[out] = ('AUTO' if strtobool(enable)
+                                     else self.out_rng[out])
+
+    def set_output_val(self, val: Optional[Union[int, float]] = None):
+        """Set fixed output level for voltage (V) or current (A)."""
+        out = get_out_type(self.out_type)
+        if out == 'ERR':
+            print('Please specify an output type before setting an output '
+                  + 'value.')
+            return
+        max_ = max_out[out]
+        if val is None:
+            unit = f'{"V" if match(out, "volt") else "A"}'
+            prompt = f"Specify the output value ({unit})."
+            val = general_input(prompt=prompt, type_=float, min_=-max_,
+                                max_=max_)
+        if val is not None:
+            print(val)
+            cmd = (f"SOUR:{out}:MODE FIX; :SOUR:{out} "
+                   + f"{0 if abs(val) > max_ else val};")
+            self.out_val[out] = self.write_visa(cmd, f'SOUR:{out}?')
+
+    def set_measure_type(self, type_str: Optional[str] = None,
+                         four_wire: Optional[bool] = None):
+        """Set whether instrument will measure current, voltage or resistance.
+        """
+        choices = ['volt*', 'curr*', 'res*']
+        if not test_inclusion(type_str, choices):
+            prompt = ('Specify which parameter you would like to measure '
+                      + '(current, voltage, or resistance).')
+            type_str = general_input(prompt=prompt, type_=str, choices=choices)
+        if self.out_type is None:
+            self.set_output_type()
+        if test_inclusion(type_str, choices) and self.out_type is not None:
+            meas = get_out_type(type_str)
+            out = get_out_type(self.out_type)
+            self.meas_type = meas
+            cmd = ('SENS:FUNC:CONC ON; :SENS:FUNC:OFF:ALL; '
+                   + f':SENS:FUNC "{meas}", "{out}"')
+            cmd += '; :SYST:RSEN ' + ('OFF;' if (four_wire is False
+                                                 or meas != out)
+                                      else 'ON;')
+            if meas == 'RES':
+                # Set resistance auto-sourcing and output compensation on.
+                # If doing manual resistance measurement, will need to set
+                # voltage and current compliance.
+                cmd += '; :SENS:RES:MODE AUTO; OCOM ON;'
+            self.out_val[out] = self.write_visa(cmd, f'SOUR:{out}?')
+
+    def set_compliance(self, val=None):
+        """Set compliance value for either a voltage or current measurement."""
+        out = get_out_type(self.out_type)
+        meas = get_out_type(self.meas_type)
+        if out == 'ERR':
+            print('Output type not specified.')
+            return
+        if out == 'VOLT':
+            max_ = 1.05
+            min_ = 1e-9
+            if val is None or type(val) not in (float, int):
+                prompt = ('Enter your current compliance value in amps '
+                          + '(as float).')
+                val = general_input(prompt=prompt, type_=float, min_=min_,
+                                    max_=max_)
+            else:
+                val = (max_ if val > max_ else min_ if val < min_ else val)
+        elif out == 'CURR':
+            max_ = 210
+            min_ = 200e-6
+            if val is None or type(val) not in (float, int):
+                prompt = ('Enter your voltage compliance value in volts '
+                          + '(as float).')
+                max_ = self.meas_rng['VOLT']
+                val = general_input(prompt=prompt, type_=float, min_=min_,
+                                    max_=max_)
+            else:
+                val = (max_ if val > max_ else min_ if val < min_ else val)
+        cmd = f'SENS:{meas}:PROT {val};'
+        if val is not None:
+            self.compl[out] = self.write_visa(cmd, f'SENS:{meas}:PROT?')
+
+    def set_measure_range(self, val=None):
+        """Set the measurement range for the instrument."""
+        meas = get_out_type(self.meas_type)
+        if meas == 'ERR':
+            print('Measurement type not specified.')
+            return
+        if match('auto*', str(val)):
+            self.set_measure_autorange(True)
+            return
+        max_ = 200 if meas == 'VOLT' else 1 if meas == 'CURR' else 200e6
+        min_ = 0 if (meas == 'VOLT' or 'CURR') else 20
+        cond = type(val) in (float, int) and min_ <= val <= max_
+        if val is None or not cond:
+            (sort, unit) = (('voltage', 'volts') if meas == 'VOLT'
+                            else ('current', 'amps') if meas == 'CURR'
+                            else ('resistance', 'ohms'))
+            prompt = (f'Enter your {sort} measurement range in {unit} '
+                      + '(as float).')
+            val = general_input(prompt=prompt, type_=float, min_=min_,
+                                max_=max_)
+        if val is not None:
+            cmd = f':SENS:{meas}:RANG {val};'
+            self.meas_rng[meas] = self.write_visa(cmd, f'SENS:{meas}:RANG?')
+
+    def set_measure_autorange(self, enable: Optional[bool] = None):
+        """Enable or disable autorange for measurement."""
+        meas = get_out_type(self.meas_type)
+        if meas == 'ERR':
+            print('Measurement type not specified.')
+            return
+        if enable is None or type(enable) is not bool:
+            prompt = ('Would you like to enable autorange? '
+                      + 'Answer True or False.')
+            enable = general_input(prompt=prompt, type_=bool)
+        if enable is not None:
+            state = 'ON' if enable else 'OFF'
+            cmd = f'SENS:{meas}:RANG:AUTO {state};'
+            enable = self.write_visa(cmd, f'SENS:{meas}:RANG:AUTO?')
+            if enable is not None:
+                self.meas_rng[meas] = ('AUTO' if strtobool(enable)
+                                       else self.meas_rng[meas])
+
+    def set_delay(self, val=None):
+        """Set delay between a change in output value and next measurement."""
+        min_ = 0.0
+        max_ = 9999.999
+        cond = (match('auto*', str(val))
+                or ((type(val) in (float, int)) and (min_ <= val <= max_)))
+        if val is None or not cond:
+            prompt = 'Enable auto source delay? Answer True or False.'
+            val = bool(general_input(prompt=prompt, type_=bool))
+            if not val:
+                prompt = 'Enter desired source delay in seconds (as float).'
+                val = general_input(prompt=prompt, type_=float, min_=min_,
+                                    max_=max_)
+        if val is not None:
+            auto = ('ON' if (str(val) == 'True' or match('auto*', str(val)))
+                    else 'OFF')
+            cmd = (f'SOUR:DEL:AUTO {auto};'
+                   + (f' :SOUR:DEL {val};' if auto == 'OFF' else ''))
+            self.delay = self.write_visa(cmd, f'SOUR:DEL?')
+            if self.write_visa('', 'SOUR:DEL:AUTO?') == '1':
+                #  keith.query('SOUR:DEL:AUTO?') == '1':
+                self.delay = 'AUTO'
+
+    def set_ohm_meas_type(self, type_str: Optional[Union[str, int]] = None):
+        """Set the type of resistance measurement to perform."""
+        if type(type_str) is int:
+            type_str = str(type_str)
+        choices = ['two*', '2*', 'four*', '4*', 'six*', '6*']
+        if not test_inclusion(type_str, choices):
+            prompt = ('What type of resistance measurement (two-, four-, or '
+                      'six-wire) would you like to perform?')
+            type_str = general_input(prompt=prompt, type_=str, choices=choices)
+        if test_inclusion(type_str, choices):
+            meas_type = ('Two' if test_inclusion(type_str, ['two*', '2*'])
+                         else 'Four' if test_inclusion(type_str, ['fo*', '4*'])
+                         else 'Six')
+            mode = 'ON' if (meas_type == 'Four' or 'Six') else 'OFF'
+            cmd = f'SYST:RSEN {mode};'
+            if meas_type == 'Six':
+                cmd += '; :SYST:GUAR OHMS;'
+            result = self.write_visa(cmd, 'SYST:RSEN?')
+            if result is not None:
+                self.ohm_meas_type = meas_type
+
+    def set_measure_speed(self, val=None):
+        """Set the measurement integration time for the instrument in PLC."""
+        meas = get_out_type(self.meas_type)
+        max_ = 10
+        min_ = 0.01
+        if meas == 'ERR':
+            print('Measurement type not specified.')
+            return
+        cond = type(val) in (float, int) and min_ <= val <= max_
+        if val is None or not cond:
+            prompt = ('What is your desired integration time in power line '
+                      + 'cycles?')
+            val = general_input(prompt=prompt, type_=float, max_=max_,
+                                min_=min_)
+        if val is not None:
+            cmd = f'SENS:{meas}:NPLC {val};'
+            self.meas_speed[meas] = self.write_visa(cmd, f'SENS:{meas}:NPLC?')
+
+    def set_num_points(self, val: Optional[int] = None):
+        """Set the number of points to measure and set up buffer."""
+        max_ = 2500
+        min_ = 0
+        if type(val) is not int or val not in list(range(min_, max_+1)):
+            prompt = 'How many measurements would you like to take?'
+            val = general_input(prompt=prompt, type_=int, min_=min_, max_=max_)
+        if type(val) is int:
+            cmd = (f':TRAC:FEED:CONT NEV; :TRAC:CLE; POIN {val}; FEED SENS; '
+                   + ':TRAC:TST:FORM ABS; :TRAC:FEED:CONT NEXT; '
+                   + f':ARM:SEQ:COUN 1; :TRIG:COUN {val};')
+            self.num_points = self.write_visa(cmd, ':TRAC:POIN?')
+
+    def set_sweep_output(self, on: Optional[bool] = None,
+                         outpt: Optional[str] = None,
+                         write: bool = False):
+        """Enable or disable sweeping, and if enabled, specify output type."""
+        if on not in (True, False):
+            prompt = 'Would you like to enable a sweep?'
+            on = bool(general_input(prompt=prompt, type_=bool))
+        choices = ['volt*', 'curr*']
+        if not test_inclusion(outpt, choices) and on:
+            prompt = ('Would you like to configure the current or voltage '
+                      + 'source?')
+            outpt = get_out_type(general_input(
+                        prompt=prompt, type_=str, choices=choices))
+        if test_inclusion(outpt, choices) and on:
+            cmd = f':SOUR:{outpt}:MODE {"SWE" if on else "FIX"}'
+            query = f':SOUR:{outpt}:MODE?'
+            if write:
+                resp = self.write_visa(cmd, query)
+                self.sweep_params['Enabled'] = test_inclusion(resp,
+                                                              ['SWE', 'LIST'])
+                self.sweep_params['Output'] = outpt
+                return (outpt, cmd, query)
+            else:
+                return (outpt, cmd, query)
+        else:
+            print('No output mode given. Configuration terminated.')
+            return None
 
+    def set_sweep_type(self, sw_type: Optional[str] = None,
+                       write: bool = False):
+        """Set the type of sweep to perform."""
+        choices = ['lin*', 'log*', 'list*']
+        out = self.sweep_params["Output"]
+        if out is None:
+            print("Please specify an output type (voltage or current) before "
+                  + "setting a sweep type.")
+            return None
+        if not self.sweep_params["Enabled"]:
+            print("Sweep is not enabled, so cannot configure sweep type.")
+            return None
+        if not test_inclusion(sw_type, choices):
+            prompt = ('Would you like to configure a linear, logarithmic, or '
+                      + 'custom sweep?')
+            sw_type = general_input(prompt=prompt, type_=str, choices=choices)
+        if test_inclusion(sw_type, choices):
+            sw_type = ('LIST' if match('list*', sw_type) else 'LIN' if
+                       match('lin*', sw_type) else 'LOG')
+            cmd = (f'SOUR:{out}:MODE LIST' if sw_type == 'LIST' else
+                   f'SOUR:SWE:SPAC {sw_type}')
+            query = (f'SOUR:{out}:MODE?' if sw_type == 'LIST'
+                     else 'SOUR:SWE:SPAC?')
+            if write:
+                self.sweep_params['Type'] = self.write_visa(cmd, query)
+                return (sw_type, cmd, query)
+            else:
+                return (sw_type, cmd, query)
+        else:
+            print('Valid sweep type not provided. Configuration terminated.')
+            return None
 
-def set_sweep_points(num: Optional[int] = None, write: bool = False):
-    """Set the number of points in the sweep."""
-    global sweep_params
-    if type(num) is not int or num not in range(1, 2501):
-        prompt = 'How many measurement points are there in the sweep?'
-        num = general_input(prompt=prompt, type_=int, min_=1, max_=2500)
-    if num is not None:
-        cmd = f':SOUR:SWE:POIN {num}; :TRIG:COUN {num}'
-        query = 'SOUR:SWE:POIN?'
-        if write:
-            sweep_params['Points'] = write_visa(cmd, query)
-            set_num_points(int(sweep_params['Points']))
-            return (num, cmd, query)
+    def set_sweep_range(self, rang: Optional[str] = None, write: bool = False):
+        """Set the output range for the sweep.
+
+        'best' will select the lowest fixed range that will encompas the sweep;
+        'auto' will change the range at any changeover points; and 'fixed' will
+        choose the currently selected range.
+        """
+        choices = ['best*', 'auto*', 'fix*']
+        if not test_inclusion(rang, choices):
+            prompt = 'Would you like best, fixed, or auto ranging?'
+            rang = general_input(prompt=prompt, type_=str, choices=choices)
+        if test_inclusion(rang, choices):
+            rang = ('BEST' if match(rang, 'best*') else 'AUTO' if
+                    match(rang, 'auto*') else 'FIX')
+            cmd = f'SOUR:SWE:RANG {rang}'
+            query = 'SOUR:SWE:RANG?'
+            if write:
+                self.sweep_params['Ranging'] = self.write_visa(cmd, query)
+                return (rang, cmd, query)
+            else:
+                return (rang, cmd, query)
         else:
-            return (num, cmd, query)
-    else:
-        print('Valid number of points not given. Configuration terminated.')
-        return None
+            print('Valid range type not provided. Configuration terminated.')
+            return None
 
+    def set_sweep_start(self, val: Optional[Union[float, int]] = None,
+                        write: bool = False):
+        """Set the sweep start point."""
+        output = self.sweep_params['Output']
+        upbound = max_out.get(output, 'ERR')
+        if upbound == 'ERR':
+            print('Please specify a sweep output type before setting bounds.')
+            return
+        if type(val) not in (float, int) or not -upbound <= val <= upbound:
+            prompt = ('What is the start value for the sweep in '
+                      + f'{output.lower()}s?')
+            val = general_input(prompt=prompt, type_=float, min_=-upbound,
+                                max_=upbound)
+        if val is not None:
+            cmd = f':SOUR:{output}:STAR {val};'
+            query = f'SOUR:{output}:STAR?'
+            if write:
+                self.sweep_params['Start'] = self.write_visa(cmd, query)
+                return (val, cmd, query)
+            else:
+                return (val, cmd, query)
+        else:
+            print('Valid start value not provided. Configuration terminated.')
+            return None
 
-def set_sweep_list(list_: Optional[Union[list, tuple]] = None,
-                   write: bool = False):
-    """Set the output list for a custom sweep and update number of points."""
-    global sweep_params
-    if type(list_) not in (list, tuple):
-        prompt = 'Enter the list of values you would like to source in V or A.'
-        list_ = general_input(prompt=prompt, type_=list)
-    if list_ is not None:
-        text = ', '.join(str(e) for e in list_)
-        cmd = f'SOUR:LIST:{sweep_params["Output"]} ' + text
-        query = f':SOUR:LIST:{sweep_params["Output"]}?'
-        if write:
-            sweep_params['List'] = write_visa(cmd, query)
-            set_sweep_points(num=len(list_), write=True)
-            return (list_, cmd, query)
+    def set_sweep_stop(self, val: Optional[Union[int, float]] = None,
+                       min_: Optional[Union[int, float]] = None,
+                       write: bool = False):
+        """Set the sweep stop point."""
+        output = self.sweep_params['Output']
+        upbound = max_out.get(output, 'ERR')
+        min_ = -upbound if min_ is None else min_
+        if upbound == 'ERR':
+            print('Please specify a sweep output type before setting bounds.')
+            return
+        if type(val) not in (float, int) or not min_ <= val <= upbound:
+            prompt = ('What is the stop value for the swep in '
+                      + f'{output.lower()}s?')
+            val = general_input(prompt=prompt, type_=float, min_=min_,
+                                max_=upbound)
+        if val is not None:
+            cmd = f'SOUR:{output}:STOP {val};'
+            query = f'SOUR:{output}:STOP?'
+            if write:
+                self.sweep_params['Stop'] = self.write_visa(cmd, query)
+                return (val, cmd, query)
+            else:
+                return (val, cmd, query)
         else:
-            return (list_, cmd, query)
-    else:
-        print('Valid list not given. Configuration terminated.')
-        return None
+            print('Valid stop value not provided. Configuration terminated.')
+            return None
 
+    def set_sweep_points(self, num: Optional[int] = None, write: bool = False):
+        """Set the number of points in the sweep."""
+        if type(num) is not int or num not in range(1, 2501):
+            prompt = 'How many measurement points are there in the sweep?'
+            num = general_input(prompt=prompt, type_=int, min_=1, max_=2500)
+        if num is not None:
+            cmd = f':SOUR:SWE:POIN {num}; :TRIG:COUN {num}'
+            query = 'SOUR:SWE:POIN?'
+            if write:
+                self.sweep_params['Points'] = self.write_visa(cmd, query)
+                self.set_num_points(int(self.sweep_params['Points']))
+                return (num, cmd, query)
+            else:
+                return (num, cmd, query)
+        else:
+            print('Valid number of points not given. '
+                  + 'Configuration terminated.')
+            return None
 
-def set_sweep(on=None, outpt=None, sw_type=None, rang=None, start=None,
-              stop=None, points=None, list_=None, useparams: bool = False):
-    """Configure all parts of the sweep in sequence.
+    def set_sweep_list(self, list_: Optional[Union[list, tuple]] = None,
+                       write: bool = False):
+        """Set the output list for a custom sweep and update the point count.
+        """
+        if type(list_) not in (list, tuple):
+            prompt = ('Enter the list of values you would like to source in '
+                      + 'V or A.')
+            list_ = general_input(prompt=prompt, type_=list)
+        if list_ is not None:
+            cmd = '; '.join(list_messages(list_, self.sweep_params['Output']))
+            query = f':SOUR:LIST:{self.sweep_params["Output"]}?'
+            if write:
+                self.sweep_params['List'] = self.write_visa(cmd, query)
+                self.set_sweep_points(num=len(list_), write=True)
+                return (list_, cmd, query)
+            else:
+                return (list_, cmd, query)
+        else:
+            print('Valid list not given. Configuration terminated.')
+            return None
 
-    if useparams is True, use the sweep_params dictionary to set the values.
-    """
-    global sweep_params
-    on = sweep_params["Enabled"] if useparams else on
-    outpt = sweep_params["Output"] if useparams else outpt
-    sw_type = sweep_params['Type'] if useparams else sw_type
-    rang = sweep_params['Ranging'] if useparams else rang
-    start = sweep_params['Start'] if useparams else start
-    stop = sweep_params['Stop'] if useparams else stop
-    points = sweep_params['Points'] if useparams else points
-    list_ = sweep_params['List'] if useparams else list_
-
-    out_tuple = set_sweep_output(on=on, outpt=outpt, write=True)
-    if out_tuple is None or not sweep_params['Enabled']:
-        return
-    type_tuple = set_sweep_type(sw_type=sw_type, write=True)
-    if type_tuple is None:
-        return
-    range_tuple = set_sweep_range(rang=rang, write=True)
-    if range_tuple is None:
-        return
-    if not match(sw_type, 'LIST'):
-        start_tuple = set_sweep_start(val=start, write=True)
-        if start_tuple is None:
+    def set_sweep(self, on=None, outpt=None, sw_type=None, rang=None,
+                  start=None, stop=None, points=None, list_=None,
+                  useparams: bool = False):
+        """Configure all parts of the sweep in sequence.
+
+        if useparams is True, use the sweep_params dictionary to set the
+        values.
+        """
+        on = self.sweep_params["Enabled"] if useparams else on
+        outpt = self.sweep_params["Output"] if useparams else outpt
+        sw_type = self.sweep_params['Type'] if useparams else sw_type
+        rang = self.sweep_params['Ranging'] if useparams else rang
+        start = self.sweep_params['Start'] if useparams else start
+        stop = self.sweep_params['Stop'] if useparams else stop
+        points = self.sweep_params['Points'] if useparams else points
+        list_ = self.sweep_params['List'] if useparams else list_
+
+        out_tuple = self.set_sweep_output(on=on, outpt=outpt, write=True)
+        if out_tuple is None or not self.sweep_params['Enabled']:
             return
-        stop_tuple = set_sweep_stop(val=stop, min_=start_tuple[0], write=True)
-        if stop_tuple is None:
+        type_tuple = self.set_sweep_type(sw_type=sw_type, write=True)
+        if type_tuple is None:
             return
-        points_tuple = set_sweep_points(points=points, write=True)
-        if points_tuple is None:
+        range_tuple = self.set_sweep_range(rang=rang, write=True)
+        if range_tuple is None:
             return
-    else:
-        list_tuple = set_sweep_list(list_=list_, write=True)
-        if list_tuple is None:
+        if not match(sw_type, 'LIST'):
+            start_tuple = self.set_sweep_start(val=start, write=True)
+            if start_tuple is None:
+                return
+            stop_tuple = self.set_sweep_stop(val=stop, min_=start_tuple[0],
+                                             write=True)
+            if stop_tuple is None:
+                return
+            points_tuple = self.set_sweep_points(num=points, write=True)
+            if points_tuple is None:
+                return
+        else:
+            list_tuple = self.set_sweep_list(list_=list_, write=True)
+            if list_tuple is None:
+                return
+
+    def list_params(self, prnt: bool = True):
+        """List values of all user-defined parameters.  Useful for a check."""
+        vars_ = {x: y for x, y in vars(self).items()
+                 if x not in ('batch', 'shadow', 'shadow_enabled', 'bus',
+                              'waiting', 'stopping', '_metrics')}
+        if prnt:
+            pprint.pprint(vars_)
+        return vars_
+
+    def saved_settings(self):
+        """Return the settings stored in columnar data file headers.
+
+        The values are copies, so they stay as they are while a background
+        save is waiting and the next job changes the settings.
+        """
+        return copy.deepcopy({x: y for x, y in self.list_params(False).items()
+                              if x not in ('keith', 'data', 'header')})
+
+    def check_parameters(self):
+        """Verify that all inputs have been set within the program.
+
+        WILL NOT catch if you change all the variables up top without calling
+        set_all_to_globals(), so don't be a moron about that.
+        """
+        params = self.list_params(False)
+        out = get_out_type(params['out_type'])
+        meas = get_out_type(params['meas_type'])
+        out_accept = (out != 'ERR' and params['out_val'][out] is not None
+                      and params['out_rng'][out] is not None
+                      and params['compl'][out] is not None)
+        meas_accept = (meas != 'ERR' and params['meas_rng'][meas] is not None
+                       and params['meas_speed'][meas] is not None
+                       and (params['ohm_meas_type'] is not None
+                            if meas == 'RES' else True))
+        points_accept = params['num_points'] is not None
+        connected = params['keith'] is not None
+        accept = (out_accept and meas_accept and points_accept and connected)
+        if not accept:
+            error = (f'output ok = {out_accept}\n measure ok = {meas_accept}\n'
+                     + f'buffer ok = {points_accept}\n '
+                     + f'connection ok = {connected}.\n'
+                     + 'Please ensure that all necessary parameters are '
+                     + 'set.\n')
+            print(error)
+        return accept
+
+    def set_format(self, data_fmt: Optional[str] = None):
+        """Set output format of the instrument.  Will measure its own output.
+
+        data_fmt chooses how the buffer is transferred: 'ascii' (default),
+        'sreal' (32-bit binary floats) or 'real' (64-bit binary floats).  If
+        not given, the previously selected transfer format is kept.
+        """
+        choices = ['asc*', 'sre*', 'real*']
+        if data_fmt is not None and not test_inclusion(data_fmt, choices):
+            prompt = 'Transfer data as ascii, sreal (32-bit) or real (64-bit)?'
+            data_fmt = general_input(prompt=prompt, type_=str, choices=choices)
+        if test_inclusion(data_fmt, choices):
+            self.data_format = ('ASC' if match('asc*', data_fmt) else 'SREAL'
+                           if match('sre*', data_fmt) else 'REAL,64')
+        out = get_out_type(self.out_type)
+        meas = get_out_type(self.meas_type)
+        # Binary blocks are requested little-endian (SWAP) so NumPy can decode
+        # them on x86 hosts without a byte swap.
+        cmd = (f'FORM:ELEM {out}, {meas}, TIME; '
+               + f':FORM:DATA {self.data_format}; :FORM:BORD SWAP;')
+        self.format_ = self.write_visa(cmd, 'FORM:ELEM?').split(',')
+        self.make_header(list(self.format_))
+        return self.format_
+
+    @locked
+    def read_buffer(self):
+        """Read the trace buffer from the instrument.
+
+        ASCII transfers are returned as the raw comma delimited string.  Binary
+        transfers are decoded straight into a flat float NumPy array.
+        """
+        self.get_instrument()
+        if self.data_format == 'ASC':
+            return self.keith.query(':TRAC:DATA?')
+        dtype = np.dtype('<f8' if self.data_format == 'REAL,64' else '<f4')
+        term = self.keith.read_termination
+        self.keith.read_termination = None
+        try:
+            self.keith.write(':TRAC:DATA?')
+            raw = self.keith.read_raw()
+        finally:
+            self.keith.read_termination = term
+        # The 2400 sends an indefinite length block (#0) ended by the
+        # terminator, so the number of values follows from the length of the
+        # whole message.
+        offset = raw.index(b'#0') + 2
+        return np.frombuffer(raw, dtype=dtype, offset=offset,
+                             count=(len(raw) - offset) // dtype.itemsize)
+
+    def make_header(self, list_: list):
+        """Make a header to write to the data output file."""
+        list_[0] = ('Voltage (V)' if match(list_[0], 'VOLT')
+                    else 'Current (A)' if match(list_[0], 'CURR')
+                    else '')
+        list_[1] = ('Voltage (V)' if match(list_[1], 'VOLT')
+                    else 'Current (A)' if match(list_[1], 'CURR')
+                    else 'Resistance (ohms)' if match(list_[1], 'RES')
+                    else 'Time (s)' if match(list_[1], 'TIME') else '')
+        self.header = ''
+        for x in list_:
+            self.header += (x + '\t')
+        self.header = self.header[:-1]
+        print(self.header)
+
+    def set_all_to_globals(self):
+        """Send commands to set measurement parameters to the global variables.
+
+        Useful if you want to load from a config file (pending) or just modify
+        everything up top, run the program, and skip the prompts.
+        """
+        self.set_gpib(self.address)
+        with self.transaction():
+            self.set_output_type(self.out_type)
+            self.set_output_range(self.out_rng[self.out_type])
+            self.set_output_val(self.out_val[self.out_type])
+            self.set_measure_type(self.meas_type)
+            self.set_delay(self.delay)
+            self.set_compliance(self.compl[self.out_type])
+            self.set_measure_range(self.meas_rng[self.meas_type])
+            if self.meas_type == 'RES':
+                self.set_ohm_meas_type(self.ohm_meas_type)
+            self.set_measure_speed(self.meas_speed[self.meas_type])
+            if self.sweep_params["Enabled"]:
+                self.set_sweep(useparams=True)
+            else:
+                self.set_num_points(self.num_points)
+            self.set_format()
+
+    def save_as(self, name: Optional[str] = None):
+        """Get a file name to save the data to.  Opens a gui window."""
+        title = 'Save data as'
+        filetypes = ['*.txt', '*.csv']
+        if name is not None:
+            self.filename = name
+            print(f'saved as {self.filename}')
+        else:
+            gui = importlib.import_module('easygui')
+            self.filename = gui.filesavebox(title=title, filetypes=filetypes)
+
+    def save_data(self, data: Union[list, str, 'Readings'],
+                  clear_after_save: bool = True):
+        """Save the data to the save file, then maybe reset the file name.
+
+        A file name ending in .col is saved in the binary columnar format,
+        with the instrument settings in its header (see keith2400_storage).
+        Unless summary_levels is empty, a min/max/mean summary pyramid is
+        saved next to the data.
+        """
+        if self.filename is None:
+            self.save_as()
+        write_file(self.filename, data, self.header, self.format_,
+                   self.saved_settings(), self.flush_interval,
+                   self.summary_levels)
+        if clear_after_save:
+            self.filename = None
+            self.clear_data()
+
+    @locked
+    def clear_data(self, mem: int = 0):
+        """Clear the data from the 2400 and recall memory settings.
+
+        mem=0 recalls sink operation, mem=1 recalls 3.1V source operation.
+        """
+        if mem not in (0, 1):
+            raise ValueError('mem must be 0 or 1.')
             return
+        self.get_instrument()
+        self.keith.write(f':outp off; abor; *cls; *RCL {mem}; :TRAC:CLE;')
+        self.invalidate_shadow()
+
+    @locked
+    def clear_buffer(self):
+        """Empty the trace buffer and ready it for the next run.
+
+        Unlike clear_data(), the instrument settings are left alone.
+        """
+        self.get_instrument()
+        self.keith.write(':TRAC:CLE; :TRAC:FEED:CONT NEXT;')
+        self.invalidate_shadow('TRAC')
+
+    def apply_job(self, job: 'Job', last: Optional['Job'] = None):
+        """Configure the instrument for job.
+
+        Only the settings that differ from last (the job the instrument is
+        set up for) are sent, all in one transaction.  Settings that depend
+        on the output or measurement type are sent again if it changes.
+        """
+        def differs(field: str, renew: bool = False):
+            value = getattr(job, field)
+            return value is not None and (renew or last is None
+                                          or value != getattr(last, field))
+
+        new_out = differs('out_type')
+        new_meas = differs('meas_type')
+        self.get_instrument()
+        with self.transaction():
+            if new_out:
+                self.set_output_type(job.out_type)
+            if differs('out_rng', new_out):
+                self.set_output_range(job.out_rng)
+            if differs('out_val', new_out):
+                self.set_output_val(job.out_val)
+            if new_meas:
+                self.set_measure_type(job.meas_type)
+            if differs('delay'):
+                self.set_delay(job.delay)
+            if differs('compl', new_out):
+                self.set_compliance(job.compl)
+            if differs('meas_rng', new_meas):
+                self.set_measure_range(job.meas_rng)
+            if differs('meas_speed', new_meas):
+                self.set_measure_speed(job.meas_speed)
+            if differs('sweep', new_out):
+                if job.sweep.get('Enabled', True):
+                    self.sweep_params.update(job.sweep, Enabled=True)
+                    self.set_sweep(useparams=True)
+                else:
+                    out = get_out_type(self.out_type)
+                    self.write_visa(f':SOUR:{out}:MODE FIX',
+                                    f':SOUR:{out}:MODE?')
+                    self.sweep_params['Enabled'] = False
+            if (differs('num_points', differs('sweep'))
+                    and not self.sweep_params['Enabled']):
+                self.set_num_points(job.num_points)
+            if differs('data_format') or last is None:
+                self.set_format(job.data_format)
+
+    @locked
+    def load_sequence(self, steps: list, repeat: int = 1):
+        """Load a step sequence into source memory, ready for start().
+
+        The readings of all steps land in one buffer, in step order.  The
+        host settings are left as the first step's so the usual checks and
+        output format apply.
+        """
+        messages = compile_sequence(steps, repeat)
+        self.get_instrument()
+        for message in messages:
+            self.keith.write(message)
+        self.invalidate_shadow()
+        first = steps[0]
+        out = get_out_type(first.out_type)
+        meas = 'CURR' if out == 'VOLT' else 'VOLT'
+        (self.out_type, self.meas_type) = (out, meas)
+        self.out_val[out] = first.level
+        for attr, val, kind in ((self.out_rng, first.out_rng, out),
+                                (self.compl, first.compl, out),
+                                (self.meas_rng, first.meas_rng, meas),
+                                (self.meas_speed, first.nplc, meas)):
+            if val is not None:
+                attr[kind] = val
+        if first.delay is not None:
+            self.delay = first.delay
+        self.sweep_params['Enabled'] = False
+        self.num_points = str(len(steps) * repeat)
+        return messages
+
+    @locked
+    def load_cycles(self, start: float, stop: float, points: int,
+                    cycles: int = 1, bidirectional: bool = True):
+        """Load a repeated up (and down) sweep as one run, ready for start().
+
+        The levels of one cycle are sourced as a list and the arm layer
+        repeats it cycles times, so every branch of every cycle lands in one
+        buffer and one file.  split_cycles() separates them again.
+        sweep_params then list the levels of one cycle and the sweep ranging
+        in use, so a later set_all_to_globals() loads that single cycle
+        without prompting.
+        """
+        out = get_out_type(self.out_type)
+        if out == 'ERR':
+            print('Please specify an output type before loading a sweep.')
+            return None
+        levels = cycle_levels(start, stop, points, bidirectional)
+        total = len(levels) * int(cycles)
+        if total > 2500:
+            print(f'{total} points will not fit in the buffer (2500).')
+            return None
+        parts = list_messages(levels, out) + [
+            f':SOUR:{out}:MODE LIST', ':TRAC:FEED:CONT NEV', ':TRAC:CLE',
+            f':TRAC:POIN {total}', ':TRAC:FEED SENS', ':TRAC:FEED:CONT NEXT',
+            f':ARM:SEQ:COUN {int(cycles)}', f':TRIG:COUN {len(levels)}']
+        messages = join_messages(parts)
+        self.get_instrument()
+        for message in messages:
+            self.keith.write(message)
+        self.invalidate_shadow()
+        rang = self.keith.query(':SOUR:SWE:RANG?').strip()
+        self.sweep_params.update(Enabled=True, Type='LIST', Output=out,
+                                 Ranging=rang, Points=len(levels),
+                                 List=np.asarray(levels, float).tolist())
+        self.num_points = str(total)
+        return messages
+
+    def cycle_sweep(self, start: float, stop: float, points: int,
+                    cycles: int = 1, bidirectional: bool = True,
+                    prnt: bool = False, cdl: bool = False,
+                    save: bool = True):
+        """Sweep start to stop (and back) cycles times in one armed run.
+
+        The whole run is configured, checked, measured and saved once, like
+        a single start().  Returns the readings split with split_cycles().
+        """
+        if self.load_cycles(start, stop, points, cycles,
+                            bidirectional) is None:
+            return None
+        self.data = None
+        self.start(prnt, cdl, save=save)
+        if self.data is None:
+            return None
+        return split_cycles(self.data, points, bidirectional)
+
+    def run_waveform(self, values, interval: float = 0.05,
+                     cdl: bool = False):
+        """Source an arbitrary waveform of any length and measure each point.
+
+        values is split into the fewest list sweeps the buffer allows (2500
+        points each).  Each is uploaded with SOUR:LIST and SOUR:LIST:APP and
+        run as soon as the one before has been read.  Returns the readings
+        stitched into one Readings, also kept in data, and the index where
+        each segment starts.  Time stamps carry on across segments as in
+        log_continuous().  Stops early, keeping what was measured, if stop()
+        is called.  sweep_params and num_points are left as they were.
+        """
+        out = get_out_type(self.out_type)
+        if out == 'ERR':
+            print('Please specify an output type before sourcing a waveform.')
+            return None
+        values = np.asarray(values, dtype=float).ravel()
+        if not len(values):
+            print('No values given to source.')
+            return None
+        if not np.all(np.abs(values) <= max_out[out]):
+            print(f'Every value must be finite and within +/-{max_out[out]}.')
+            return None
+        delim = ', ' if cdl else '\t'
+        pieces = []
+        starts = []
+        cols = None
+        last = None
+        offset = 0.0
+        saved = (dict(self.sweep_params), self.num_points)
+        self.waiting = True
+        try:
+            for first in range(0, len(values), 2500):
+                segment = values[first:first + 2500]
+                num = len(segment)
+                parts = list_messages(segment, out) + [
+                    f':SOUR:{out}:MODE LIST', ':TRAC:FEED:CONT NEV',
+                    ':TRAC:CLE', f':TRAC:POIN {num}', ':TRAC:FEED SENS',
+                    ':TRAC:FEED:CONT NEXT', ':ARM:SEQ:COUN 1',
+                    f':TRIG:COUN {num}']
+                with self.bus:
+                    self.get_instrument()
+                    for message in join_messages(parts):
+                        self.keith.write(message)
+                    self.invalidate_shadow()
+                    self.num_points = str(num)
+                    if cols is not None:
+                        armed = time.perf_counter()
+                        self.keith.write('*CLS; :INIT:IMM; *OPC;')
+                if cols is None:
+                    cols = self.arm(wait=False)
+                    if cols is None:
+                        return None
+                    first_arm = armed = time.perf_counter()
+                done = self.wait_complete(interval)
+                with self.bus:
+                    if not done:
+                        self.keith.write('ABOR;')
+                    readings = process_data(data=self.read_buffer(),
+                                            cols=cols, outdelim=delim,
+                                            names=self.format_)
+                (readings, offset) = continue_stamps(
+                    readings, last, offset, armed - first_arm)
+                if len(readings.array):
+                    last = readings.column('TIME')[-1]
+                starts.append(sum(len(x) for x in pieces))
+                pieces.append(readings.array)
+                if not done:
+                    break
+        finally:
+            self.waiting = False
+            (self.sweep_params, self.num_points) = saved
+            with self.bus:
+                if self.keith is not None:
+                    self.keith.write(':OUTP OFF; ABOR; *CLS;')
+        self.data = Readings(np.vstack(pieces), list(self.format_), delim)
+        return (self.data, starts)
+
+    def adaptive_sweep(self, start: float, stop: float, points: int = 21,
+                       tol: float = 0.02, max_points: int = 2500,
+                       passes: int = 8, interval: float = 0.05,
+                       cdl: bool = False):
+        """Sweep the output from start to stop, adding points where needed.
+
+        The first pass measures points levels evenly spaced from start to
+        stop.  Each further pass sources, as a list, only the midpoints
+        refine_points() picks from everything measured so far (steep or
+        bending parts of the curve), the most needed first if they would
+        take the total past max_points.  Passes stop when none are picked,
+        passes run out or max_points have been taken.  Returns the readings
+        sorted by source level, also kept in data.
+        """
+        meas = get_out_type(self.meas_type)
+        if meas == 'ERR':
+            print('Please specify a measurement type before sweeping.')
+            return None
+        if int(points) > max_points:
+            print(f'{points} points is more than max_points ({max_points}).')
+            return None
+        min_step = abs(stop - start) * 1e-6
+        levels = np.empty(0)
+        pieces = []
+        new = np.linspace(start, stop, int(points))
+        for _ in range(passes):
+            if not len(new):
+                break
+            result = self.run_waveform(new, interval, cdl)
+            if result is None:
+                break
+            readings = result[0]
+            levels = np.concatenate((levels, new[:len(readings.array)]))
+            pieces.append(readings.array)
+            if len(readings.array) < len(new):  # Stopped
+                break
+            merged = readings._replace(array=np.vstack(pieces))
+            picked = refine_points(levels, merged.column(meas), tol,
+                                   min_step)
+            new = np.sort(picked[:max(0, max_points - len(levels))])
+        if not pieces:
+            return None
+        order = np.argsort(levels, kind='stable')
+        self.data = readings._replace(array=np.vstack(pieces)[order])
+        return self.data
+
+    def arm(self, wait: bool = True):
+        """Check the setup and trigger the measurement.
+
+        The instrument is set to request service when the run completes
+        (*OPC sets the event status register, *ESE and *SRE pass it on to
+        the status byte), so nothing blocks on the bus while it measures.
+        If wait is True, return only once the run is complete or stopped.
+        Returns the number of columns per reading, or None if not started.
+        """
+        with self.bus:
+            self.get_instrument()
+            buff = int(self.keith.query(':TRAC:POIN:ACT?'))
+            if buff > 0:
+                print('Data points not cleared.')
+                return None
+            if not self.check_parameters():
+                return None
+            cols = len(self.set_format())
+            self.stopping.clear()
+            self.keith.write('ABOR; *CLS; *ESE 1; *SRE 32; :OUTP ON; '
+                             + 'INIT:IMM; *OPC;')
+        if wait:
+            self.wait_complete()
+        return cols
+
+    def wait_complete(self, interval: float = 0.05):
+        """Serial poll the status byte until the run completes.
+
+        The bus is only held for each poll, so other threads may talk to the
+        instrument (or stop() it) in between.  Returns True on completion
+        and False if stop() was called first.
+        """
+        while not self.stopping.is_set():
+            with self.bus:
+                if self.keith.read_stb() & 64:  # Request service (RQS)
+                    return True
+            self.stopping.wait(interval)
+        return False
 
+    @locked
+    def fetch_data(self, cols: int, cdl: bool = False):
+        """Turn off the output and read the whole buffer into data."""
+        delim = ', ' if cdl else '\t'
+        self.output_off()
+        self.data = process_data(data=self.read_buffer(), cols=cols,
+                                 outdelim=delim, names=self.format_)
+        return self.data
+
+    @locked
+    def output_off(self):
+        """Turn off the output and abort the run, keeping the buffer."""
+        self.get_instrument()
+        self.keith.write(':OUTP OFF; ABOR; *CLS;')
+
+    @locked
+    def poll_stream(self, state: StreamState,
+                    timeout: Optional[float] = None):
+        """Poll the buffer once for a stream and decode any new readings.
+
+        Returns (state, readings, ended): the updated state, the readings
+        stored since the last poll (None if there are none) and whether the
+        stream is over, because num_points readings are stored, the run
+        completed with nothing new, or nothing arrived for timeout seconds.
+        """
+        reply = self.keith.query(':TRAC:POIN:ACT?; *ESR?')
+        (count, esr) = reply.split(';')
+        state = state._replace(  # Operation complete
+            done=state.done or bool(int(esr) & 1))
+        if int(float(count)) > state.seen:
+            readings = process_data(data=self.read_buffer(), cols=state.cols,
+                                    outdelim=state.delim, names=self.format_)
+            chunk = readings._replace(array=readings.array[state.seen:])
+            state = state._replace(seen=len(readings.array),
+                                   heard=time.monotonic())
+            return (state, chunk,
+                    state.seen >= int(float(self.num_points)))
+        if state.done:
+            return (state, None, True)
+        if timeout is not None and time.monotonic() - state.heard > timeout:
+            print(f'No readings for {timeout} s; stream ended.')
+            return (state, None, True)
+        return (state, None, False)
+
+    def stream(self, interval: float = 0.1, cdl: bool = False,
+               timeout: Optional[float] = None):
+        """Start the measurement and yield new readings as they are stored.
+
+        The buffer fill is polled every interval seconds, and each time it
+        grows the readings taken since the last poll are yielded as a Readings
+        chunk.  The 2400 cannot read part of its buffer (TRAC:DATA? always
+        sends all of it), so every poll that finds new readings transfers
+        everything stored so far and only the new rows are decoded: over m
+        polls of an n reading run, about n * m / 2 readings cross the bus.
+        Use a binary set_format() and an interval giving a few dozen polls.
+        The stream ends once num_points readings are stored, when the run
+        completes with fewer, when none arrive for timeout seconds, or on
+        stop().  The output is turned off however it ends, even if the
+        generator is abandoned; data holds the run once it is exhausted.
+        """
+        self.waiting = True
+        cols = None
+        fetched = False
+        try:
+            cols = self.arm(wait=False)
+            if cols is None:
+                return
+            state = StreamState(cols, ', ' if cdl else '\t',
+                                heard=time.monotonic())
+            while not self.stopping.wait(interval):
+                (state, chunk, ended) = self.poll_stream(state, timeout)
+                if chunk is not None:
+                    yield chunk
+                if ended:
+                    break
+            self.fetch_data(cols, cdl)
+            fetched = True
+        finally:
+            self.waiting = False
+            if cols is not None and not fetched:
+                self.output_off()
+
+    def start(self, prnt: bool = False, cdl: bool = False, callback=None,
+              interval: float = 0.1, save: bool = True):
+        """Tell the instrument to begin measurement and get the data.
+
+        Maybe print.  cdl indicates whether you would like a comma delimited
+        file (default tab).
+        If callback is given, the buffer is streamed while the measurement
+        runs: each new chunk of Readings is appended to the save file as it
+        arrives and then passed to callback (see stream()).
+        If save is False, the data is only kept in data.
+        """
+        if callback is not None:
+            self.data = None
+            if save:
+                self.save_as(self.filename)
+            writer = None
+            chunks = self.stream(interval, cdl)
+            try:
+                for chunk in chunks:
+                    if (save and writer is None
+                            and not ks.is_columnar(self.filename)):
+                        writer = ks.DataWriter(self.filename, self.header,
+                                               chunk.delim,
+                                               self.flush_interval,
+                                               levels=self.summary_levels)
+                    if writer is not None:
+                        writer.write(chunk)
+                    callback(chunk)
+            finally:
+                chunks.close()
+                if writer is not None:
+                    writer.close()
+            if self.data is None:
+                return
+            if save and writer is None:
+                self.save_data(self.data, False)
+        else:
+            self.waiting = True
+            try:
+                cols = self.arm(wait=False)
+                if cols is None:
+                    return
+                # Wait for completeion of the sweep or user interrupt
+                self.wait_complete()
+                self.fetch_data(cols, cdl)
+            finally:
+                self.waiting = False
+            if save:
+                self.save_as(self.filename)
+                self.save_data(self.data, False)
+        if prnt:
+            print(self.data.to_text())
+
+    def start_stats(self, stats: tuple = ('MEAN', 'SDEV', 'MIN', 'MAX'),
+                    average: Optional[int] = None, interval: float = 0.05):
+        """Measure, but fetch only statistics of the run from the 2400.
+
+        Each statistic (CALC3:FORM MEAN, SDEV, MIN, MAX or PKPK) is worked
+        out by the instrument over the buffer, so a few values cross the bus
+        instead of every reading.  If average is given, each reading is
+        itself the mean of that many conversions (repeating filter, 1 to
+        100).  The readings stay in the buffer; fetch_data(len(format_))
+        still downloads them.  Returns {element: {statistic: value}} for
+        the VOLT, CURR and RES elements of the format.
+        """
+        keys = ('SENS:AVER:TCON', 'SENS:AVER:COUN', 'SENS:AVER')
+        saved = {}
+        self.waiting = True
+        try:
+            if average:
+                with self.bus:
+                    self.get_instrument()
+                    saved = dict(zip(keys, (self.keith.query(f':{x}?').strip()
+                                            for x in keys)))
+                    self.keith.write(':SENS:AVER:TCON REP; '
+                                     + f':SENS:AVER:COUN {int(average)}; '
+                                     + ':SENS:AVER ON;')
+            cols = self.arm(wait=False)
+            if cols is None:
+                return None
+            self.wait_complete(interval)
+            with self.bus:
+                # Statistics follow FORM:DATA like the buffer, so ask for
+                # them as ASCII and put the transfer format back after.
+                reply = self.keith.query('; '.join(
+                    [':FORM:DATA ASC']
+                    + [f':CALC3:FORM {x}; :CALC3:DATA?' for x in stats]))
+        finally:
+            self.waiting = False
+            with self.bus:  # Output off and averaging back, even on errors
+                if self.keith is not None:
+                    self.keith.write(
+                        ':OUTP OFF; ABOR; '
+                        + f':FORM:DATA {self.data_format};'
+                        + ''.join(f' :{x} {y};' for x, y in saved.items()))
+        names = [x for x in self.format_ if x in ('VOLT', 'CURR', 'RES')]
+        values = [np.fromstring(x, sep=',') for x in reply.split(';')]
+        if len(values) != len(stats) or any(len(x) != len(names)
+                                            for x in values):
+            print('Statistics not available; too few readings taken?')
+            return None
+        return {x: {y: float(z[j]) for y, z in zip(stats, values)}
+                for j, x in enumerate(names)}
+
+    def log_continuous(self, total: Optional[int] = None, callback=None,
+                       cdl: bool = False, interval: float = 0.05):
+        """Measure past the 2500 reading buffer until total or stop().
+
+        Each time the buffer is full it is read, cleared and the trigger
+        model re-armed at once; the readings are then decoded and handed to
+        callback while the instrument fills the buffer again, so only one
+        buffer of readings is held at a time.  Without a callback, chunks are
+        appended to the save file as they arrive; the file is only opened
+        once the first readings are in.  Timestamps continue across refills
+        (if the instrument restarts them, they are offset by the host time
+        since the first arm), and the dead time at each re-arm is reported.
+        Returns the number of readings taken and a list of gaps as (reading
+        index, seconds).
+        """
+        if callback is None and self.filename is None:
+            self.save_as()
+        if callback is None and ks.is_columnar(self.filename):
+            print('Columnar files are written whole; log to a text file.')
+            return (0, [])
+        writer = None
+        delim = ', ' if cdl else '\t'
+        count = 0
+        gaps = []
+        last = None
+        step = 0.0
+        offset = 0.0
+        self.waiting = True
+        try:
+            cols = self.arm(wait=False)
+            if cols is None:
+                return (0, [])
+            first_arm = armed = time.perf_counter()
+            more = True
+            while more:
+                more = self.wait_complete(interval)
+                with self.bus:
+                    if not more:
+                        self.keith.write('ABOR;')
+                    raw = self.read_buffer()
+                    rows = (raw.count(',') + 1 if type(raw) is str
+                            else raw.size) // cols
+                    more = more and (total is None or count + rows < total)
+                    if more:
+                        self.keith.write(':TRAC:CLE; :TRAC:FEED:CONT NEXT; '
+                                         + '*CLS; :INIT:IMM; *OPC;')
+                        rearmed = time.perf_counter()
+                readings = process_data(data=raw, cols=cols, outdelim=delim,
+                                        names=self.format_)
+                if total is not None:
+                    readings = readings._replace(
+                        array=readings.array[:total - count])
+                (readings, offset) = continue_stamps(
+                    readings, last, offset, armed - first_arm)
+                stamps = readings.array[:, -1]  # TIME is always last
+                if len(stamps) > 0:
+                    if len(stamps) > 1:
+                        step = np.median(np.diff(stamps))
+                    if last is not None and stamps[0] - last > 2 * step:
+                        gaps.append((count, float(stamps[0] - last)))
+                    last = stamps[-1]
+                    if callback is None:
+                        writer = ks.DataWriter(self.filename, self.header,
+                                               delim, self.flush_interval,
+                                               levels=self.summary_levels)
+                        callback = writer.write
+                    callback(readings)
+                    count += len(stamps)
+                if more:
+                    armed = rearmed
+        finally:
+            self.waiting = False
+            with self.bus:
+                self.keith.write(':OUTP OFF; ABOR; *CLS;')
+            if writer is not None:
+                writer.close()
+        for index, gap in gaps:
+            print(f'Gap of {gap:.4f} s before reading {index}.')
+        return (count, gaps)
+
+    def stop(self, cdl: bool = False):
+        """Halt the instrument's measurement program and grab the data.
+
+        May be called from another thread while start() waits.  start() then
+        fetches and saves the readings taken so far; otherwise they are read
+        into data here, in the set_format() transfer format, binary blocks
+        being decoded straight into the array by read_buffer().
+        """
+        self.stopping.set()
+        with self.bus:
+            self.get_instrument()
+            self.keith.write('ABOR;')
+            if self.waiting or not self.format_:
+                return None
+            return self.fetch_data(len(self.format_), cdl)
+
+
+def run_parallel(instruments: list, task: Union[str, Callable], *args,
+                 **kwargs):
+    """Run a task on several instruments at once, one thread each.
+
+    task is either the name of a Keithley2400 method, e.g. 'start', or a
+    function taking the instrument as its first argument.  Returns the
+    results in the order of instruments; the first exception is raised.
+    """
+    with ThreadPoolExecutor(max_workers=max(len(instruments), 1)) as pool:
+        futures = [pool.submit(getattr(x, task) if type(task) is str
+                               else functools.partial(task, x),
+                               *args, **kwargs) for x in instruments]
+        return [x.result() for x in futures]
 
-def list_params(prnt: bool = True):
-    """List values of all user-defined parameters.  Useful for final check."""
-    globs = globals()
-    keys = list(globs.keys())
-    strings = ['__', '_i', '_oh', '_dh', 'In', 'get', 'set', 'rm', 'visa',
-               'unconnected', 'check', 'save', 'start', 'stop', 'exit',
-               'Out', 'gui', 'match', 'general', 'make', 'quit', 'list',
-               'pprint']
-    remove = list(dict.fromkeys([x for x in keys for y in strings if y in x]))
-    vars_ = {}
-    for x, y in globs.items():
-        if x not in remove:
-            vars_[x] = y
-    if prnt:
-        pprint.pprint(vars_)
-    return vars_
+
+class Job(NamedTuple):
+    """One measurement in a run_jobs() sequence.
+
+    Settings left as None keep the value from the jobs before.  sweep holds
+    sweep_params entries; {'Enabled': False} returns to a fixed output.
+    """
+
+    filename: str
+    out_type: Optional[str] = None
+    out_val: Optional[float] = None
+    out_rng: Optional[Union[float, str]] = None
+    compl: Optional[float] = None
+    meas_type: Optional[str] = None
+    meas_rng: Optional[Union[float, str]] = None
+    meas_speed: Optional[float] = None
+    delay: Optional[float] = None
+    num_points: Optional[int] = None
+    sweep: Optional[dict] = None
+    data_format: Optional[str] = None
+
+
+class Step(NamedTuple):
+    """One step of a source memory sequence (see compile_sequence()).
+
+    Settings left as None keep the value of the step before.  Ranges may be
+    'AUTO'.  nplc applies to every measurement function.
+    """
+
+    out_type: str
+    level: float
+    compl: Optional[float] = None
+    nplc: Optional[float] = None
+    out_rng: Optional[Union[float, str]] = None
+    meas_rng: Optional[Union[float, str]] = None
+    delay: Optional[float] = None
 
 
-def check_parameters():
-    """Verify that all inputs have been set within the program.
+def compile_sequence(steps: list, repeat: int = 1):
+    """Compile steps into SCPI that runs them from source memory.
 
-    WILL NOT catch if you change all the variables up top without calling
-    set_all_to_globals(), so don't be a moron about that.
+    Each step is set up and saved to its own source memory location with
+    SOUR:MEM:SAV, then the memory sweep over all of them is selected with
+    one trigger count of len(steps) * repeat readings, so the sequence runs
+    on the instrument with no host round trips between steps.  Voltage and
+    current are measured at every step.  Returns the messages to write.
     """
-    params = list_params(False)
-    out = get_out_type(params['out_type'])
-    meas = get_out_type(params['meas_type'])
-    out_accept = (out != 'ERR' and params['out_val'][out] is not None
-                  and params['out_rng'][out] is not None
-                  and params['compl'][out] is not None)
-    meas_accept = (meas != 'ERR' and params['meas_rng'][meas] is not None
-                   and params['meas_speed'][meas] is not None
-                   and (params['ohm_meas_type'] is not None if meas == 'RES'
-                        else True))
-    points_accept = params['num_points'] is not None
-    connected = params['keith'] is not None
-    accept = (out_accept and meas_accept and points_accept and connected)
-    if not accept:
-        error = (f'output ok = {out_accept}\n measure ok = {meas_accept}\n'
-                 + f'buffer ok = {points_accept}\n '
-                 + f'connection ok = {connected}.\n'
-                 + 'Please ensure that all necessary parameters are set.\n')
-        print(error)
-    return accept
-
-
-def set_format():
-    """Set output format of the instrument.  Will measure its own output."""
-    global out_type
-    global meas_type
-    global format_
-    out = get_out_type(out_type)
-    meas = get_out_type(meas_type)
-    cmd = f'FORM:ELEM {out}, {meas}, TIME;'
-    format_ = write_visa(cmd, 'FORM:ELEM?').split(',')
-    make_header(format_)
-    return format_
-
-
-def make_header(list_: list):
-    """Make a header to write to the data output file."""
-    global out_type
-    global header
-    list_[0] = ('Voltage (V)' if match(list_[0], 'VOLT')
-                else 'Current (A)' if match(list_[0], 'CURR')
-                else '')
-    list_[1] = ('Voltage (V)' if match(list_[1], 'VOLT')
-                else 'Current (A)' if match(list_[1], 'CURR')
-                else 'Resistance (ohms)' if match(list_[1], 'RES')
-                else 'Time (s)' if match(list_[1], 'TIME') else '')
-    header = ''
-    for x in list_:
-        header += (x + '\t')
-    header = header[:-1]
-    print(header)
-
-
-def set_all_to_globals():
-    """Send commands to set measurement parameters to the global variables.
-
-    Useful if you want to load from a config file (pending) or just modify
-    everything up top, run the program, and skip the prompts.
+    total = len(steps) * repeat
+    if not 0 < len(steps) <= 100:
+        raise ValueError('A sequence must have 1 to 100 steps.')
+    if total > 2500:
+        raise ValueError('A sequence must take at most 2500 readings.')
+    parts = [':SENS:FUNC:CONC ON', ':SENS:FUNC:OFF:ALL',
+             ':SENS:FUNC "VOLT", "CURR"']
+    for loc, step in enumerate(steps, 1):
+        out = get_out_type(step.out_type)
+        meas = 'CURR' if out == 'VOLT' else 'VOLT'
+        parts += [f':SOUR:FUNC {out}', f':SOUR:{out}:MODE FIX']
+        if step.out_rng is not None:
+            parts.append(f':SOUR:{out}:RANG:AUTO ON'
+                         if match('auto*', str(step.out_rng))
+                         else f':SOUR:{out}:RANG {scpi_number(step.out_rng)}')
+        parts.append(f':SOUR:{out} {scpi_number(step.level)}')
+        if step.compl is not None:
+            parts.append(f':SENS:{meas}:PROT {scpi_number(step.compl)}')
+        if step.meas_rng is not None:
+            parts.append(f':SENS:{meas}:RANG:AUTO ON'
+                         if match('auto*', str(step.meas_rng))
+                         else f':SENS:{meas}:RANG '
+                         + scpi_number(step.meas_rng))
+        if step.nplc is not None:
+            parts.append(f':SENS:{meas}:NPLC {scpi_number(step.nplc)}')
+        if step.delay is not None:
+            parts.append(f':SOUR:DEL {scpi_number(step.delay)}')
+        parts.append(f':SOUR:MEM:SAV {loc}')
+    parts += [f':SOUR:MEM:POIN {len(steps)}', ':SOUR:MEM:STAR 1',
+              ':SOUR:FUNC MEM', ':TRAC:FEED:CONT NEV', ':TRAC:CLE',
+              f':TRAC:POIN {total}', ':TRAC:FEED SENS',
+              ':TRAC:TST:FORM ABS', ':TRAC:FEED:CONT NEXT',
+              ':ARM:SEQ:COUN 1', f':TRIG:COUN {total}']
+    return join_messages(parts)
+
+
+def run_jobs(jobs: list, inst: Optional[Keithley2400] = None):
+    """Run measurement jobs back to back on one instrument.
+
+    Each job only sends the settings that differ from the job before, and
+    its data is saved in a background thread while the next job is set up
+    and measured.  Returns the Readings of each job measured.
     """
-    global address
-    global out_type
-    global meas_type
-    global delay
-    global out_val
-    global compl
-    global out_rng
-    global meas_rng
-    global ohm_meas_type
-    global meas_speed
-    global num_points
-    global sweep_params
-    set_gpib(address)
-    set_output_type(out_type)
-    set_output_range(out_rng[out_type])
-    set_output_val(out_val[out_type])
-    set_measure_type(meas_type)
-    set_delay(delay)
-    set_compliance(compl[out_type])
-    set_measure_range(meas_rng[meas_type])
-    if meas_type == 'RES':
-        set_ohm_meas_type(ohm_meas_type)
-    set_measure_speed(meas_speed[meas_type])
-    if sweep_params["Enabled"]:
-        set_sweep(useparams=True)
-    else:
-        set_num_points(num_points)
-    set_format()
-
-
-def save_as(name: Optional[str] = None):
-    """Get a file name to save the data to.  Opens a gui window."""
-    global filename
-    title = 'Save data as'
-    filetypes = ['*.txt', '*.csv']
-    if name is not None:
-        filename = name
-        print(f'saved as {filename}')
-    else:
-        filename = gui.filesavebox(title=title, filetypes=filetypes)
+    inst = instrument if inst is None else inst
+    results = []
+    last = None
+    with ThreadPoolExecutor(max_workers=1) as saver:
+        saves = []
+        for job in jobs:
+            inst.apply_job(job, last)
+            last = job if last is None else last._replace(
+                **{x: y for x, y in job._asdict().items() if y is not None})
+            inst.clear_buffer()
+            inst.start(save=False)
+            if inst.data is None:
+                print(f'{job.filename} was not measured.')
+                continue
+            saves.append(saver.submit(
+                write_file, job.filename, inst.data, inst.header,
+                list(inst.format_), inst.saved_settings(),
+                inst.flush_interval, inst.summary_levels))
+            results.append(inst.data)
+        for x in saves:
+            x.result()
+    return results
 
 
-def save_data(data: Union[list, str], clear_after_save: bool = True):
-    """Save the data to the save file, then reset the file name if desired."""
-    global filename
-    global header
-    if filename is None:
-        save_as()
-    if type(data) is list:
-        data = ''.join(data)
-    with open(filename, 'w+') as file:
-        file.write(header + '\n')
-        if data is not None:
-            file.write(data)
-    if clear_after_save:
-        filename = None
-        clear_data()
-
-
-def process_data(data: Union[list, str], cols: int, indelim: str = ',',
-                 outdelim: str = '\t', prnt: bool = False):
-    """Take raw data from 2400 and process it into a delimited string."""
-    if type(data) is str:
-        data = data.split(indelim)
-    items = len(data)
-    data_rows = [data[j:j+cols] for j in range(0, items) if not j % cols]
-    sdata_rows = [outdelim.join([str(i) for i in j]) for j in data_rows]
-    data_str = '\n'.join(j for j in sdata_rows)
-    data_cols = [data[j::cols] for j in range(0, cols)]
-    if prnt:
-        print(data_str)
-    return data_str, data_cols
+instrument = Keithley2400()  # Default instrument for module-level access
+
 
+def is_setting(name: str):
+    """Test whether name is a setting of the default instrument."""
+    return not name.startswith('_') and (
+        name in vars(instrument)
+        or isinstance(getattr(Keithley2400, name, None), property))
 
-def clear_data(mem: int = 0):
-    """Clear the data from the 2400 and recall memory settings.
 
-    mem=0 recalls sink operation, mem=1 recalls 3.1V source operation.
+def __getattr__(name: str):
+    """Look up what the module does not define on the default instrument.
+
+    Keeps keith2400_logic.set_gpib(), .start() etc. and reads of settings
+    such as keith2400_logic.out_type working as they did when they were
+    module globals.
     """
-    if mem not in (0, 1):
-        raise ValueError('mem must be 0 or 1.')
-        return
-    keith.write(f':outp off; abor; *cls; *RCL {mem}; :TRAC:CLE;')
+    if is_setting(name) or (not name.startswith('_') and callable(
+            getattr(Keithley2400, name, None))):
+        return getattr(instrument, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
-def start(prnt: bool = False, cdl: bool = False):
-    """Tell the instrument to begin measurement and get the data.  Maybe print.
+class InstrumentModule(types.ModuleType):
+    """The module itself: settings assigned to it go to instrument.
 
-    cdl indicates whether you would like a comma delimited file (default tab).
+    keith2400_logic.filename = name sets instrument.filename, so the value
+    read back and the one the run uses are the same.
     """
-    global data
-    buff = int(keith.query(':TRAC:POIN:ACT?'))
-    if buff > 0:
-        print('Data points not cleared.')
-        return
-    accept = check_parameters()
-    if accept:
-        format_ = set_format()
-        cols = len(format_)
-        delim = ', ' if cdl else '\t'
-        cmd = 'ABOR; *CLS;'
-        query = ':OUTP ON; INIT:IMM; *OPC?'
-        write_visa(cmd, query)
-        # Wait for completeion of the sweep or user interrupt
-        cmd = ':OUTP OFF; ABOR; *CLS;'
-        query = ':TRAC:DATA?'
-        output = write_visa(cmd, query)
-        (data, data_cols) = process_data(data=output,
-                                         cols=cols, outdelim=delim, prnt=False)
-        save_as(filename)
-        save_data(data, False)
-        if prnt:
-            print(data)
-
-
-def stop():
-    """Halt the instrument's measurement program and grab the data."""
-    global data
-    global format_
-    cmd = 'ABOR;'
-    query = ':TRAC:DATA?'
-    keith.write('ABOR; *CLS;')
-    # (data, data_cols) = process_data(data=write_visa(cmd, query),
-    #                                  cols=len(format_, prnt=True))
-    # save_data(data)
-
-
-set_gpib(address)
-#  Call *RCL 0 to load sink operation, speed 0.01
-#  Call *RCL 1 to load source operation (3.1V), speed 0.01
-# write_visa(':OUTP:SMOD HIMP', ':OUTP:SMOD?')
-# keith.write('*RCL 0')  # Sink operation
-# keith.write('*RCL 1')  # 3.1V source operation
-set_output_type(v)
-set_output_val(0)
-set_output_range(a)
-set_measure_type(c, False)
-set_delay(0.0)
-set_compliance(30e-3)
-set_measure_range(a)
-set_measure_speed(1)
-set_num_points(2500)
-
-filename = fc2
-
-set_format()
+
+    def __setattr__(self, name: str, value):
+        if name not in vars(self) and is_setting(name):
+            setattr(instrument, name, value)
+        else:
+            super().__setattr__(name, value)
+
+
+def __dir__():
+    """List the module's names and those looked up on instrument."""
+    return sorted(set(globals())
+                  | {x for x in vars(instrument) if not x.startswith('_')}
+                  | {x for x in dir(Keithley2400) if not x.startswith('_')})
+
+
+sys.modules[__name__].__class__ = InstrumentModule
+
+
+def main():
+    """Connect and set up the default IV measurement (source 0 V, measure I).
+
+    Run the module as a script to apply this setup.
+    """
+    instrument.set_gpib(instrument.address)
+    #  Call *RCL 0 to load sink operation, speed 0.01
+    #  Call *RCL 1 to load source operation (3.1V), speed 0.01
+    # write_visa(':OUTP:SMOD HIMP', ':OUTP:SMOD?')
+    # keith.write('*RCL 0')  # Sink operation
+    # keith.write('*RCL 1')  # 3.1V source operation
+    instrument.set_output_type(v)
+    instrument.set_output_val(0)
+    instrument.set_output_range(a)
+    instrument.set_measure_type(c, False)
+    instrument.set_delay(0.0)
+    instrument.set_compliance(30e-3)
+    instrument.set_measure_range(a)
+    instrument.set_measure_speed(1)
+    instrument.set_num_points(2500)
+
+    instrument.filename = fc2
+
+    instrument.set_format()
+
+
+if __name__ == '__main__':
+    main()
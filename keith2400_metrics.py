@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+keith2400_metrics records where the time goes on the bus to a Keithley 2400.
+
+Set a Keithley2400's metrics to a BusMetrics and its VISA resource is
+wrapped in a MeteredResource, so every write, query, read and serial poll
+on it is timed and counted per SCPI command (the headers of the message,
+without their values).  Reads are counted under the command written before
+them, so a buffer download shows up as the bytes of TRAC:DATA?.  Whole
+operations are timed with BusMetrics.timed(), as a with block or as a
+decorator:
+
+    inst.metrics = BusMetrics()
+    with inst.metrics.timed('set_all_to_globals'):
+        inst.set_all_to_globals()
+    inst.metrics.to_csv('bus.csv')
+
+Each record is also passed to every hook, hook(kind, name, seconds, bytes),
+so the figures can be forwarded to a metrics collector as they happen.
+
+classes_
+    BusMetrics(opt array/list)
+    MeteredResource(VISA resource, BusMetrics, opt function)
+
+@author: Sarh Friedensen
+"""
+
+import contextlib
+import csv
+import json
+import threading
+import time
+import numpy as np
+from typing import Callable
+
+edges = np.geomspace(1e-5, 100, 15)  # Latency histogram bin edges in s
+fields = ('kind', 'name', 'count', 'seconds', 'mean', 'max', 'bytes')
+
+
+class BusMetrics:
+    """Counts, times and bytes of bus traffic by command and kind.
+
+    kind is 'write', 'query', 'read' or 'poll' for bus traffic and
+    'operation' for blocks timed with timed().  Query bytes include the
+    reply.
+    """
+
+    def __init__(self, edges=edges):
+        self.edges = np.asarray(edges, dtype=float)
+        self.totals = {}  # (kind, name): [count, seconds, max, bytes]
+        self.counts = {}  # (kind, name): histogram counts per bin
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    def record(self, kind: str, name: str, seconds: float, bytes_: int = 0):
+        """Add one timed write, query or operation and tell the hooks."""
+        with self.lock:
+            total = self.totals.setdefault((kind, name), [0, 0.0, 0.0, 0])
+            total[0] += 1
+            total[1] += seconds
+            total[2] = max(total[2], seconds)
+            total[3] += bytes_
+            counts = self.counts.setdefault(
+                (kind, name), np.zeros(len(self.edges) + 1, dtype=int))
+            counts[np.searchsorted(self.edges, seconds, 'right')] += 1
+        for hook in list(self.hooks):
+            hook(kind, name, seconds, bytes_)
+
+    def add_hook(self, hook: Callable):
+        """Call hook(kind, name, seconds, bytes) for every record."""
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable):
+        """Stop calling hook."""
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    @contextlib.contextmanager
+    def timed(self, name: str):
+        """Time the with block (or decorated function) as an operation."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record('operation', name, time.perf_counter() - start)
+
+    def wrap(self, resource, name: Callable = str):
+        """Return resource wrapped to record its traffic here.
+
+        name turns a message into the command it is counted under.
+        """
+        return MeteredResource(resource, self, name)
+
+    def histogram(self, kind: str, name: str):
+        """Return (counts, edges) of the latencies of one command.
+
+        counts has a bin below the first edge and one above the last.
+        """
+        counts = self.counts.get((kind, name))
+        if counts is None:
+            counts = np.zeros(len(self.edges) + 1, dtype=int)
+        return counts.copy(), self.edges
+
+    def report(self):
+        """Return a row dict per command and kind, most total time first."""
+        with self.lock:
+            rows = [dict(zip(fields, (kind, name, x[0], x[1], x[1] / x[0],
+                                      x[2], x[3])))
+                    for (kind, name), x in self.totals.items()]
+        return sorted(rows, key=lambda x: x['seconds'], reverse=True)
+
+    def to_json(self, name: str):
+        """Save the report and the histograms as JSON."""
+        rows = self.report()
+        for row in rows:
+            row['histogram'] = self.histogram(row['kind'],
+                                              row['name'])[0].tolist()
+        with open(name, 'w') as file:
+            json.dump({'edges': self.edges.tolist(), 'commands': rows}, file,
+                      indent=2)
+
+    def to_csv(self, name: str):
+        """Save the report as CSV, one row per command and kind."""
+        with open(name, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fields)
+            writer.writeheader()
+            writer.writerows(self.report())
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self.lock:
+            self.totals.clear()
+            self.counts.clear()
+
+
+class MeteredResource:
+    """A VISA resource that records its traffic in a BusMetrics.
+
+    Everything other than the bus calls, such as timeout or
+    read_termination, is passed through to the resource, which is kept in
+    resource.
+    """
+
+    def __init__(self, resource, metrics: BusMetrics, name: Callable = str):
+        vars(self).update(resource=resource, metrics=metrics, name=name,
+                          last='(none)')
+
+    def __getattr__(self, attr: str):
+        return getattr(self.resource, attr)
+
+    def __setattr__(self, attr: str, value):
+        if attr in vars(self):
+            vars(self)[attr] = value
+        else:
+            setattr(self.resource, attr, value)
+
+    def write(self, message: str, *args, **kwargs):
+        """Write a message, recording it under its command."""
+        self.last = self.name(message)
+        start = time.perf_counter()
+        sent = self.resource.write(message, *args, **kwargs)
+        self.metrics.record('write', self.last, time.perf_counter() - start,
+                            len(message))
+        return sent
+
+    def query(self, message: str, *args, **kwargs):
+        """Query the instrument, counting the reply bytes too."""
+        self.last = self.name(message)
+        start = time.perf_counter()
+        reply = self.resource.query(message, *args, **kwargs)
+        self.metrics.record('query', self.last, time.perf_counter() - start,
+                            len(message) + len(reply))
+        return reply
+
+    def read(self, *args, **kwargs):
+        """Read a reply, recording it under the last command written."""
+        start = time.perf_counter()
+        reply = self.resource.read(*args, **kwargs)
+        self.metrics.record('read', self.last, time.perf_counter() - start,
+                            len(reply))
+        return reply
+
+    def read_raw(self, *args, **kwargs):
+        """Read raw bytes, recording them under the last command written."""
+        start = time.perf_counter()
+        reply = self.resource.read_raw(*args, **kwargs)
+        self.metrics.record('read', self.last, time.perf_counter() - start,
+                            len(reply))
+        return reply
+
+    def read_stb(self):
+        """Serial poll the status byte."""
+        start = time.perf_counter()
+        stb = self.resource.read_stb()
+        self.metrics.record('poll', '*STB', time.perf_counter() - start, 1)
+        return stb
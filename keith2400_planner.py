@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+keith2400_planner predicts how long a Keithley 2400 run will take.
+
+Each reading costs the trigger overhead, the source and trigger delays, one
+conversion per measured function (three with autozero) of NPLC line cycles
+for every reading a repeating filter averages, the display update and any
+autoranging, and the buffer then has to cross the bus.  The settings that
+change these (autozero, display, measured functions, filter, line
+frequency) are read from the instrument, so a prediction made inside
+fast_mode() is right.  The costs are the parameters in model, nominal 2400
+figures; check() compares a prediction with the TIME column of a measured
+run and folds the ratio into model['scale'], so the model calibrates itself
+on the floor.  plan() turns it around and picks the fastest range and NPLC
+that meet a noise target, using model['noise'], the rms noise at 1 NPLC as
+a fraction of the range.
+
+classes_
+    Plan(NamedTuple)
+
+methods_
+    line_frequency(opt Keithley2400)
+    read_state(opt Keithley2400)
+    reading_noise(float, float)
+    quantize_range(str, float)
+    point_time(opt Keithley2400, opt float)
+    estimate(opt Keithley2400, opt float)
+    plan(float, float, opt Keithley2400, opt float)
+    apply_plan(Plan, opt Keithley2400)
+    check(Readings, opt Keithley2400, opt float, opt bool)
+
+@author: Sarh Friedensen
+"""
+
+import numpy as np
+from typing import NamedTuple, Optional
+import keith2400_logic as k
+
+model = {'trigger': 0.4e-3,  # Seconds of trigger model overhead per reading
+         'auto_delay': 1.0e-3,  # Source delay chosen by SOUR:DEL:AUTO ON
+         'azero_cycles': 2,  # Extra conversions per reading with autozero
+         'display': 0.3e-3,  # Front panel update per reading
+         'autorange': 0.5e-3,  # Range check per function with autorange
+         'query': 1.0e-3,  # Query turnaround before the buffer is sent
+         'byte': 1.0e-6,  # Seconds per byte on the bus (~1 MB/s GPIB)
+         'noise': 5e-6,  # rms noise at 1 NPLC as a fraction of the range
+         'scale': 1.0}  # Measured / modeled time per reading, from check()
+ranges = {'VOLT': (0.21, 2.1, 21, 210),
+          'CURR': (1.05e-6, 10.5e-6, 105e-6, 1.05e-3, 10.5e-3, 105e-3, 1.05),
+          'RES': (21, 210, 2.1e3, 21e3, 210e3, 2.1e6, 21e6, 210e6)}
+value_bytes = {'ASC': 14, 'SREAL': 4, 'REAL,64': 8}  # Per value on the bus
+# Settings that change the time per reading, and their power-on values
+state_keys = ('SYST:AZER', 'DISP:ENAB', 'SENS:FUNC', 'SENS:AVER',
+              'SENS:AVER:COUN', 'SENS:AVER:TCON', 'TRIG:DEL', 'SYST:LFR')
+state_defaults = ('1', '1', '', '0', '10', 'REP', '0', '60')
+
+
+class Plan(NamedTuple):
+    """Fastest measure settings found for a noise target."""
+
+    meas_rng: float
+    meas_speed: float
+    delay: object
+    noise: float
+    point_time: float
+    duration: float
+
+
+def line_frequency(inst: Optional[k.Keithley2400] = None):
+    """Return the line frequency set on the instrument (60 if unknown)."""
+    return float(read_state(inst)['SYST:LFR'])
+
+
+def read_state(inst: Optional[k.Keithley2400] = None):
+    """Return the instrument's timing settings by SCPI header.
+
+    The power-on values are returned if inst is not connected.
+    """
+    inst = k.instrument if inst is None else inst
+    if inst.keith is None:
+        return dict(zip(state_keys, state_defaults))
+    with inst.bus:
+        reply = inst.keith.query('; '.join(f':{x}?' for x in state_keys))
+    return dict(zip(state_keys, (x.strip() for x in reply.split(';'))))
+
+
+def reading_noise(range_: float, nplc: float):
+    """Return the modeled rms noise of one reading on a range at an NPLC."""
+    return model['noise'] * range_ / np.sqrt(max(nplc, 0.01))
+
+
+def quantize_range(kind: str, val: float):
+    """Return the smallest 2400 range of kind that holds val."""
+    for rng in ranges[kind]:
+        if abs(val) <= rng:
+            return rng
+    return ranges[kind][-1]
+
+
+def point_time(inst: Optional[k.Keithley2400] = None,
+               lfreq: Optional[float] = None):
+    """Return the predicted seconds per reading for inst's settings."""
+    inst = k.instrument if inst is None else inst
+    meas = k.get_out_type(inst.meas_type)
+    if meas == 'ERR':
+        print('Measurement type not specified.')
+        return None
+    state = read_state(inst)
+    lfreq = float(state['SYST:LFR']) if lfreq is None else lfreq
+    funcs = max(state['SENS:FUNC'].count('"') // 2, 1)
+    count = (int(state['SENS:AVER:COUN']) if state['SENS:AVER'] == '1'
+             and state['SENS:AVER:TCON'].upper().startswith('REP') else 1)
+    azero = (model['azero_cycles'] if state['SYST:AZER'] == '1' else 0)
+    nplc = float(inst.meas_speed[meas] or 1)
+    delay = (model['auto_delay'] if k.match('auto*', str(inst.delay))
+             else float(inst.delay or 0)) + float(state['TRIG:DEL'])
+    each = (model['trigger'] + delay
+            + funcs * (1 + azero) * count * nplc / lfreq
+            + (model['display'] if state['DISP:ENAB'] == '1' else 0))
+    if k.match('auto*', str(inst.meas_rng[meas])):
+        each += funcs * model['autorange']
+    if (inst.sweep_params['Enabled'] and inst.sweep_params['Type'] != 'LIST'
+            and k.match('auto*', str(inst.sweep_params['Ranging']))):
+        each += model['autorange']
+    return each * model['scale']
+
+
+def estimate(inst: Optional[k.Keithley2400] = None,
+             lfreq: Optional[float] = None):
+    """Return the predicted seconds for a whole run, download included."""
+    inst = k.instrument if inst is None else inst
+    each = point_time(inst, lfreq)
+    if each is None or inst.num_points is None:
+        return None
+    points = int(float(inst.num_points))
+    values = points * len(inst.format_ or ['VOLT', 'CURR', 'TIME'])
+    transfer = (model['query']
+                + values * value_bytes.get(inst.data_format, 14)
+                * model['byte'])
+    return points * each + transfer
+
+
+def plan(noise: float, signal: float,
+         inst: Optional[k.Keithley2400] = None,
+         lfreq: Optional[float] = None):
+    """Return the fastest Plan whose rms reading noise is at most noise.
+
+    signal is the largest magnitude expected of the measured quantity; the
+    smallest range holding it is the quietest, so it needs the fewest line
+    cycles.  The source delay is left as set, since settling depends on the
+    device.  Returns None if even 10 NPLC is too noisy.
+    """
+    inst = k.instrument if inst is None else inst
+    meas = k.get_out_type(inst.meas_type)
+    if meas == 'ERR':
+        print('Measurement type not specified.')
+        return None
+    rng = quantize_range(meas, signal)
+    # Noise falls as 1/sqrt(NPLC), so solve for it from the 1 NPLC noise.
+    nplc = max((reading_noise(rng, 1) / noise) ** 2, 0.01)
+    if nplc > 10:
+        print(f'{noise:g} rms is out of reach on the {rng:g} range.')
+        return None
+    nplc = float(k.scpi_number(np.ceil(nplc * 100) / 100))
+    saved = (inst.meas_rng[meas], inst.meas_speed[meas])
+    (inst.meas_rng[meas], inst.meas_speed[meas]) = (rng, nplc)
+    try:
+        each = point_time(inst, lfreq)
+        duration = estimate(inst, lfreq)
+    finally:
+        (inst.meas_rng[meas], inst.meas_speed[meas]) = saved
+    delay = (inst.delay if inst.delay is None
+             or k.match('auto*', str(inst.delay)) else float(inst.delay))
+    return Plan(rng, nplc, delay, float(reading_noise(rng, nplc)), each,
+                duration)
+
+
+def apply_plan(plan_: Plan, inst: Optional[k.Keithley2400] = None):
+    """Set the measure range and speed (and delay) of a Plan on inst."""
+    inst = k.instrument if inst is None else inst
+    with inst.transaction():
+        inst.set_measure_range(plan_.meas_rng)
+        inst.set_measure_speed(plan_.meas_speed)
+        if plan_.delay is not None:
+            inst.set_delay(plan_.delay)
+
+
+def check(readings: k.Readings, inst: Optional[k.Keithley2400] = None,
+          lfreq: Optional[float] = None, calibrate: bool = True):
+    """Compare the predicted time per reading with a measured run.
+
+    Returns (predicted, measured, measured / predicted) seconds per
+    reading, the measured value being the median step of the TIME column.
+    If calibrate is True, model['scale'] takes up the ratio so later
+    predictions match the run.
+    """
+    inst = k.instrument if inst is None else inst
+    stamps = readings.column('TIME')
+    if len(stamps) < 2:
+        print('At least two readings are needed to check the prediction.')
+        return None
+    predicted = point_time(inst, lfreq)
+    if predicted is None:
+        return None
+    measured = float(np.median(np.diff(stamps)))
+    ratio = measured / predicted
+    if calibrate:
+        model['scale'] *= ratio
+    return (predicted, measured, ratio)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+keith2400_profiles keeps named setups in the 2400's *SAV/*RCL memory.
+
+A profile is a set of Job settings (see keith2400_logic.Job) under a name.
+The first time a profile is used on an instrument it is set up with the
+setters and saved to a free setup memory slot with *SAV; after that,
+switching to it is a single *RCL.  Slots 0 and 1 are left to the
+hand-saved sink and source setups that clear_data() recalls; the others are
+reused least recently used first once they are all taken.  The profiles
+and which slot holds which profile hash on each instrument are kept in a
+JSON index, so they survive between sessions.  The index is kept in the
+user's configuration directory (keith2400/profiles.json under %APPDATA%,
+$XDG_CONFIG_HOME or ~/.config) unless another path is given.
+
+classes_
+    ProfileRegistry(opt str, opt tuple)
+
+methods_
+    default_index()
+    profile_hash(dict)
+
+@author: Sarh Friedensen
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+import keith2400_logic as k
+
+slots = (2, 3, 4)  # Setup memory the registry may overwrite
+
+
+def default_index():
+    """Return the path of the index in the user's configuration directory.
+    """
+    base = (os.environ.get('APPDATA') or os.environ.get('XDG_CONFIG_HOME')
+            or os.path.join(os.path.expanduser('~'), '.config'))
+    return os.path.join(base, 'keith2400', 'profiles.json')
+
+
+def profile_hash(settings: dict):
+    """Return a short hash identifying a set of profile settings."""
+    text = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+class ProfileRegistry:
+    """Named instrument setups and the setup memory slots holding them.
+
+    The registry assumes it owns slots; setups saved there by hand will be
+    overwritten.
+    """
+
+    def __init__(self, path: Optional[str] = None, slots: tuple = slots):
+        self.path = path = default_index() if path is None else path
+        self.slots = tuple(slots)
+        self.profiles = {}  # name: settings
+        self.memory = {}  # address: {slot: {'hash': str, 'used': float}}
+        if os.path.exists(path):
+            with open(path) as file:
+                index = json.load(file)
+            self.profiles = index.get('profiles', {})
+            self.memory = index.get('memory', {})
+
+    def save(self):
+        """Write the index to disk."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                    exist_ok=True)
+        with open(self.path, 'w') as file:
+            json.dump({'profiles': self.profiles, 'memory': self.memory},
+                      file, indent=2)
+
+    def add(self, name: str, job: Optional[k.Job] = None, **settings):
+        """Register a profile from a Job or from Job settings by keyword.
+
+        Replacing a profile's settings changes its hash, so the slot holding
+        the old settings is simply not matched any more.  Settings that are
+        not Job fields raise a TypeError here rather than at recall().
+        """
+        unknown = sorted(set(settings) - set(k.Job._fields))
+        if unknown:
+            raise TypeError(f'Not Job settings: {", ".join(unknown)}.')
+        if job is not None:
+            settings = dict(job._asdict(), **settings)
+        settings.pop('filename', None)
+        self.profiles[name] = {x: y for x, y in settings.items()
+                               if y is not None}
+        self.save()
+        return profile_hash(self.profiles[name])
+
+    def remove(self, name: str):
+        """Forget a profile.  Its slots are reused as they age out."""
+        self.profiles.pop(name, None)
+        self.save()
+
+    def slot_of(self, inst: k.Keithley2400, name: str):
+        """Return the slot holding the profile on inst, or None."""
+        digest = profile_hash(self.profiles[name])
+        for slot, entry in self.memory.get(str(inst.address), {}).items():
+            if entry['hash'] == digest:
+                return int(slot)
+        return None
+
+    def choose_slot(self, inst: k.Keithley2400):
+        """Return a free slot on inst, or the least recently used one."""
+        used = self.memory.get(str(inst.address), {})
+        for slot in self.slots:
+            if str(slot) not in used:
+                return slot
+        return min(self.slots, key=lambda x: used[str(x)]['used'])
+
+    def recall(self, name: str, inst: Optional[k.Keithley2400] = None):
+        """Set inst up as the named profile and return the slot used.
+
+        A profile already in setup memory is recalled with *RCL.  Otherwise
+        it is applied with the setters and saved with *SAV, evicting the
+        least recently used slot if none is free.
+        """
+        inst = k.instrument if inst is None else inst
+        settings = self.profiles[name]
+        slot = self.slot_of(inst, name)
+        if slot is not None:
+            with inst.bus:
+                inst.get_instrument()
+                inst.keith.write(f'ABOR; *RCL {slot};')
+                inst.invalidate_shadow()
+            self.load_settings(inst, settings)
+            inst.set_format(settings.get('data_format'))
+        else:
+            inst.apply_job(k.Job(None, **settings))
+            slot = self.choose_slot(inst)
+            with inst.bus:
+                inst.keith.write(f'*SAV {slot};')
+        self.memory.setdefault(str(inst.address), {})[str(slot)] = {
+            'hash': profile_hash(settings), 'used': time.time()}
+        self.save()
+        return slot
+
+    def load_settings(self, inst: k.Keithley2400, settings: dict):
+        """Copy a recalled profile's settings onto inst's attributes."""
+        out = k.get_out_type(settings.get('out_type', inst.out_type))
+        meas = k.get_out_type(settings.get('meas_type', inst.meas_type))
+        inst.out_type = out
+        inst.meas_type = meas
+        for field, attr, kind in (('out_val', 'out_val', out),
+                                  ('out_rng', 'out_rng', out),
+                                  ('compl', 'compl', out),
+                                  ('meas_rng', 'meas_rng', meas),
+                                  ('meas_speed', 'meas_speed', meas)):
+            if field in settings:
+                getattr(inst, attr)[kind] = settings[field]
+        if 'delay' in settings:
+            inst.delay = settings['delay']
+        sweep = settings.get('sweep')
+        if sweep is not None:
+            inst.sweep_params.update(sweep,
+                                     Enabled=sweep.get('Enabled', True))
+            if inst.sweep_params['Enabled']:
+                inst.num_points = inst.sweep_params.get('Points')
+        if 'num_points' in settings and not inst.sweep_params['Enabled']:
+            inst.num_points = settings['num_points']
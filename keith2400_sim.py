@@ -0,0 +1,714 @@
+# -*- coding: utf-8 -*-
+"""
+keith2400_sim simulates a Keithley 2400 behind the VISA calls keith2400_logic.
+
+The simulated instrument understands the SCPI keith2400_logic sends (SOUR,
+SENS, TRAC, TRIG, ARM, FORM, SOUR:LIST, SOUR:SWE, SOUR:MEM, SENS:AVER and
+CALC3, plus the common commands and serial polls of the status byte) and
+models how long the real 2400 takes: per-message bus latency, bytes on the
+bus, NPLC integration, filter averaging, source delay and buffer fill.  Call
+keith2400_logic.set_backend('sim'), or set the environment variable
+KEITH2400_BACKEND=sim, to have keith2400_logic use it.
+
+By default waits are skipped instead of slept, so a blocking *OPC? (or a
+serial poll waiting for the end of a run) returns at once with the
+simulated clock advanced to the end of the run.  Elapsed wall time still
+advances the clock, so polling the buffer sees it fill.
+Pass realtime=True to sleep for every modeled delay instead.
+
+classes_
+    ResourceManager(opt dict/list, opt bool)
+    Simulated2400(opt float, opt bool, opt int)
+
+methods_
+    short_form(str)
+    normalize_header(str)
+    point_time(float, opt int, opt float, opt bool, opt bool, opt bool,
+               opt float, opt int)
+    reading_noise(float, float)
+    quantize_range(str, float)
+
+@author: Sarh Friedensen
+"""
+
+import contextlib
+import functools
+import time
+import numpy as np
+from typing import Optional, Union
+
+timing = {'write': 0.5e-3,  # Seconds to send and parse one message
+          'query': 1.0e-3,  # Seconds of query turnaround before the reply
+          'byte': 1.0e-6,  # Seconds per byte on the bus (~1 MB/s GPIB)
+          'trigger': 0.4e-3,  # Trigger model overhead per reading
+          'auto_delay': 1.0e-3,  # Source delay chosen by SOUR:DEL:AUTO ON
+          'azero_cycles': 2,  # Extra conversions per reading with autozero
+          'display': 0.3e-3,  # Front panel update per reading
+          'autorange': 0.5e-3}  # Range check per function with autorange
+
+ranges = {'VOLT': (0.21, 2.1, 21, 210),
+          'CURR': (1.05e-6, 10.5e-6, 105e-6, 1.05e-3, 10.5e-3, 105e-3, 1.05),
+          'RES': (21, 210, 2.1e3, 21e3, 210e3, 2.1e6, 21e6, 210e6)}
+elements = ('VOLT', 'CURR', 'RES', 'TIME', 'STAT')  # Fixed 2400 data order
+optional_nodes = ('SEQ', 'SEQ1', 'IMM', 'LEV', 'AMPL', 'DC')
+booleans = (':AUTO', ':CONC', ':RSEN', ':AZER', ':ENAB', ':OCOM', 'OUTP',
+            ':AVER')
+integers = ('TRAC:POIN', 'TRIG:COUN', 'ARM:COUN', 'SOUR:SWE:POIN',
+            'SOUR:MEM:POIN', 'SOUR:MEM:STAR', 'SENS:AVER:COUN',
+            'SYST:LFR')
+statistics = {'MEAN': np.mean, 'SDEV': functools.partial(np.std, ddof=1),
+              'MAX': np.max, 'MIN': np.min, 'PKPK': np.ptp}  # CALC3:FORM
+max_points = 2500
+max_memory = 100  # Source memory locations
+max_list_values = 100  # Values one SOUR:LIST command may carry
+
+defaults = {'SOUR:FUNC': 'VOLT', 'SOUR:VOLT:MODE': 'FIX',
+            'SOUR:CURR:MODE': 'FIX', 'SOUR:VOLT': '0', 'SOUR:CURR': '0',
+            'SOUR:VOLT:RANG': '21', 'SOUR:VOLT:RANG:AUTO': '1',
+            'SOUR:CURR:RANG': '105E-6', 'SOUR:CURR:RANG:AUTO': '1',
+            'SOUR:VOLT:STAR': '0', 'SOUR:VOLT:STOP': '0',
+            'SOUR:CURR:STAR': '0', 'SOUR:CURR:STOP': '0',
+            'SOUR:SWE:SPAC': 'LIN', 'SOUR:SWE:RANG': 'BEST',
+            'SOUR:SWE:POIN': '2500', 'SOUR:LIST:VOLT': '0',
+            'SOUR:LIST:CURR': '0', 'SOUR:MEM:POIN': '1',
+            'SOUR:MEM:STAR': '1', 'SOUR:DEL': '0', 'SOUR:DEL:AUTO': '1',
+            'SOUR:CLE:AUTO': '0', 'SENS:FUNC:CONC': '1',
+            'SENS:VOLT:PROT': '21', 'SENS:CURR:PROT': '105E-6',
+            'SENS:VOLT:RANG': '21', 'SENS:CURR:RANG': '105E-6',
+            'SENS:RES:RANG': '210E3', 'SENS:VOLT:RANG:AUTO': '0',
+            'SENS:CURR:RANG:AUTO': '0', 'SENS:RES:RANG:AUTO': '1',
+            'SENS:VOLT:NPLC': '1', 'SENS:CURR:NPLC': '1',
+            'SENS:RES:NPLC': '1', 'SENS:RES:MODE': 'MAN',
+            'SENS:RES:OCOM': '0', 'SYST:RSEN': '0', 'SYST:GUAR': 'CABL',
+            'SYST:AZER': '1', 'SYST:LFR': '60', 'DISP:ENAB': '1',
+            'OUTP': '0', 'OUTP:SMOD': 'NORM', 'FORM:ELEM': 'VOLT,CURR,RES,'
+            'TIME,STAT', 'FORM:DATA': 'ASC', 'FORM:BORD': 'NORM',
+            'TRAC:POIN': '100', 'TRAC:FEED': 'SENS', 'TRAC:FEED:CONT': 'NEV',
+            'TRAC:TST:FORM': 'ABS', 'ARM:COUN': '1', 'TRIG:COUN': '1',
+            'TRIG:DEL': '0', 'SENS:AVER': '0', 'SENS:AVER:COUN': '10',
+            'SENS:AVER:TCON': 'REP', 'CALC3:FORM': 'MEAN', '*ESE': '0',
+            '*SRE': '0'}
+
+
+def short_form(node: str):
+    """Return the SCPI short form of a header node, e.g. DELAY -> DEL."""
+    node = node.upper()
+    stem = node.rstrip('0123456789')
+    suffix = node[len(stem):]
+    if len(stem) > 4:
+        stem = stem[:3] if stem[3] in 'AEIOU' else stem[:4]
+    return stem + suffix
+
+
+def normalize_header(head: str):
+    """Reduce a full header to short forms without optional nodes."""
+    nodes = [short_form(x) for x in head.strip(':').split(':') if x]
+    return ':'.join(x for x in nodes if x not in optional_nodes)
+
+
+def point_time(nplc: float, funcs: int = 1, delay: float = 0.0,
+               azero: bool = True, display: bool = True,
+               autorange: bool = False, lfreq: float = 60, count: int = 1):
+    """Return the seconds one reading takes in the 2400 trigger model.
+
+    count is the number of conversions a repeating filter averages.
+    """
+    conversions = (funcs * (1 + (timing['azero_cycles'] if azero else 0))
+                   * count)
+    return (timing['trigger'] + delay + conversions * nplc / lfreq
+            + (timing['display'] if display else 0)
+            + (funcs * timing['autorange'] if autorange else 0))
+
+
+def reading_noise(range_: float, nplc: float):
+    """Return the rms noise of one reading on a range at an NPLC."""
+    return 5e-6 * range_ / np.sqrt(max(nplc, 0.01))
+
+
+def quantize_range(kind: str, val: float):
+    """Return the smallest 2400 range of kind that holds val."""
+    for rng in ranges[kind]:
+        if abs(val) <= rng:
+            return rng
+    return ranges[kind][-1]
+
+
+def format_number(val: Union[str, float]):
+    """Format a number the way the 2400 sends it in ASCII."""
+    return f'{float(val):+.6E}'
+
+
+class Simulated2400:
+    """A simulated Keithley 2400 with the VISA resource interface.
+
+    load is the resistance of the simulated device under test in ohms.
+    """
+
+    def __init__(self, load: float = 1e3, realtime: bool = False,
+                 seed: Optional[int] = None):
+        self.load = load
+        self.realtime = realtime
+        self.rng = np.random.default_rng(seed)
+        self.read_termination = '\n'
+        self.write_termination = '\n'
+        self.timeout = None
+        self.resource_name = None
+        self.stats = {'writes': 0, 'queries': 0, 'bytes': 0}
+        self._t0 = time.perf_counter()
+        self._skipped = 0.0
+        self._output = b''
+        self._path = ''
+        self.setups = {}
+        self.memory = {}  # Source memory: location: (settings, funcs)
+        self.reset()
+
+    # Clock
+
+    def now(self):
+        """Return the simulated seconds since the instrument started."""
+        return time.perf_counter() - self._t0 + self._skipped
+
+    def spend(self, seconds: float):
+        """Let seconds pass, by sleeping or by advancing the clock."""
+        if seconds <= 0:
+            return
+        if self.realtime:
+            time.sleep(seconds)
+        else:
+            self._skipped += seconds
+
+    # Instrument state
+
+    def reset(self):
+        """Return to the *RST state, clearing the buffer and any run."""
+        self.settings = dict(defaults)
+        self.funcs = ['CURR']
+        self.errors = []
+        self.esr = 0  # Standard event status register
+        self.opc_pending = False  # *OPC sent, waiting for the run to end
+        self.buffer = np.empty((0, len(elements)))
+        self.run = None
+        self.stamp_zero = self.now()
+
+    def get(self, head: str, default=None):
+        """Return a stored setting as a string."""
+        return self.settings.get(head, default)
+
+    def getf(self, head: str):
+        """Return a stored setting as a float."""
+        return float(self.settings[head])
+
+    def error(self, code: int, msg: str):
+        """Queue an error for SYST:ERR?."""
+        self.errors.append(f'{code},"{msg}"')
+
+    # Bus interface
+
+    def write(self, message: str):
+        """Receive one message from the host."""
+        self.stats['writes'] += 1
+        self.stats['bytes'] += len(message)
+        self.spend(timing['write'] + len(message) * timing['byte'])
+        replies = []
+        self._path = ''
+        for segment in split_message(message):
+            reply = self.execute(segment)
+            if reply is not None:
+                replies.append(reply)
+        if replies:
+            if all(type(x) is bytes for x in replies) and len(replies) == 1:
+                self._output = replies[0] + b'\n'
+            else:
+                text = ';'.join(x.decode('latin-1') if type(x) is bytes
+                                else x for x in replies)
+                self._output = (text + '\n').encode('latin-1')
+        return len(message)
+
+    def read_raw(self, size: Optional[int] = None):
+        """Return the pending reply, including the terminator."""
+        self.stats['queries'] += 1
+        self.stats['bytes'] += len(self._output)
+        self.spend(timing['query'] + len(self._output) * timing['byte'])
+        (raw, self._output) = (self._output, b'')
+        if not raw:
+            self.error(-420, 'Query UNTERMINATED')
+        return raw
+
+    def read(self):
+        """Return the pending reply as text without the terminator."""
+        text = self.read_raw().decode('latin-1')
+        term = self.read_termination or ''
+        return text[:-len(term)] if term and text.endswith(term) else text
+
+    def query(self, message: str):
+        """Write a query and read its reply."""
+        self.write(message)
+        return self.read()
+
+    def query_binary_values(self, message: str, datatype: str = 'f',
+                            is_big_endian: bool = False, container=list,
+                            data_points: int = -1, **kwargs):
+        """Write a query and decode its #0 binary block."""
+        self.write(message)
+        raw = self.read_raw()
+        offset = raw.index(b'#0') + 2
+        dtype = np.dtype(('>' if is_big_endian else '<') + datatype)
+        count = (len(raw) - offset) // dtype.itemsize
+        values = np.frombuffer(raw, dtype=dtype, offset=offset, count=count)
+        return values if container in (np.array, np.ndarray) else container(
+            values.tolist())
+
+    def read_stb(self):
+        """Serial poll: return the status byte without using the parser."""
+        self.stats['queries'] += 1
+        self.spend(timing['query'])
+        if not self.realtime:
+            self.wait()
+        self.advance()
+        stb = 4 if self.errors else 0  # Error queue bit (EAV)
+        if self.esr & int(self.getf('*ESE')):
+            stb |= 32  # Event summary bit (ESB)
+        if stb & int(self.getf('*SRE')):
+            stb |= 64  # Request service (RQS/MSS)
+        return stb
+
+    def clear(self):
+        """Device clear: drop pending output and abort any run."""
+        self._output = b''
+        self.abort()
+
+    def close(self):
+        """Close the session."""
+        self._output = b''
+
+    # SCPI execution
+
+    def execute(self, segment: str):
+        """Run one command or query.  Returns the reply for queries."""
+        (head, _, value) = segment.strip().partition(' ')
+        is_query = head.endswith('?')
+        head = head.rstrip('?').upper()
+        if head.startswith('*'):
+            return self.common(head, value.strip(), is_query)
+        if head.startswith(':'):
+            head = head[1:]
+        else:
+            head = self._path + head
+        self._path = head[:head.rfind(':') + 1]
+        head = normalize_header(head)
+        value = ','.join(x.strip() for x in value.split(','))
+        if is_query:
+            return self.answer(head, value)
+        self.command(head, value)
+        return None
+
+    def common(self, head: str, value: str, is_query: bool):
+        """Run an IEEE 488.2 common command."""
+        if head == '*RST':
+            self.abort()
+            self.reset()
+        elif head == '*CLS':
+            self.errors.clear()
+            self.esr = 0
+            self.opc_pending = False
+        elif head == '*SAV':
+            self.setups[int(value)] = (dict(self.settings), list(self.funcs))
+        elif head == '*RCL':
+            self.abort()
+            (settings, funcs) = self.setups.get(int(value),
+                                                (defaults, ['CURR']))
+            self.settings = dict(settings)
+            self.funcs = list(funcs)
+        elif head == '*OPC' and is_query:
+            self.wait()
+            return '1'
+        elif head == '*OPC':
+            self.opc_pending = True
+            if self.run is None:
+                self.complete()
+        elif head == '*ESR' and is_query:
+            (esr, self.esr) = (self.esr, 0)
+            return str(esr)
+        elif head == '*IDN' and is_query:
+            return 'KEITHLEY INSTRUMENTS INC.,MODEL 2400,0000000,C32 (sim)'
+        elif head == '*WAI':
+            self.wait()
+        elif is_query:
+            return self.settings.get(head, '0')
+        elif value:
+            self.settings[head] = value
+        return None
+
+    def command(self, head: str, value: str):
+        """Apply a setting or action."""
+        self.advance()
+        kind = head.split(':')[1] if head.count(':') > 0 else ''
+        if head == 'ABOR':
+            self.abort()
+        elif head == 'INIT':
+            self.initiate()
+        elif head.startswith('SOUR:LIST:'):
+            values = value.split(',')
+            append = head.endswith(':APP')
+            head = head[:-4] if append else head
+            if len(values) > max_list_values:
+                self.error(-223, 'Too much data')
+                return
+            if append:
+                values = self.get(head, '').split(',') + values
+            if len(values) > max_points:
+                self.error(-223, 'Too much data')
+                return
+            self.settings[head] = ','.join(values)
+        elif head == 'SOUR:MEM:SAV':
+            loc = int(self.number(value, 0))
+            if not 1 <= loc <= max_memory:
+                self.error(-222, 'Data out of range')
+                return
+            self.memory[loc] = (dict(self.settings), list(self.funcs))
+        elif head == 'TRAC:CLE':
+            self.buffer = self.buffer[:0]
+        elif head == 'SENS:FUNC:OFF:ALL':
+            self.funcs = []
+        elif head in ('SENS:FUNC', 'SENS:FUNC:ON'):
+            for func in value.split(','):
+                func = normalize_header(func.strip('"\''))
+                if func and func not in self.funcs:
+                    self.funcs.append(func)
+            if self.get('SENS:FUNC:CONC') == '0':
+                self.funcs = self.funcs[-1:]
+        elif head == 'SENS:FUNC:OFF':
+            for func in value.split(','):
+                func = normalize_header(func.strip('"\''))
+                if func in self.funcs:
+                    self.funcs.remove(func)
+        elif head.endswith(':RANG') and kind in ranges:
+            rng = quantize_range(kind, self.number(value, 0))
+            self.settings[head] = str(rng)
+            self.settings[head + ':AUTO'] = '0'
+        elif head == 'SENS:AVER:COUN':
+            num = int(self.number(value, 10))
+            if not 1 <= num <= 100:
+                self.error(-222, 'Data out of range')
+                num = min(max(num, 1), 100)
+            self.settings[head] = str(num)
+        elif head in ('TRAC:POIN', 'TRIG:COUN', 'ARM:COUN',
+                      'SOUR:SWE:POIN'):
+            num = int(self.number(value, 1))
+            if not 1 <= num <= max_points:
+                self.error(-222, 'Data out of range')
+                num = min(max(num, 1), max_points)
+            self.settings[head] = str(num)
+        elif head.startswith('SENS:') and head.endswith(':NPLC'):
+            # Integration time is shared by all measurement functions.
+            nplc = min(max(self.number(value, 1), 0.01), 10)
+            for func in ('VOLT', 'CURR', 'RES'):
+                self.settings[f'SENS:{func}:NPLC'] = str(nplc)
+        elif head == 'FORM:ELEM':
+            chosen = [normalize_header(x) for x in value.split(',')]
+            self.settings[head] = ','.join(x for x in elements
+                                           if x in chosen)
+        elif head == 'FORM:DATA':
+            self.settings[head] = ('ASC' if value.startswith('ASC') else
+                                   'SREAL' if value.startswith('SRE') else
+                                   'REAL,64')
+        elif value:
+            value = value.upper() if '"' not in value else value
+            self.settings[head] = {'ON': '1', 'OFF': '0'}.get(value, value)
+        else:
+            self.error(-113, 'Undefined header')
+
+    def answer(self, head: str, value: str = ''):
+        """Return the reply to a query."""
+        self.advance()
+        if head == 'TRAC:POIN:ACT':
+            return str(len(self.buffer))
+        if head == 'TRAC:DATA':
+            return self.buffer_data()
+        if head == 'SYST:ERR':
+            return self.errors.pop(0) if self.errors else '0,"No error"'
+        if head == 'SENS:FUNC':
+            return ','.join(f'"{x}:DC"' if x != 'RES' else '"RES"'
+                            for x in self.funcs)
+        if head.startswith('SOUR:LIST:') and head.endswith(':POIN'):
+            return str(len(self.get(head[:-5], '').split(',')))
+        if head == 'CALC3:DATA':
+            return self.statistic()
+        if head not in self.settings:
+            self.error(-113, 'Undefined header')
+            return ''
+        val = self.settings[head]
+        if head.startswith('SOUR:LIST:'):
+            return ','.join(format_number(x) for x in val.split(','))
+        try:
+            float(val)
+        except ValueError:
+            return val
+        if head.endswith(booleans) or head in integers:
+            return str(int(float(val)))
+        return format_number(val)
+
+    def number(self, value: str, default: float):
+        """Parse a numeric parameter, accepting MIN, MAX and DEF."""
+        try:
+            return float(value)
+        except ValueError:
+            return {'MIN': 0.0, 'MAX': 1e9}.get(value.upper(), default)
+
+    # Trigger model
+
+    def source_values(self):
+        """Return the source levels the trigger model steps through."""
+        out = self.get('SOUR:FUNC')
+        mode = self.get(f'SOUR:{out}:MODE')
+        if mode == 'LIST':
+            return np.array([float(x) for x in
+                             self.get(f'SOUR:LIST:{out}').split(',')])
+        if mode == 'SWE':
+            start = self.getf(f'SOUR:{out}:STAR')
+            stop = self.getf(f'SOUR:{out}:STOP')
+            num = int(self.getf('SOUR:SWE:POIN'))
+            if self.get('SOUR:SWE:SPAC') == 'LOG' and start * stop > 0:
+                return np.geomspace(start, stop, num)
+            return np.linspace(start, stop, num)
+        return np.array([self.getf(f'SOUR:{out}')])
+
+    def point_durations(self, count: int):
+        """Return how long each reading of a run takes."""
+        funcs = len(self.funcs) or 1
+        nplc = max((self.getf(f'SENS:{x}:NPLC') for x in self.funcs),
+                   default=1.0)
+        delay = (timing['auto_delay'] if self.get('SOUR:DEL:AUTO') == '1'
+                 else self.getf('SOUR:DEL')) + self.getf('TRIG:DEL')
+        autorange = any(self.get(f'SENS:{x}:RANG:AUTO') == '1'
+                        for x in self.funcs)
+        each = point_time(nplc, funcs, delay,
+                          self.get('SYST:AZER') == '1',
+                          self.get('DISP:ENAB') == '1', autorange,
+                          self.getf('SYST:LFR'),
+                          self.filter_count(repeating=True))
+        out = self.get('SOUR:FUNC')
+        if (self.get(f'SOUR:{out}:MODE') == 'SWE'
+                and self.get('SOUR:SWE:RANG') == 'AUTO'):
+            each += timing['autorange']  # Source range picked every point
+        return np.full(count, each)
+
+    def initiate(self):
+        """Start the trigger model."""
+        if self.run is not None:
+            self.error(-213, 'Init ignored')
+            return
+        count = int(self.getf('ARM:COUN') * self.getf('TRIG:COUN'))
+        if count > max_points:
+            self.error(-222, 'Data out of range')
+            count = max_points
+        if self.get('SOUR:FUNC') == 'MEM':
+            steps = self.memory_steps(count)
+            levels = np.empty(count)
+            durations = np.empty(count)
+            for loc in np.unique(steps):
+                with self.recalled(loc):
+                    levels[steps == loc] = self.source_values()[0]
+                    durations[steps == loc] = self.point_durations(1)[0]
+        else:
+            steps = None
+            durations = self.point_durations(count)
+            levels = np.resize(self.source_values(), count)
+        self.run = {'levels': levels, 'steps': steps,
+                    'times': self.now() + np.cumsum(durations),
+                    'done': 0}
+        if self.get('SOUR:CLE:AUTO') == '1':
+            self.settings['OUTP'] = '1'
+
+    def memory_steps(self, count: int):
+        """Return the source memory location used for each point."""
+        start = int(self.getf('SOUR:MEM:STAR'))
+        num = int(self.getf('SOUR:MEM:POIN'))
+        return start + np.arange(count) % num
+
+    @contextlib.contextmanager
+    def recalled(self, loc: int):
+        """Use the setup saved in a source memory location for a while."""
+        if loc not in self.memory:
+            self.error(-222, 'Data out of range')
+            yield
+            return
+        saved = (self.settings, self.funcs)
+        (settings, funcs) = self.memory[loc]
+        (self.settings, self.funcs) = (dict(settings), list(funcs))
+        try:
+            yield
+        finally:
+            (self.settings, self.funcs) = saved
+
+    def measure(self, levels: np.ndarray, stamps: np.ndarray,
+                steps: Optional[np.ndarray] = None):
+        """Return readings of the simulated load at the source levels.
+
+        steps gives the source memory location of each point, if any.
+        """
+        if steps is not None:
+            rows = np.empty((len(levels), len(elements)))
+            for loc in np.unique(steps):
+                with self.recalled(loc):
+                    rows[steps == loc] = self.measure(levels[steps == loc],
+                                                      stamps[steps == loc])
+            return rows
+        out = self.get('SOUR:FUNC')
+        if out == 'VOLT':
+            limit = self.getf('SENS:CURR:PROT')
+            curr = np.clip(levels / self.load, -limit, limit)
+            volt = np.where(np.abs(levels / self.load) > limit,
+                            curr * self.load, levels)
+        else:
+            limit = self.getf('SENS:VOLT:PROT')
+            volt = np.clip(levels * self.load, -limit, limit)
+            curr = np.where(np.abs(levels * self.load) > limit,
+                            volt / self.load, levels)
+        for kind, vals in (('VOLT', volt), ('CURR', curr)):
+            if kind != out and kind in self.funcs:
+                rng = (quantize_range(kind, np.max(np.abs(vals)))
+                       if self.get(f'SENS:{kind}:RANG:AUTO') == '1'
+                       else self.getf(f'SENS:{kind}:RANG'))
+                sigma = (reading_noise(rng, self.getf(f'SENS:{kind}:NPLC'))
+                         / np.sqrt(self.filter_count()))
+                vals += self.rng.normal(0, sigma, vals.shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            res = np.where(curr != 0, volt / curr, 9.91e37)
+        return np.column_stack((volt, curr, res, stamps - self.stamp_zero,
+                                np.zeros_like(stamps)))
+
+    def advance(self):
+        """Store the readings the running trigger model has finished."""
+        if self.run is None:
+            return
+        run = self.run
+        done = int(np.searchsorted(run['times'], self.now(), 'right'))
+        if done > run['done']:
+            new = slice(run['done'], done)
+            rows = self.measure(run['levels'][new].copy(), run['times'][new],
+                                None if run['steps'] is None
+                                else run['steps'][new])
+            if self.get('TRAC:FEED:CONT') == 'NEXT':
+                room = int(self.getf('TRAC:POIN')) - len(self.buffer)
+                self.buffer = np.vstack((self.buffer, rows[:max(room, 0)]))
+                if len(self.buffer) >= int(self.getf('TRAC:POIN')):
+                    self.settings['TRAC:FEED:CONT'] = 'NEV'
+            run['done'] = done
+        if done >= len(run['times']):
+            self.finish()
+
+    def finish(self):
+        """End the run at completion of the trigger model."""
+        self.run = None
+        if self.get('SOUR:CLE:AUTO') == '1':
+            self.settings['OUTP'] = '0'
+        if self.opc_pending:
+            self.complete()
+
+    def complete(self):
+        """Set operation complete in the event status register."""
+        self.opc_pending = False
+        self.esr |= 1
+
+    def wait(self):
+        """Block until the running trigger model completes."""
+        if self.run is not None:
+            self.spend(self.run['times'][-1] - self.now())
+            self.advance()
+
+    def abort(self):
+        """Stop the trigger model, keeping readings already taken."""
+        self.advance()
+        if self.run is not None:
+            self.finish()
+
+    def filter_count(self, repeating: bool = False):
+        """Return how many conversions the averaging filter averages.
+
+        If repeating is True, count only a repeating filter, the one that
+        takes fresh conversions for every reading.
+        """
+        if self.get('SENS:AVER') != '1' or (
+                repeating and self.get('SENS:AVER:TCON') != 'REP'):
+            return 1
+        return int(self.getf('SENS:AVER:COUN'))
+
+    def statistic(self):
+        """Return the CALC3:FORM statistic of the buffered readings.
+
+        There is one value for each of VOLT, CURR and RES in FORM:ELEM.
+        """
+        chosen = [x for x in self.get('FORM:ELEM').split(',')
+                  if x in ('VOLT', 'CURR', 'RES')]
+        if len(self.buffer) < 2 or not chosen:
+            self.error(-230, 'Data corrupt or stale')
+            return ''
+        func = statistics[self.get('CALC3:FORM')]
+        cols = [elements.index(x) for x in chosen]
+        return self.format_data(func(self.buffer[:, cols], axis=0))
+
+    def buffer_data(self):
+        """Return the buffer in the selected FORM:ELEM and FORM:DATA."""
+        chosen = self.get('FORM:ELEM').split(',')
+        cols = [elements.index(x) for x in chosen]
+        return self.format_data(self.buffer[:, cols].ravel())
+
+    def format_data(self, data: np.ndarray):
+        """Format values for a data query in the selected FORM:DATA."""
+        fmt = self.get('FORM:DATA')
+        if fmt == 'ASC':
+            return ','.join(format_number(x) for x in data)
+        order = '<' if self.get('FORM:BORD') == 'SWAP' else '>'
+        dtype = order + ('f4' if fmt == 'SREAL' else 'f8')
+        return b'#0' + data.astype(dtype).tobytes()
+
+
+def split_message(message: str):
+    """Split a message on semicolons outside quotes and block data."""
+    parts = []
+    quoted = False
+    current = ''
+    for char in message.strip():
+        if char in '"\'':
+            quoted = not quoted
+        if char == ';' and not quoted:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    parts.append(current)
+    return [x for x in (y.strip() for y in parts) if x]
+
+
+class ResourceManager:
+    """Stand-in for visa.ResourceManager serving simulated 2400s.
+
+    instruments maps GPIB addresses to Simulated2400 objects; a list of
+    addresses creates a fresh instrument at each one.
+    """
+
+    def __init__(self, instruments: Optional[Union[dict, list]] = None,
+                 realtime: bool = False):
+        if instruments is None:
+            instruments = [25]
+        if type(instruments) is not dict:
+            instruments = {x: Simulated2400(realtime=realtime)
+                           for x in instruments}
+        self.instruments = instruments
+
+    def list_resources(self, query: str = '?*::INSTR'):
+        """List the simulated instruments as GPIB resource names."""
+        return tuple(f'GPIB0::{x}::INSTR' for x in self.instruments)
+
+    def open_resource(self, resource_name: str, **kwargs):
+        """Open a session to a simulated instrument."""
+        address = int(resource_name.split('::')[1])
+        inst = self.instruments[address]
+        inst.resource_name = resource_name
+        for key, val in kwargs.items():
+            setattr(inst, key, val)
+        return inst
+
+    def close(self):
+        """Close the resource manager."""
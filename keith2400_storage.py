@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+keith2400_storage writes and reads the data files of keith2400_logic.
+
+DataWriter appends readings to a delimited text file as they arrive instead
+of formatting the whole run at the end, so a crash loses at most the last
+flush interval and memory does not grow with the length of the run.  Files
+ending in .gz or .xz are compressed on the fly.
+
+Files ending in .col use a binary columnar format instead: the magic bytes
+K2400COL, a little-endian uint32 header length, a JSON header (column names,
+units, row count and instrument settings) padded to 8 bytes, then each
+column in turn as little-endian float64.  ColumnFile memory-maps such a
+file, so a column or a time range is read without loading the rest.
+
+Either writer can also build a summary pyramid next to the data file: the
+min, max and mean of every column over blocks of 10, 100 and 1000 readings.
+Each level is a file of little-endian float64 blocks (min, max and mean
+rows of every column) named after the data file plus .sum.<level>, and
+blocks are appended as soon as they are complete, so nothing accumulates
+in memory and a crash keeps everything up to the last flush.  A small JSON
+file, the data file name plus .sum, holds the column names, levels and row
+count.  Summary memory-maps the levels to plot a zoomed-out view or to find
+a time range in a long log.
+
+classes_
+    DataWriter(str, opt str, opt str, opt float, opt bool, opt bool,
+               opt tuple)
+    ColumnFile(str)
+    SummaryBuilder(str, opt list, opt tuple, opt bool)
+    Summary(str)
+
+methods_
+    open_file(str, opt str)
+    is_columnar(str)
+    write_columns(str, array, list, opt dict, opt tuple)
+    summary_name(str)
+
+@author: Sarh Friedensen
+"""
+
+import fnmatch
+import gzip
+import io
+import json
+import lzma
+import os
+import struct
+import time
+import numpy as np
+from typing import Optional
+
+codecs = {'.gz': gzip.GzipFile, '.xz': lzma.LZMAFile}  # By file extension
+magic = b'K2400COL'
+levels = (10, 100, 1000)  # Readings per block at each summary level
+units = {'VOLT': 'V', 'CURR': 'A', 'RES': 'ohm', 'TIME': 's', 'STAT': ''}
+
+
+def open_file(name: str, mode: str = 'r'):
+    """Open a data file as text, decompressing .gz and .xz files."""
+    codec = codecs.get(os.path.splitext(name)[1].lower())
+    if codec is None:
+        return open(name, mode)
+    return io.TextIOWrapper(codec(name, mode.replace('t', '') + 'b'))
+
+
+class DataWriter:
+    """Append readings to a data file, flushing to disk every interval.
+
+    header is written first unless append is True.  Set fsync to False to
+    leave syncing to the operating system (faster on slow disks, but an OS
+    crash may lose what the flush handed over).  gzip streams are
+    sync-flushed, so everything written before the last flush can be
+    recovered from a truncated file; xz only at close().  If levels is given,
+    a summary of what is written is kept next to the file as it goes.
+    """
+
+    def __init__(self, name: str, header: str = '', delim: str = '\t',
+                 interval: float = 1.0, fsync: bool = True,
+                 append: bool = False, levels: tuple = ()):
+        self.name = name
+        self.delim = delim
+        self.interval = interval
+        self.fsync = fsync
+        self.rows = 0
+        self.summary = (SummaryBuilder(summary_name(name), levels=levels,
+                                       append=append) if levels else None)
+        self.raw = open(name, 'ab' if append else 'wb')
+        codec = codecs.get(os.path.splitext(name)[1].lower())
+        self.stream = (self.raw if codec is None
+                       else codec(fileobj=self.raw, mode='wb')
+                       if codec is gzip.GzipFile else codec(self.raw, 'wb'))
+        self.file = io.TextIOWrapper(self.stream, newline='\n')
+        if header and not append:
+            self.file.write(header + '\n')
+        self.flushed = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, readings):
+        """Append a Readings chunk (or an (n, cols) array) to the file."""
+        array = np.asarray(getattr(readings, 'array', readings))
+        if array.size:
+            np.savetxt(self.file, array, fmt='%+.6E', delimiter=self.delim)
+            self.rows += len(array)
+            if self.summary is not None:
+                self.summary.names = getattr(readings, 'names',
+                                             self.summary.names)
+                self.summary.add(array)
+        if time.monotonic() - self.flushed >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """Push everything written so far to disk."""
+        self.file.flush()
+        if self.stream is not self.raw and isinstance(self.stream,
+                                                      gzip.GzipFile):
+            self.stream.flush()  # Z_SYNC_FLUSH, so the tail is readable
+        self.raw.flush()
+        if self.fsync:
+            os.fsync(self.raw.fileno())
+        if self.summary is not None:
+            self.summary.flush()
+        self.flushed = time.monotonic()
+
+    def close(self):
+        """Flush and close the file."""
+        if self.raw.closed:
+            return
+        self.flush()
+        self.file.close()
+        if not self.raw.closed:
+            self.raw.close()
+        if self.summary is not None:
+            self.summary.close()
+
+
+def is_columnar(name: str):
+    """Return whether name is a binary columnar (.col) file name."""
+    return os.path.splitext(name)[1].lower() == '.col'
+
+
+def write_columns(name: str, array: np.ndarray, names: list,
+                  settings: Optional[dict] = None, levels: tuple = ()):
+    """Write an (n, cols) array as a binary columnar file.
+
+    names are the FORM:ELEM names of the columns; settings should be plain
+    values, anything else is stored as its string.  If levels is given, a
+    summary is saved next to the file.
+    """
+    array = np.asarray(getattr(array, 'array', array), dtype='<f8')
+    header = {'version': 1, 'rows': len(array), 'columns': list(names),
+              'units': [units.get(x, '') for x in names],
+              'settings': settings or {}}
+    text = json.dumps(header, default=str).encode()
+    text += b' ' * (-(len(magic) + 4 + len(text)) % 8)
+    with open(name, 'wb') as file:
+        file.write(magic + struct.pack('<I', len(text)) + text)
+        for j in range(array.shape[1]):
+            file.write(np.ascontiguousarray(array[:, j]).tobytes())
+    if levels:
+        summary = SummaryBuilder(summary_name(name), names, levels)
+        summary.add(array)
+        summary.close()
+
+
+class ColumnFile:
+    """Memory-mapped view of a binary columnar file.
+
+    array is a (cols, rows) float64 memmap; nothing is read from disk until
+    it is sliced.
+    """
+
+    def __init__(self, name: str):
+        with open(name, 'rb') as file:
+            if file.read(len(magic)) != magic:
+                raise ValueError(f'{name} is not a columnar data file.')
+            (size,) = struct.unpack('<I', file.read(4))
+            header = json.loads(file.read(size))
+        self.name = name
+        self.names = header['columns']
+        self.units = header['units']
+        self.settings = header['settings']
+        self.rows = header['rows']
+        if self.rows == 0:
+            self.array = np.empty((len(self.names), 0))
+        else:
+            self.array = np.memmap(name, dtype='<f8', mode='r',
+                                   offset=len(magic) + 4 + size,
+                                   shape=(len(self.names), self.rows))
+
+    def column(self, name: str):
+        """Return the column whose name matches name (wildcards allowed)."""
+        for j, x in enumerate(self.names):
+            if fnmatch.fnmatchcase(x.upper(), name.upper()):
+                return self.array[j]
+        raise KeyError(f'No column matching {name}.')
+
+    def time_range(self, start: float, stop: float, time: str = 'TIME'):
+        """Return the rows with start <= time < stop as an (n, cols) array.
+
+        The time column must be increasing, as it is in the 2400's buffer.
+        """
+        stamps = self.column(time)
+        first = int(np.searchsorted(stamps, start, 'left'))
+        last = int(np.searchsorted(stamps, stop, 'left'))
+        return np.array(self.array[:, first:last].T)
+
+
+def summary_name(name: str):
+    """Return the name of the summary header kept next to a data file."""
+    return name + '.sum'
+
+
+class SummaryBuilder:
+    """Build min/max/mean summaries of readings, chunk by chunk, on disk.
+
+    Only the readings of each level's unfinished block are kept between
+    chunks, so every block summary is exact however the chunks fall.
+    Finished blocks go straight to the level files; flush() pushes them to
+    disk and rewrites the header.  With append, blocks are added after
+    those already saved, starting a new block where the last one ended.
+    """
+
+    def __init__(self, name: str, names: Optional[list] = None,
+                 levels: tuple = levels, append: bool = False):
+        self.name = name
+        self.names = list(names or [])
+        self.levels = tuple(levels)
+        self.rows = 0
+        self.cols = None
+        if append and os.path.exists(name):
+            with open(name) as file:
+                header = json.load(file)
+            self.rows = header['rows']
+            self.cols = header['cols']
+        self.mode = 'ab' if append else 'wb'
+        self.pending = {x: None for x in self.levels}
+        self.files = {}
+
+    def add(self, array: np.ndarray):
+        """Add an (n, cols) chunk of readings."""
+        array = np.asarray(array, dtype=float)
+        if not self.files:
+            self.cols = array.shape[1]
+            self.files = {x: open(f'{self.name}.{x}', self.mode)
+                          for x in self.levels}
+        self.rows += len(array)
+        for level in self.levels:
+            if self.pending[level] is not None:
+                array_ = np.vstack((self.pending[level], array))
+            else:
+                array_ = array
+            full = len(array_) // level * level
+            if full:
+                blocks = array_[:full].reshape(-1, level, array_.shape[1])
+                self.write(level, blocks.min(1), blocks.max(1),
+                           blocks.mean(1))
+            self.pending[level] = array_[full:]
+
+    def write(self, level: int, mins, maxs, means):
+        """Append (blocks, cols) min, max and mean arrays to a level file."""
+        np.stack((mins, maxs, means), 1).astype('<f8').tofile(
+            self.files[level])
+
+    def flush(self):
+        """Push the finished blocks to disk and update the header."""
+        for file in self.files.values():
+            file.flush()
+        header = {'version': 1, 'names': self.names, 'cols': self.cols,
+                  'levels': list(self.levels), 'rows': self.rows}
+        with open(self.name + '.tmp', 'w') as file:
+            json.dump(header, file)
+        os.replace(self.name + '.tmp', self.name)
+
+    def close(self):
+        """Summarize each trailing partial block and close the files."""
+        for level, rest in self.pending.items():
+            if rest is not None and len(rest):
+                self.write(level, rest.min(0, keepdims=True),
+                           rest.max(0, keepdims=True),
+                           rest.mean(0, keepdims=True))
+            self.pending[level] = None
+        self.flush()
+        for file in self.files.values():
+            file.close()
+
+
+class Summary:
+    """Read the summary pyramid saved next to a data file.
+
+    Each level file is memory-mapped when it is first used, so only the
+    blocks looked at are read from disk.
+    """
+
+    def __init__(self, name: str):
+        if not name.endswith('.sum'):
+            name = summary_name(name)
+        with open(name) as file:
+            header = json.load(file)
+        self.name = name
+        self.names = header['names']
+        self.cols = header['cols'] or len(self.names)
+        self.rows = header['rows']
+        self.levels = tuple(sorted(header['levels']))
+        self.pyramid = {}
+
+    def level(self, level: int):
+        """Return the (min, max, mean) arrays of one level, one row a block.
+        """
+        if level not in self.pyramid:
+            name = f'{self.name}.{level}'
+            size = os.path.getsize(name) if os.path.exists(name) else 0
+            blocks = size // (3 * self.cols * 8) if self.cols else 0
+            self.pyramid[level] = (
+                np.memmap(name, dtype='<f8', mode='r',
+                          shape=(blocks, 3, self.cols)) if blocks
+                else np.empty((0, 3, self.cols or 0)))
+        return tuple(self.pyramid[level][:, x] for x in range(3))
+
+    def column_index(self, name: str):
+        """Return the index of the column matching name (wildcards allowed).
+        """
+        for j, x in enumerate(self.names):
+            if fnmatch.fnmatchcase(x.upper(), name.upper()):
+                return j
+        raise KeyError(f'No column matching {name}.')
+
+    def time_range(self, start: float, stop: float, points: int = 1000,
+                   time: str = 'TIME'):
+        """Summarize start <= time < stop in at most about points blocks.
+
+        Picks the finest level that covers the range in no more than points
+        blocks (else the coarsest), and returns that level and its min, max
+        and mean arrays over the blocks touching the range.  Levels are read
+        coarsest first, so finer ones are only loaded when needed.  The
+        readings themselves are ColumnFile.time_range() or load_data() away.
+        """
+        j = self.column_index(time)
+        found = None
+        for level in reversed(self.levels):
+            (mins, maxs, means) = self.level(level)
+            first = int(np.searchsorted(maxs[:, j], start, 'left'))
+            last = int(np.searchsorted(mins[:, j], stop, 'left'))
+            if found is not None and last - first > points:
+                break
+            found = (level, mins[first:last], maxs[first:last],
+                     means[first:last])
+        return found
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures for the tests: a Keithley2400 talking to a simulated 2400.
+
+@author: Sarh Friedensen
+"""
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import keith2400_logic as k  # noqa: E402
+import keith2400_sim as sim  # noqa: E402
+
+
+def configure(inst: k.Keithley2400, points: int = 20):
+    """Set up a 1 kohm IV measurement: source 0.05 V, measure current."""
+    inst.set_gpib(inst.address)
+    inst.set_output_type('volt')
+    inst.set_output_range(2)
+    inst.set_output_val(0.05)
+    inst.set_measure_type('curr')
+    inst.set_delay(0.0)
+    inst.set_compliance(0.1)
+    inst.set_measure_range(0.1)
+    inst.set_measure_speed(0.01)
+    inst.set_num_points(points)
+    inst.set_format('real')
+    return inst
+
+
+@pytest.fixture
+def manager():
+    """A simulated resource manager with 2400s at addresses 25 and 26."""
+    manager = sim.ResourceManager([25, 26])
+    k.set_backend('sim', manager)
+    yield manager
+    k.set_backend('sim', None)
+
+
+@pytest.fixture
+def inst(manager, tmp_path):
+    """A configured Keithley2400 at address 25 saving into tmp_path."""
+    inst = configure(k.Keithley2400(25))
+    inst.filename = str(tmp_path / 'data.txt')
+    return inst
+
+
+@pytest.fixture
+def device(inst, manager):
+    """The simulated instrument behind inst."""
+    return manager.instruments[25]
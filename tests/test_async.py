@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of keith2400_async against the simulated 2400.
+
+@author: Sarh Friedensen
+"""
+
+import asyncio
+import keith2400_async as ka
+from conftest import configure
+import keith2400_logic as k
+
+
+def test_instruments_run_concurrently(manager, tmp_path):
+    insts = []
+    for address in (25, 26):
+        inst = configure(k.Keithley2400(address), 30)
+        inst.filename = str(tmp_path / f'{address}.txt')
+        insts.append(ka.AsyncKeithley2400(inst))
+
+    async def run():
+        return await asyncio.gather(*(x.start(interval=0.001)
+                                      for x in insts))
+    results = asyncio.run(run())
+    assert [len(x.array) for x in results] == [30, 30]
+    assert k.load_data(str(tmp_path / '26.txt')).array.shape == (30, 3)
+
+
+def test_query_waits_for_the_bus(inst):
+    ainst = ka.AsyncKeithley2400(inst)
+
+    async def run():
+        with inst.bus:  # Held here, so the executor thread has to wait
+            task = asyncio.ensure_future(ainst.query(':TRAC:POIN:ACT?'))
+            await asyncio.sleep(0.05)
+            assert not task.done()
+        return await task
+    assert int(float(asyncio.run(run()))) == 0
+
+
+def test_abandoned_async_stream_turns_output_off(inst, device):
+    inst.set_num_points(500)
+    ainst = ka.AsyncKeithley2400(inst)
+
+    async def run():
+        chunks = ainst.stream(interval=0.001)
+        await chunks.__anext__()
+        assert device.get('OUTP') == '1'
+        await chunks.aclose()
+    asyncio.run(run())
+    assert device.get('OUTP') == '0'
+    assert not inst.waiting
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+Smoke test of keith2400_bench on the simulated 2400.
+
+@author: Sarh Friedensen
+"""
+
+import json
+import keith2400_bench as kb
+
+
+def test_benchmarks_run_and_compare(manager, tmp_path):
+    output = str(tmp_path / 'bench.json')
+    assert kb.main(['--repeat', '1', '--points', '10',
+                    '--output', output]) == 0
+    with open(output) as file:
+        report = json.load(file)
+    assert report['results']['start_real_10']['bus']['writes'] > 0
+    assert report['results']['start_real_10']['modeled_median'] > 0
+    assert report['results']['match_1000']['modeled_median'] is None
+    assert report['meta']['backend'] == 'sim'
+    assert kb.compare(report, report) == {}
@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of keith2400_logic against the simulated 2400.
+
+@author: Sarh Friedensen
+"""
+
+import threading
+import time
+import numpy as np
+import pytest
+import keith2400_logic as k
+import keith2400_storage as ks
+from conftest import configure
+
+
+def test_process_data_text_and_binary_agree():
+    flat = np.arange(12, dtype=float)
+    text = ','.join(f'{x:+.6E}' for x in flat)
+    names = ['VOLT', 'CURR', 'TIME']
+    from_text = k.process_data(text, 3, names=names)
+    from_array = k.process_data(flat, 3, names=names)
+    assert from_text.array.shape == (4, 3)
+    np.testing.assert_array_equal(from_text.array, from_array.array)
+    np.testing.assert_array_equal(from_array.column('CURR'), [1, 4, 7, 10])
+
+
+def test_process_data_drops_partial_row():
+    readings = k.process_data(np.arange(7.0), 3)
+    assert readings.array.shape == (2, 3)
+    assert readings.names == ()
+
+
+def test_readings_default_names_are_immutable():
+    readings = k.Readings(np.zeros((1, 1)))
+    assert type(readings.names) is tuple
+    with pytest.raises(KeyError):
+        readings.column('VOLT')
+
+
+@pytest.mark.parametrize('fmt', ['ascii', 'sreal', 'real'])
+def test_start_reads_every_point(inst, fmt):
+    inst.set_format(fmt)
+    inst.start()
+    assert inst.data.array.shape == (20, 3)
+    assert list(inst.data.names) == ['VOLT', 'CURR', 'TIME']
+    np.testing.assert_allclose(inst.data.column('VOLT'), 0.05, atol=1e-3)
+    np.testing.assert_allclose(inst.data.column('CURR'), 5e-5, atol=3e-5)
+
+
+def test_saved_file_loads_back(inst):
+    inst.start()
+    loaded = k.load_data(inst.filename)
+    np.testing.assert_allclose(loaded.array, inst.data.array, rtol=1e-6)
+
+
+def test_transaction_matches_unbatched_setters(inst, device):
+    before = device.stats['writes']
+    with inst.transaction():
+        inst.set_output_val(0.5)
+        inst.set_compliance(0.01)
+        inst.set_measure_speed(1)
+    assert device.stats['writes'] - before <= 3
+    assert device.get('SOUR:VOLT') == '0.5'
+    assert float(device.get('SENS:CURR:PROT')) == 0.01
+    assert float(inst.meas_speed['CURR']) == 1
+
+
+def test_transaction_stores_what_reads_back(manager):
+    def setup(inst):
+        inst.set_output_range(2)
+        inst.set_output_val(0.5)
+        inst.set_compliance(0.01)
+        inst.set_measure_range(0.02)
+        inst.set_measure_speed(1)
+        inst.set_delay(0.001)
+        inst.set_num_points(10)
+
+    plain = configure(k.Keithley2400(25))
+    setup(plain)
+    batched = configure(k.Keithley2400(26))
+    with batched.transaction():
+        setup(batched)
+    assert batched.out_rng['VOLT'] == plain.out_rng['VOLT'] != 2
+    assert batched.meas_rng['CURR'] == plain.meas_rng['CURR']
+    for name in ('out_val', 'compl', 'meas_speed', 'delay', 'num_points',
+                 'format_', 'sweep_params'):
+        assert getattr(batched, name) == getattr(plain, name)
+
+
+def test_transaction_requeries_when_a_reply_is_missing(inst, device,
+                                                       monkeypatch):
+    answer = device.answer
+    dropped = []
+
+    def drop(head, value=''):
+        if head == 'SOUR:DEL' and not dropped:
+            dropped.append(head)
+            return None  # As if the query failed and sent nothing
+        return answer(head, value)
+    monkeypatch.setattr(device, 'answer', drop)
+    with inst.transaction():
+        inst.set_delay(0.01)
+        inst.set_compliance(0.05)
+    assert dropped
+    assert float(inst.delay) == 0.01
+    assert float(inst.compl['VOLT']) == 0.05
+
+def test_shadow_skips_repeated_settings(inst, device):
+    before = device.stats['writes']
+    inst.set_output_val(0.05)
+    inst.set_measure_speed(0.01)
+    assert device.stats['writes'] == before
+    inst.invalidate_shadow()
+    inst.set_measure_speed(0.01)
+    assert device.stats['writes'] > before
+
+
+def test_shadow_shares_nplc_between_functions(inst, device):
+    inst.set_measure_speed(1)
+    inst.set_measure_type('volt')
+    inst.set_measure_speed(0.01)
+    inst.set_measure_type('curr')
+    inst.set_measure_speed(1)
+    assert float(device.get('SENS:CURR:NPLC')) == 1
+    inst.write_visa(':SENS:VOLT:NPLC 0.1', ':SENS:VOLT:NPLC?')
+    before = device.stats['writes']
+    inst.set_measure_speed(1)
+    assert device.stats['writes'] > before
+    assert float(device.get('SENS:CURR:NPLC')) == 1
+
+
+def test_stream_yields_every_reading(inst):
+    inst.set_num_points(200)
+    chunks = list(inst.stream(interval=0.001))
+    assert sum(len(x.array) for x in chunks) == 200
+    np.testing.assert_array_equal(np.vstack([x.array for x in chunks]),
+                                  inst.data.array)
+
+
+def test_abandoned_stream_turns_output_off(inst, device):
+    inst.set_num_points(500)
+    chunks = inst.stream(interval=0.001)
+    next(chunks)
+    assert device.get('OUTP') == '1'
+    chunks.close()
+    assert device.get('OUTP') == '0'
+    assert not inst.waiting
+
+
+def test_stream_ends_when_run_completes_short(inst, device):
+    inst.set_num_points(50)
+    device.write(':TRIG:COUN 30')
+    chunks = list(inst.stream(interval=0.001, timeout=5))
+    assert sum(len(x.array) for x in chunks) == 30
+    assert len(inst.data.array) == 30
+
+
+def test_start_with_callback_streams_to_file(inst):
+    inst.set_num_points(100)
+    chunks = []
+    inst.start(callback=chunks.append, interval=0.001)
+    assert sum(len(x.array) for x in chunks) == 100
+    loaded = k.load_data(inst.filename)
+    assert loaded.array.shape == (100, 3)
+
+
+def test_stop_from_another_thread_keeps_readings(manager, tmp_path):
+    manager.instruments[25].realtime = True
+    inst = configure(k.Keithley2400(25), points=2500)
+    inst.set_measure_speed(1)
+    inst.filename = str(tmp_path / 'stopped.txt')
+    timer = threading.Timer(0.3, inst.stop)
+    timer.start()
+    inst.start()
+    timer.join()
+    assert 0 < len(inst.data.array) < 2500
+
+
+@pytest.mark.parametrize('fmt', ['ascii', 'sreal', 'real'])
+def test_stop_reads_buffer_when_idle(inst, device, fmt):
+    inst.set_format(fmt)
+    inst.arm(wait=False)
+    device.wait()
+    data = inst.stop()
+    assert data.array.shape == (20, 3)
+    np.testing.assert_allclose(data.column('VOLT'), 0.05, atol=1e-3)
+
+
+def test_run_parallel_measures_each_instrument(manager, tmp_path):
+    insts = [configure(k.Keithley2400(x), 10) for x in (25, 26)]
+    for x in insts:
+        x.filename = str(tmp_path / f'{x.address}.txt')
+    k.run_parallel(insts, 'start')
+    assert [x.data.array.shape for x in insts] == [(10, 3), (10, 3)]
+
+
+def test_module_functions_act_on_default_instrument(manager):
+    k.instrument.out_type = None
+    k.set_gpib(25)
+    k.set_output_type('curr')
+    assert k.out_type == 'CURR' == k.instrument.out_type
+    assert k.sweep_params is k.instrument.sweep_params
+    assert 'start' in dir(k)
+    with pytest.raises(AttributeError):
+        k.no_such_setting
+
+
+def test_module_settings_reach_default_instrument(manager):
+    saved = (k.instrument.filename, k.instrument.out_type)
+    try:
+        k.filename = 'mine.txt'
+        k.out_type = 'CURR'
+        assert k.instrument.filename == k.filename == 'mine.txt'
+        assert k.instrument.out_type == k.out_type == 'CURR'
+        assert 'filename' not in vars(k)
+    finally:
+        (k.instrument.filename, k.instrument.out_type) = saved
+    k.batch_max_len = k.batch_max_len  # Module globals stay on the module
+    assert 'batch_max_len' in vars(k)
+
+
+def test_log_continuous_past_the_buffer(inst, tmp_path):
+    inst.set_num_points(500)
+    chunks = []
+    (count, gaps) = inst.log_continuous(total=1200, callback=chunks.append)
+    assert count == 1200
+    assert [len(x.array) for x in chunks] == [500, 500, 200]
+    stamps = np.concatenate([x.column('TIME') for x in chunks])
+    assert np.all(np.diff(stamps) > 0)
+
+
+@pytest.mark.filterwarnings('error')
+def test_log_continuous_single_reading_tail(inst):
+    inst.set_num_points(500)
+    (count, _) = inst.log_continuous(total=1001, callback=lambda x: None)
+    assert count == 1001
+
+
+def test_log_continuous_leaves_file_alone_if_not_armed(inst):
+    with open(inst.filename, 'w') as file:
+        file.write('earlier run\n')
+    inst.start(save=False)  # Leaves the buffer full, so arm() refuses
+    assert inst.log_continuous(total=10) == (0, [])
+    with open(inst.filename) as file:
+        assert file.read() == 'earlier run\n'
+
+
+def test_log_continuous_to_file(inst):
+    inst.set_num_points(300)
+    (count, _) = inst.log_continuous(total=700)
+    assert k.load_data(inst.filename).array.shape == (700, 3)
+
+
+def test_run_jobs_applies_each_job(inst, tmp_path):
+    jobs = [k.Job(str(tmp_path / 'a.txt'), out_val=0.02, num_points=5),
+            k.Job(str(tmp_path / 'b.txt'), out_val=0.04, num_points=8)]
+    results = k.run_jobs(jobs, inst)
+    assert [len(x.array) for x in results] == [5, 8]
+    np.testing.assert_allclose(results[1].column('VOLT'), 0.04, atol=1e-3)
+    assert k.load_data(jobs[0].filename).array.shape == (5, 3)
+
+
+def test_run_jobs_saves_each_jobs_settings(inst, tmp_path, monkeypatch):
+    write_columns = ks.write_columns
+
+    def slow_write(*args, **kwargs):
+        time.sleep(0.2)  # Still saving while the next job is set up
+        return write_columns(*args, **kwargs)
+    monkeypatch.setattr(ks, 'write_columns', slow_write)
+    jobs = [k.Job(str(tmp_path / 'a.col'), out_val=0.02, num_points=5),
+            k.Job(str(tmp_path / 'b.col'), out_val=0.04, num_points=5)]
+    k.run_jobs(jobs, inst)
+    settings = ks.ColumnFile(jobs[0].filename).settings
+    assert float(settings['out_val']['VOLT']) == 0.02
+
+
+def test_sequence_runs_each_step(inst):
+    steps = [k.Step('volt', 0.01, compl=0.1), k.Step('volt', 0.03),
+             k.Step('volt', 0.05)]
+    inst.load_sequence(steps, repeat=2)
+    inst.start(save=False)
+    np.testing.assert_allclose(inst.data.column('VOLT'),
+                               [0.01, 0.03, 0.05] * 2, atol=1e-3)
+
+
+def test_compile_sequence_limits():
+    with pytest.raises(ValueError):
+        k.compile_sequence([])
+    with pytest.raises(ValueError):
+        k.compile_sequence([k.Step('volt', 0)] * 2, repeat=1300)
+
+
+def test_list_messages_split_long_lists():
+    messages = k.list_messages(np.arange(250), 'VOLT')
+    assert len(messages) == 3
+    assert messages[0].startswith(':SOUR:LIST:VOLT 0,')
+    assert all(x.startswith(':SOUR:LIST:VOLT:APP ') for x in messages[1:])
+
+
+def test_run_waveform_longer_than_buffer(inst):
+    values = 0.05 * np.sin(np.linspace(0, 4 * np.pi, 3000))
+    (data, starts) = inst.run_waveform(values)
+    assert starts == [0, 2500]
+    np.testing.assert_allclose(data.column('VOLT'), values, atol=1e-3)
+
+
+def test_run_waveform_rejects_bad_values(inst):
+    assert inst.run_waveform([]) is None
+    assert inst.run_waveform([0, 300]) is None
+    assert inst.run_waveform([0, np.nan]) is None
+
+
+def test_run_waveform_restores_sweep_params(inst):
+    saved = (dict(inst.sweep_params), inst.num_points)
+    inst.run_waveform(np.linspace(0, 0.05, 30))
+    assert (inst.sweep_params, inst.num_points) == saved
+
+
+def test_run_waveform_continues_restarted_stamps(inst, device):
+    device.realtime = True  # So host and instrument clocks agree
+    write = device.write
+
+    def restart_stamps(message):
+        if 'TRAC:CLE' in message.upper():  # As the 2400's ABS stamps do
+            device.stamp_zero = device.now()
+        return write(message)
+    device.write = restart_stamps
+    (data, starts) = inst.run_waveform(np.zeros(3000))
+    assert np.all(np.diff(data.column('TIME')) > 0)
+
+
+def test_batched_list_predicts_appended_values(inst):
+    values = list(np.linspace(0, 0.05, 250))
+    with inst.transaction():
+        inst.set_sweep_output(True, 'VOLT', write=True)
+        inst.set_sweep_type('list', write=True)
+        inst.set_sweep_list(values, write=True)
+        assert len(inst.sweep_params['List'].split(',')) == 250
+    np.testing.assert_allclose(
+        np.array(inst.sweep_params['List'].split(','), dtype=float), values,
+        rtol=1e-6)
+    assert int(inst.sweep_params['Points']) == 250
+
+
+def test_refine_points_picks_the_step():
+    x = np.linspace(0, 1, 11)
+    y = (x > 0.45).astype(float)
+    new = k.refine_points(x, y, 0.1)
+    assert 0.45 in new
+    assert np.all(np.abs(new - 0.45) < 0.15)
+
+
+def test_refine_points_ranks_the_steepest_first():
+    x = np.linspace(0, 1, 11)
+    y = np.where(x > 0.45, 1.0, 0.0) + np.where(x > 0.75, 0.2, 0.0)
+    new = k.refine_points(x, y, 0.1)
+    assert new[0] == pytest.approx(0.45)
+    assert 0.75 in np.round(new, 6)
+
+
+def test_adaptive_sweep_keeps_to_max_points(inst):
+    assert inst.adaptive_sweep(0, 0.05, points=30, max_points=20) is None
+    data = inst.adaptive_sweep(0, 0.05, points=20, max_points=20)
+    assert len(data.array) == 20
+    data = inst.adaptive_sweep(0, 0.05, points=6, max_points=9, passes=4)
+    assert len(data.array) <= 9
+
+
+def test_adaptive_sweep_is_sorted_by_level(inst):
+    data = inst.adaptive_sweep(0, 0.05, points=6, passes=3)
+    levels = data.column('VOLT')
+    assert len(levels) >= 6
+    assert np.all(np.diff(levels) >= 0)
+
+
+def test_cycle_sweep_splits_cycles(inst):
+    cycles = inst.cycle_sweep(0, 0.05, 6, cycles=3, save=False)
+    assert len(cycles) == 3
+    (up, down) = cycles[1]
+    np.testing.assert_allclose(up.column('VOLT'), np.linspace(0, 0.05, 6),
+                               atol=1e-3)
+    np.testing.assert_allclose(down.column('VOLT'),
+                               np.linspace(0.05, 0, 6), atol=1e-3)
+
+
+def test_sweep_params_after_load_cycles_do_not_prompt(inst, device,
+                                                      monkeypatch):
+    def refuse(prompt=''):
+        raise AssertionError(f'prompted: {prompt}')
+    monkeypatch.setattr('builtins.input', refuse)
+    inst.load_cycles(0, 0.05, 6, cycles=3)
+    inst.set_sweep(useparams=True)  # As set_all_to_globals() does
+    levels = np.fromstring(device.get('SOUR:LIST:VOLT'), sep=',')
+    np.testing.assert_allclose(levels, k.cycle_levels(0, 0.05, 6))
+    assert int(inst.num_points) == 12
+
+def test_fast_mode_restores_settings(inst, device):
+    saved = {x: device.get(x) for x in ('SYST:AZER', 'DISP:ENAB',
+                                        'SENS:CURR:NPLC')}
+    rate = inst.fast_start(save=False)
+    inst.clear_buffer()
+    inst.start(save=False)
+    slow = k.reading_rate(inst.data)
+    assert rate > slow
+    assert {x: device.get(x) for x in saved} == saved
+
+
+def test_start_stats_match_readings(inst):
+    stats = inst.start_stats()
+    inst.fetch_data(len(inst.format_))
+    currents = inst.data.column('CURR')
+    assert stats['CURR']['MEAN'] == pytest.approx(currents.mean(), rel=1e-5)
+    assert stats['CURR']['MAX'] == pytest.approx(currents.max(), rel=1e-5)
+
+
+def test_start_stats_restores_averaging(inst, device):
+    device.write(':SENS:AVER:TCON MOV; :SENS:AVER:COUN 5; :SENS:AVER ON')
+    assert inst.start_stats(average=10) is not None
+    assert [device.get(x) for x in ('SENS:AVER:TCON', 'SENS:AVER:COUN',
+                                    'SENS:AVER')] == ['MOV', '5', '1']
+
+
+def test_start_stats_turns_output_off_on_error(inst, device, monkeypatch):
+    def fail(interval):
+        raise RuntimeError('bus error')
+    monkeypatch.setattr(inst, 'wait_complete', fail)
+    with pytest.raises(RuntimeError):
+        inst.start_stats(average=4)
+    assert device.get('OUTP') == '0'
+    assert device.get('SENS:AVER') == '0'
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of keith2400_metrics.
+
+@author: Sarh Friedensen
+"""
+
+import csv
+import json
+import keith2400_metrics as km
+
+
+def test_record_and_report(tmp_path):
+    metrics = km.BusMetrics()
+    seen = []
+    metrics.add_hook(lambda *x: seen.append(x))
+    metrics.record('query', 'SOUR:VOLT', 2e-3, 20)
+    metrics.record('query', 'SOUR:VOLT', 4e-3, 20)
+    with metrics.timed('setup'):
+        pass
+    rows = {(x['kind'], x['name']): x for x in metrics.report()}
+    assert rows[('query', 'SOUR:VOLT')]['count'] == 2
+    assert rows[('query', 'SOUR:VOLT')]['bytes'] == 40
+    assert abs(rows[('query', 'SOUR:VOLT')]['mean'] - 3e-3) < 1e-12
+    assert ('operation', 'setup') in rows
+    assert len(seen) == 3
+    (counts, edges) = metrics.histogram('query', 'SOUR:VOLT')
+    assert counts.sum() == 2 and len(counts) == len(edges) + 1
+    metrics.to_json(str(tmp_path / 'bus.json'))
+    metrics.to_csv(str(tmp_path / 'bus.csv'))
+    with open(tmp_path / 'bus.json') as file:
+        assert len(json.load(file)['commands']) == 2
+    with open(tmp_path / 'bus.csv') as file:
+        assert len(list(csv.DictReader(file))) == 2
+    metrics.reset()
+    assert metrics.report() == []
+
+
+def test_setters_are_counted(inst):
+    inst.metrics = km.BusMetrics()
+    inst.invalidate_shadow()
+    inst.set_measure_speed(1)
+    names = {x['name'] for x in inst.metrics.report()}
+    assert 'SENS:CURR:NPLC' in names
+
+
+def count(metrics, *kinds):
+    return sum(x['count'] for x in metrics.report() if x['kind'] in kinds)
+
+
+def test_all_bus_traffic_is_counted(inst, device):
+    inst.metrics = km.BusMetrics()
+    before = dict(device.stats)
+    inst.start(save=False)
+    inst.start_stats()
+    inst.log_continuous(total=30, callback=lambda x: None)
+    inst.run_waveform([0, 0.01, 0.02])
+    writes = device.stats['writes'] - before['writes']
+    queries = device.stats['queries'] - before['queries']
+    assert count(inst.metrics, 'write', 'query') == writes
+    assert count(inst.metrics, 'query', 'read', 'poll') == queries
+
+
+def test_buffer_download_bytes_are_counted(inst):
+    inst.metrics = km.BusMetrics()
+    inst.start(save=False)
+    rows = {(x['kind'], x['name']): x for x in inst.metrics.report()}
+    # 20 readings of VOLT, CURR and TIME as 8 byte reals, plus the header
+    assert rows[('read', 'TRAC:DATA?')]['bytes'] >= 20 * 3 * 8
+    assert rows[('poll', '*STB')]['count'] >= 1
+
+
+def test_metrics_follow_the_connection(inst, device):
+    metrics = km.BusMetrics()
+    inst.metrics = metrics
+    inst.check_connected(25)
+    assert isinstance(inst.keith, km.MeteredResource)
+    inst.metrics = None
+    assert inst.keith is not None
+    assert not isinstance(inst.keith, km.MeteredResource)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of keith2400_planner against the simulated 2400.
+
+@author: Sarh Friedensen
+"""
+
+import pytest
+import keith2400_planner as kplan
+
+
+def test_estimate_matches_simulated_run(inst, device):
+    inst.set_num_points(200)
+    predicted = kplan.estimate(inst)
+    start = device.now()
+    inst.start(save=False)
+    assert device.now() - start == pytest.approx(predicted, rel=0.2)
+
+
+def test_plan_meets_noise_target(inst):
+    plan = kplan.plan(1e-7, 60e-6, inst)
+    assert plan.meas_rng == pytest.approx(105e-6)
+    assert plan.noise <= 1e-7
+    kplan.apply_plan(plan, inst)
+    assert float(inst.meas_speed['CURR']) == pytest.approx(plan.meas_speed)
+
+
+def test_plan_out_of_reach(inst):
+    assert kplan.plan(1e-12, 1, inst) is None
+
+
+def test_check_against_measured_run(inst, monkeypatch):
+    monkeypatch.setitem(kplan.model, 'scale', 1.0)
+    inst.set_num_points(50)
+    inst.start(save=False)
+    (predicted, measured, ratio) = kplan.check(inst.data, inst)
+    assert ratio == pytest.approx(1, rel=0.05)
+
+
+def test_check_recalibrates_the_model(inst, monkeypatch):
+    monkeypatch.setitem(kplan.model, 'scale', 2.0)
+    inst.set_num_points(50)
+    inst.start(save=False)
+    (predicted, measured, ratio) = kplan.check(inst.data, inst)
+    assert ratio == pytest.approx(0.5, rel=0.05)
+    assert kplan.point_time(inst) == pytest.approx(measured, rel=0.05)
+    kplan.check(inst.data, inst, calibrate=False)
+    assert kplan.model['scale'] == pytest.approx(2.0 * ratio)
+
+
+def test_point_time_follows_fast_mode(inst, monkeypatch):
+    monkeypatch.setitem(kplan.model, 'scale', 1.0)
+    slow = kplan.point_time(inst)
+    inst.set_num_points(50)
+    with inst.fast_mode():
+        fast = kplan.point_time(inst)
+        inst.start(save=False)
+    measured = kplan.check(inst.data, inst, calibrate=False)[1]
+    assert fast < slow
+    assert fast == pytest.approx(measured, rel=0.05)
+
+
+def test_planner_has_its_own_model():
+    assert not hasattr(kplan, 'sim')
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of keith2400_profiles against the simulated 2400.
+
+@author: Sarh Friedensen
+"""
+
+import os
+import pytest
+import keith2400_profiles as kp
+
+
+def test_recall_uses_setup_memory(inst, device, tmp_path):
+    registry = kp.ProfileRegistry(str(tmp_path / 'profiles.json'))
+    registry.add('low', out_type='VOLT', out_val=0.01, compl=0.1)
+    registry.add('high', out_type='VOLT', out_val=0.04, compl=0.1)
+    assert registry.recall('low', inst) == 2
+    assert registry.recall('high', inst) == 3
+    writes = device.stats['writes']
+    assert registry.recall('low', inst) == 2
+    assert device.stats['writes'] - writes <= 3  # *RCL and set_format()
+    assert float(device.get('SOUR:VOLT')) == 0.01
+    assert float(inst.out_val['VOLT']) == 0.01
+
+
+def test_index_survives_reload(inst, tmp_path):
+    path = str(tmp_path / 'profiles.json')
+    registry = kp.ProfileRegistry(path)
+    registry.add('low', out_type='VOLT', out_val=0.01)
+    registry.recall('low', inst)
+    again = kp.ProfileRegistry(path)
+    assert again.profiles == registry.profiles
+    assert again.slot_of(inst, 'low') == 2
+
+
+def test_least_recently_used_slot_is_reused(inst, tmp_path):
+    registry = kp.ProfileRegistry(str(tmp_path / 'profiles.json'),
+                                  slots=(2, 3))
+    for name, level in (('a', 0.01), ('b', 0.02), ('c', 0.03)):
+        registry.add(name, out_type='VOLT', out_val=level)
+    registry.recall('a', inst)
+    registry.recall('b', inst)
+    assert registry.recall('c', inst) == 2
+    assert registry.slot_of(inst, 'a') is None
+
+
+def test_add_rejects_unknown_settings(tmp_path):
+    registry = kp.ProfileRegistry(str(tmp_path / 'profiles.json'))
+    with pytest.raises(TypeError, match='outval'):
+        registry.add('low', out_type='VOLT', outval=0.01)
+    assert 'low' not in registry.profiles
+
+def test_default_index_is_in_config_dir(inst, tmp_path, monkeypatch):
+    monkeypatch.delenv('APPDATA', raising=False)
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path))
+    monkeypatch.chdir(tmp_path / '..')
+    registry = kp.ProfileRegistry()
+    registry.add('low', out_type='VOLT', out_val=0.01)
+    assert registry.path == str(tmp_path / 'keith2400' / 'profiles.json')
+    assert os.path.exists(registry.path)
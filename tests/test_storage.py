@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of keith2400_storage: text, columnar and summary files.
+
+@author: Sarh Friedensen
+"""
+
+import numpy as np
+import pytest
+import keith2400_logic as k
+import keith2400_storage as ks
+
+
+def readings(rows: int = 2345):
+    """Return rows of made-up VOLT, CURR, TIME readings."""
+    stamps = np.arange(rows) * 1e-3
+    array = np.column_stack((np.sin(stamps), np.cos(stamps), stamps))
+    return k.Readings(array, ['VOLT', 'CURR', 'TIME'])
+
+
+@pytest.mark.parametrize('suffix', ['.txt', '.txt.gz', '.txt.xz'])
+def test_data_writer_round_trip(tmp_path, suffix):
+    name = str(tmp_path / ('data' + suffix))
+    data = readings(500)
+    with ks.DataWriter(name, 'V\tI\tt') as writer:
+        for first in range(0, 500, 128):
+            writer.write(data.array[first:first + 128])
+    loaded = k.load_data(name)
+    np.testing.assert_allclose(loaded.array, data.array, rtol=1e-6)
+
+
+def test_columnar_round_trip(tmp_path):
+    name = str(tmp_path / 'data.col')
+    data = readings()
+    ks.write_columns(name, data, data.names, {'delay': 0.0})
+    columns = ks.ColumnFile(name)
+    assert columns.names == ['VOLT', 'CURR', 'TIME']
+    assert columns.settings == {'delay': 0.0}
+    np.testing.assert_array_equal(columns.array.T, data.array)
+    part = columns.time_range(0.5, 0.6)
+    np.testing.assert_array_equal(part, data.array[500:600])
+
+
+def test_summary_matches_data(tmp_path):
+    name = str(tmp_path / 'data.txt')
+    data = readings()
+    with ks.DataWriter(name, levels=(10, 100)) as writer:
+        for first in range(0, len(data.array), 333):
+            writer.write(data._replace(array=data.array[first:first + 333]))
+    summary = ks.Summary(name)
+    assert summary.rows == len(data.array)
+    assert summary.levels == (10, 100)
+    (mins, maxs, means) = summary.level(10)
+    assert len(mins) == 235
+    blocks = data.array[:2340].reshape(-1, 10, 3)
+    np.testing.assert_allclose(mins[:234], blocks.min(1))
+    np.testing.assert_allclose(maxs[:234], blocks.max(1))
+    np.testing.assert_allclose(means[:234], blocks.mean(1))
+    np.testing.assert_allclose(means[234], data.array[2340:].mean(0))
+    (level, lows, highs, _) = summary.time_range(1.0, 1.2, points=100)
+    assert level == 10
+    assert lows[0, 2] <= 1.0 and highs[-1, 2] >= 1.19
+
+
+def test_summary_is_on_disk_before_close(tmp_path):
+    name = str(tmp_path / 'data.txt')
+    data = readings()
+    writer = ks.DataWriter(name, levels=(10, 100))
+    writer.write(data._replace(array=data.array[:2005]))
+    writer.flush()
+    summary = ks.Summary(name)
+    assert summary.rows == 2005
+    assert len(summary.level(10)[0]) == 200
+    assert len(summary.level(100)[0]) == 20
+    writer.write(data._replace(array=data.array[2005:]))
+    writer.close()
+    assert len(ks.Summary(name).level(10)[0]) == 235
+
+
+def test_columnar_save_keeps_settings(inst, tmp_path):
+    inst.filename = str(tmp_path / 'run.col')
+    inst.start()
+    columns = ks.ColumnFile(str(tmp_path / 'run.col'))
+    assert columns.rows == 20
+    assert columns.settings['out_type'] == 'VOLT'
+    assert ks.Summary(str(tmp_path / 'run.col')).rows == 20